@@ -3,22 +3,26 @@ import os
 import uuid
 import datetime
 import hashlib
+import threading
 import mysql.connector
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                            QLabel, QPushButton, QLineEdit, QComboBox, QTableWidget, 
                            QTableWidgetItem, QTabWidget, QMessageBox, QGroupBox,
                            QFormLayout, QDateEdit, QTextEdit, QCheckBox, QHeaderView,
-                           QSplitter, QDialog, QDialogButtonBox, QSpinBox, QInputDialog)
-from PyQt5.QtCore import Qt, QDate, QDateTime
+                           QSplitter, QDialog, QDialogButtonBox, QSpinBox, QInputDialog, QFileDialog)
+from PyQt5.QtCore import Qt, QDate, QDateTime, QTimer
 from PyQt5.QtGui import QIcon, QFont, QColor, QPalette
 
+import license_db
+
 # Database configuration
 DB_CONFIG = {
     "host": "127.0.0.1",
     "user": "root",
     "password": "ascent",
     "port": 3306,
-    "database": "auto_hekili_licenses"
+    "database": "auto_hekili_licenses",
+    "connection_timeout": 10
 }
 
 # Colors for styling
@@ -30,26 +34,73 @@ PURPLE = "#6A22EF"
 RED = "#E64A19"
 GREEN = "#2E7D32"
 
+# Latency and row counts of every admin query, shown in the status bar
+QUERY_STATS = license_db.QueryStats()
+# Connections kept open for the admin panel; the connector pings them when borrowed
+ADMIN_POOL_SIZE = 3
+_pool = None
+_batch = threading.local()
+
+def admin_pool():
+    """The admin panel's connection pool, created on first use."""
+    global _pool
+    if _pool is None:
+        _pool = license_db.ConnectionPool(ADMIN_POOL_SIZE, name="auto_hekili_admin", **DB_CONFIG)
+    return _pool
+
 class DBConnection:
-    """Database connection manager with context support."""
+    """Database connection manager with context support.
+    
+    Borrows a connection from the admin pool and commits (or rolls back) when the
+    block exits. Inside a DBTransaction the block joins that transaction instead.
+    Statements run through the returned cursor are timed into QUERY_STATS.
+    """
     
     def __init__(self):
         self.conn = None
         self.cursor = None
+        self.borrowed = None
+        self.joined = False
     
     def __enter__(self):
-        self.conn = mysql.connector.connect(**DB_CONFIG)
-        self.cursor = self.conn.cursor(dictionary=True)
+        transaction = getattr(_batch, "transaction", None)
+        if transaction is not None:
+            self.joined = True
+            return transaction.cursor
+        self.borrowed = admin_pool().connection()
+        self.conn = self.borrowed.__enter__()
+        self.cursor = license_db.TimedCursor(self.conn.cursor(dictionary=True, buffered=True), QUERY_STATS, self.conn)
         return self.cursor
     
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if self.conn and self.cursor:
+        if self.joined:
+            # The enclosing DBTransaction decides whether to commit
+            return
+        try:
             if exc_type is None:
                 self.conn.commit()
             else:
                 self.conn.rollback()
             self.cursor.close()
-            self.conn.close()
+        finally:
+            self.borrowed.__exit__(exc_type, exc_val, exc_tb)
+
+class DBTransaction(DBConnection):
+    """Runs every DBConnection block opened inside it on one connection and one transaction.
+    
+    Commits once at the end, or rolls everything back if an exception leaves the block.
+    """
+    
+    def __enter__(self):
+        cursor = super().__enter__()
+        if not self.joined:
+            _batch.transaction = self
+        return cursor
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if not self.joined:
+            _batch.transaction = None
+        super().__exit__(exc_type, exc_val, exc_tb)
 
 class LoginDialog(QDialog):
     """Admin login dialog."""
@@ -263,8 +314,12 @@ class AdminPanel(QMainWindow):
         refresh_btn = QPushButton("Refresh All Data")
         refresh_btn.clicked.connect(self.refresh_all_data)
         
+        dump_stats_btn = QPushButton("Save Query Stats")
+        dump_stats_btn.clicked.connect(self.dump_query_stats)
+        
         header_layout.addWidget(title_label)
         header_layout.addStretch()
+        header_layout.addWidget(dump_stats_btn)
         header_layout.addWidget(refresh_btn)
         
         main_layout.addLayout(header_layout)
@@ -282,6 +337,27 @@ class AdminPanel(QMainWindow):
         
         # Status bar
         self.statusBar().showMessage("Ready")
+        self.query_stats_label = QLabel(QUERY_STATS.summary())
+        self.statusBar().addPermanentWidget(self.query_stats_label)
+        self.query_stats_timer = QTimer(self)
+        self.query_stats_timer.timeout.connect(self.update_query_stats)
+        self.query_stats_timer.start(2000)
+    
+    def update_query_stats(self):
+        """Show the query timing summary in the status bar."""
+        self.query_stats_label.setText(QUERY_STATS.summary())
+    
+    def dump_query_stats(self):
+        """Save per-statement timings and the slow query log as JSON."""
+        default_name = "query_stats_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + ".json"
+        path, _ = QFileDialog.getSaveFileName(self, "Save Query Stats", default_name, "JSON Files (*.json)")
+        if not path:
+            return
+        try:
+            QUERY_STATS.dump(path)
+            self.statusBar().showMessage(f"Query stats saved to {path}")
+        except OSError as e:
+            QMessageBox.critical(self, "Error", f"Failed to save query stats: {str(e)}")
     
     def set_dark_theme(self):
         """Apply dark theme styling to the application."""
@@ -570,10 +646,15 @@ class AdminPanel(QMainWindow):
     
     def refresh_all_data(self):
         """Refresh all data in all tabs."""
-        self.refresh_licenses()
-        self.refresh_hardware()
-        self.refresh_activations()
-        self.refresh_attempts()
+        try:
+            # One connection and one consistent snapshot for all four tables
+            with DBTransaction():
+                self.refresh_licenses()
+                self.refresh_hardware()
+                self.refresh_activations()
+                self.refresh_attempts()
+        except Exception as e:
+            QMessageBox.critical(self, "Database Error", f"Error connecting to database: {str(e)}")
         self.statusBar().showMessage("Data refreshed at " + datetime.datetime.now().strftime("%H:%M:%S"))
     
     def refresh_licenses(self):
@@ -596,12 +677,8 @@ class AdminPanel(QMainWindow):
                 for row, license_data in enumerate(licenses):
                     self.licenses_table.insertRow(row)
                     
-                    # Get activation count
-                    cursor.execute(
-                        "SELECT COUNT(*) as count FROM activations WHERE license_key = %s",
-                        (license_data['license_key'],)
-                    )
-                    activation_count = cursor.fetchone()['count']
+                    # Activation count is maintained on the row itself
+                    activation_count = license_data['activation_count']
                     
                     # Format dates
                     created = license_data['creation_date'].strftime("%Y-%m-%d") if license_data['creation_date'] else ""
@@ -694,12 +771,8 @@ class AdminPanel(QMainWindow):
                 for row, hw_data in enumerate(hardware_ids):
                     self.hardware_table.insertRow(row)
                     
-                    # Get activation count
-                    cursor.execute(
-                        "SELECT COUNT(*) as count FROM activations WHERE hardware_id = %s",
-                        (hw_data['hardware_id'],)
-                    )
-                    activation_count = cursor.fetchone()['count']
+                    # Activation count is maintained on the row itself
+                    activation_count = hw_data['activation_count']
                     
                     # Format dates
                     first_seen = hw_data['first_seen'].strftime("%Y-%m-%d") if hw_data['first_seen'] else ""
@@ -4,9 +4,7 @@ import time
 import cv2
 import numpy as np
 import pyautogui
-import pydirectinput
 from PIL import Image, ImageGrab
-import imagehash
 import keyboard
 import threading
 import re
@@ -17,13 +15,27 @@ import platform
 import uuid
 import tempfile
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
 import mysql.connector
+from screen_capture import create_capture_backend
+from hekili_engine import (RecognitionEngine, build_capture_regions, compile_keybindings,
+                           parse_keybinding)
+from frame_recording import FrameRecorder
+from recognition import STRATEGY_HASH, SpellRecognizer, build_icon_index, preprocess
+from calibrate_thresholds import load_calibration
+from icon_index import IconWatcher, load_library_index
+from decision import SMOOTHING_MODES, DecisionStabilizer
+from sampling_profiler import SamplingProfiler
+from spellbox_locator import locate_spellbox
+import license_db
+from license_db import license_to_json
+from license_service import LicenseServiceClient, LicenseServiceError, license_service_url
 from os import listdir
 from os.path import isfile, join
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout, 
                             QHBoxLayout, QLabel, QPushButton, QComboBox, QLineEdit, 
                             QScrollArea, QFormLayout, QGridLayout, QGroupBox, QTextEdit,
-                            QCheckBox, QSlider, QSplitter, QFrame, QMessageBox)
+                            QCheckBox, QSlider, QSplitter, QFrame, QMessageBox, QSpinBox)
 from PyQt5.QtCore import Qt, QThread, pyqtSignal, QTimer, QSize
 from PyQt5.QtGui import QPixmap, QImage, QPalette, QColor, QFont, QIcon
 
@@ -70,48 +82,98 @@ class CaptureThread(QThread):
     update_signal = pyqtSignal(str)
     spell_signal = pyqtSignal(str)
     image_signal = pyqtSignal(QImage)
+    queue_signal = pyqtSignal(list)
     
-    def __init__(self, box_position, spell_info, threshold=15):
+    def __init__(self, box_position, spell_info, threshold=15, key_actions=None, regions=None,
+                 capture_backend="auto", calibration=None, icon_index=None, watch_icons=True,
+                 stabilizer=None, record_dir=None):
         super().__init__()
         self.box_position = box_position
+        self.regions = regions or {"primary": tuple(box_position)}
+        self.capture_backend = capture_backend
         self.spell_info = spell_info
         self.threshold = threshold
+        self.watch_icons = watch_icons
+        self.record_dir = record_dir
+        # Keys are only pressed for spells that stay recognised over a few frames
+        self.stabilizer = stabilizer or DecisionStabilizer("off")
         self.running = False
         self.active = True
         self.stop_requested = False
+        self.thread_ident = None
         
         # Create debug directory
         os.makedirs(DEBUG_DIR, exist_ok=True)
         
-        # Special handling for problematic spells
-        self.problem_spells = ["storm_elemental", "ascendance"]
-        self.problem_spell_info = {s: info for s, info in spell_info.items() 
-                                 if any(p.lower() in s.lower() for p in self.problem_spells)}
-        
-        # Print debug info for problem spells
-        for spell_name, info in self.problem_spell_info.items():
-            self.update_signal.emit(f"Special handling enabled for: {spell_name}")
-            self.update_signal.emit(f"  - Icon path: {info['icon_path']}")
-            self.update_signal.emit(f"  - Keybind: {info['key']}")
-            if os.path.exists(info["icon_path"]):
-                img = Image.open(info["icon_path"])
-                img.save(os.path.join(DEBUG_DIR, f"reference_{spell_name}.png"))
-        
-        # Prepare spell hashes
-        self.spell_hashes = {}
-        for spell_name, info in spell_info.items():
-            if os.path.exists(info["icon_path"]):
-                try:
-                    img = Image.open(info["icon_path"])
-                    self.spell_hashes[spell_name] = imagehash.phash(img)
-                except Exception as e:
-                    self.update_signal.emit(f"Error loading image for {spell_name}: {e}")
+        # Keybindings are parsed once here so the capture loop never parses key strings
+        if key_actions is None:
+            key_actions, self.keybind_errors = compile_keybindings(spell_info)
+        else:
+            self.keybind_errors = []
+        self.key_actions = key_actions
+        
+        # Thresholds from calibrate_thresholds.py take precedence over the defaults
+        calibration = calibration or {}
+        thresholds = calibration.get("hash_thresholds", {})
+        template_thresholds = calibration.get("template_thresholds", {})
+        
+        # Reference icons are reduced to the same canonical form as captured frames,
+        # taken from the prebuilt library index when one is available.
+        # Each spell's matching strategy is chosen from how well its icon separates from the others.
+        if icon_index is not None:
+            self.recognizer = SpellRecognizer(icon_index, threshold, thresholds,
+                                              template_thresholds=template_thresholds)
+        else:
+            self.recognizer = SpellRecognizer.from_spell_info(
+                spell_info,
+                lambda spell_name, e: self.update_signal.emit(f"Error loading image for {spell_name}: {e}"),
+                threshold,
+                thresholds,
+                template_thresholds=template_thresholds
+            )
     
     def run(self):
         """Main thread loop for capture and comparison."""
         self.running = True
+        # Lets the Debug tab's sampling profiler find this thread's stack
+        self.thread_ident = threading.get_ident()
         capture_count = 0
-        last_spell = None
+        
+        # Recognition, smoothing and key dispatch live in the Qt-free engine
+        engine = RecognitionEngine(
+            self.recognizer,
+            self.regions,
+            self.key_actions,
+            self.stabilizer,
+            on_log=self.update_signal.emit
+        )
+        primary_slice = engine.crop_slices["primary"]
+        
+        # The backend keeps its capture handle open for the whole run
+        backend = create_capture_backend(self.capture_backend)
+        self.update_signal.emit(f"Using {backend.name} screen capture")
+        
+        # Every grabbed frame goes into one memory-mapped recording instead of loose PNGs
+        recorder = None
+        if self.record_dir:
+            left, top, right, bottom = engine.grab_box
+            recorder = FrameRecorder(self.record_dir, (bottom - top, right - left, 3))
+            self.update_signal.emit(f"Recording frames to {self.record_dir}")
+        
+        for error in self.keybind_errors:
+            self.update_signal.emit(f"Ignoring invalid keybinding - {error}")
+        
+        # Icons added or replaced in the spec folder are picked up without a restart
+        watcher = None
+        spec_dirs = {os.path.dirname(info["icon_path"]) for info in self.spell_info.values()}
+        if self.watch_icons and len(spec_dirs) == 1:
+            watcher = IconWatcher(
+                spec_dirs.pop(),
+                self.reload_icons,
+                self.recognizer.index,
+                on_error=lambda spell_name, e: self.update_signal.emit(f"Error loading image for {spell_name}: {e}")
+            )
+            watcher.start()
         
         while not self.stop_requested:
             # Check for F3 key to toggle automation
@@ -119,92 +181,36 @@ class CaptureThread(QThread):
                 self.active = not self.active
                 status = "activated" if self.active else "paused"
                 self.update_signal.emit(f"Automation {status}")
+                engine.reset()
                 time.sleep(0.3)  # Debounce
             
             if self.active:
                 try:
-                    # Capture the screen region
-                    left, top, width, height = self.box_position
-                    region = (left, top, left + width, top + height)
-                    screenshot = ImageGrab.grab(bbox=region)
+                    # Capture all regions in a single grab
+                    frame = backend.grab(engine.grab_box)
+                    if recorder:
+                        recorder.append(frame)
+                    result = engine.process(frame)
                     
                     # Update UI with current screenshot (every 10 frames)
                     if capture_count % 10 == 0:
-                        qt_img = pil_to_qimage(screenshot)
+                        qt_img = pil_to_qimage(Image.fromarray(frame[primary_slice]))
                         self.image_signal.emit(qt_img)
                     
-                    # Save occasional screenshots for debugging
-                    if capture_count % 200 == 0:
-                        screenshot.save(os.path.join(DEBUG_DIR, f"capture_{capture_count}.png"))
+                    # Save occasional screenshots for debugging when not recording
+                    if not recorder and capture_count % 200 == 0:
+                        Image.fromarray(frame).save(os.path.join(DEBUG_DIR, f"capture_{capture_count}.png"))
                     
-                    # First try template matching for problematic spells
-                    problem_spell_matched = False
-                    for spell_name, info in self.problem_spell_info.items():
-                        # Convert to CV2 format
-                        screenshot_cv = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-                        template = cv2.imread(info["icon_path"])
-                        
-                        if template is not None:
-                            # Use template matching with multiple scales for better accuracy
-                            max_val_overall = 0
-                            for scale in [1.0, 0.95, 0.9]:
-                                scaled_template = cv2.resize(template, (0, 0), fx=scale, fy=scale)
-                                if scaled_template.shape[0] <= screenshot_cv.shape[0] and scaled_template.shape[1] <= screenshot_cv.shape[1]:
-                                    result = cv2.matchTemplate(screenshot_cv, scaled_template, cv2.TM_CCOEFF_NORMED)
-                                    _, max_val, _, _ = cv2.minMaxLoc(result)
-                                    max_val_overall = max(max_val_overall, max_val)
-                            
-                            # If strong match found (threshold can be adjusted)
-                            if max_val_overall >= 0.7:
-                                # Save this detection
-                                if spell_name != last_spell:
-                                    self.update_signal.emit(f"Template matching found: {spell_name} (confidence: {max_val_overall:.2f})")
-                                    screenshot.save(os.path.join(DEBUG_DIR, f"detected_{spell_name}_{capture_count}.png"))
-                                    last_spell = spell_name
-                                    self.spell_signal.emit(spell_name)
-                                
-                                # Press the key
-                                key = info["key"]
-                                if key:
-                                    self.press_key_combination(key)
-                                    time.sleep(0.1)  # Small delay to prevent key spamming
-                                
-                                problem_spell_matched = True
-                                break
+                    if result.changed:
+                        self.spell_signal.emit(result.spell)
+                        # Keep the hard cases for calibrate_thresholds.py
+                        if result.candidate.method != STRATEGY_HASH:
+                            Image.fromarray(frame[primary_slice]).save(
+                                os.path.join(DEBUG_DIR, f"detected_{result.spell}_{capture_count}.png")
+                            )
                     
-                    # If no problem spell was found, use the regular phash method
-                    if not problem_spell_matched:
-                        # Compare with spell icons
-                        current_hash = imagehash.phash(screenshot)
-                        best_match = None
-                        min_diff = float('inf')
-                        
-                        for spell_name, phash in self.spell_hashes.items():
-                            diff = phash - current_hash
-                            # Use lower threshold for problem spells
-                            if any(p.lower() in spell_name.lower() for p in self.problem_spells):
-                                if diff < min_diff and diff < 12:  # Lower threshold for problem spells
-                                    min_diff = diff
-                                    best_match = spell_name
-                            elif diff < min_diff:
-                                min_diff = diff
-                                best_match = spell_name
-                        
-                        # If a match is found and it's close enough
-                        is_problem_spell = best_match and any(p.lower() in best_match.lower() for p in self.problem_spells)
-                        threshold = 12 if is_problem_spell else self.threshold
-                        
-                        if best_match and min_diff < threshold:
-                            # Only log when spell changes
-                            if best_match != last_spell:
-                                self.update_signal.emit(f"Hash matching found: {best_match} (diff: {min_diff})")
-                                last_spell = best_match
-                                self.spell_signal.emit(best_match)
-                            
-                            key = self.spell_info[best_match]["key"]
-                            if key:
-                                self.press_key_combination(key)
-                                time.sleep(0.1)  # Small delay to prevent key spamming
+                    if result.queue_changed:
+                        self.queue_signal.emit([spell or "" for spell in result.queue])
                     
                     capture_count += 1
                     time.sleep(0.05)  # Small delay between captures
@@ -215,41 +221,77 @@ class CaptureThread(QThread):
             else:
                 time.sleep(0.1)
         
+        if watcher:
+            watcher.stop()
+        if recorder:
+            recorder.close()
+            self.update_signal.emit(f"Recorded {recorder.count} frames to {self.record_dir}")
+        backend.close()
         self.running = False
     
+    def reload_icons(self, index, changes):
+        """Swap in a rebuilt icon index; called from the icon watcher thread."""
+        # A single assignment, so a frame being matched keeps using the old index
+        self.recognizer.index = index
+        for change, spell_name in changes:
+            self.update_signal.emit(f"Icon {change}: {spell_name}")
+            if change != "removed" and spell_name not in self.key_actions:
+                self.update_signal.emit(f"  - No keybinding for {spell_name}, it will be recognised but not pressed")
+    
     def stop(self):
         """Stop the thread."""
         self.stop_requested = True
         self.wait()
+
+
+class ProfilerThread(QThread):
+    """Thread that samples the capture thread's stack for a fixed time."""
+    update_signal = pyqtSignal(str)
     
-    def press_key_combination(self, key_combo):
-        """Press a key combination which may include modifier keys."""
-        if '+' in key_combo:
-            parts = key_combo.lower().split('+')
-            modifier = parts[0].strip()
-            key = parts[1].strip()
-            
-            if modifier == 'alt':
-                keyboard.press('alt')
-                time.sleep(0.05)  # Small delay to ensure modifier is registered
-                pydirectinput.press(key)
-                time.sleep(0.05)
-                keyboard.release('alt')
-            elif modifier == 'ctrl':
-                keyboard.press('ctrl')
-                time.sleep(0.05)
-                pydirectinput.press(key)
-                time.sleep(0.05)
-                keyboard.release('ctrl')
-            elif modifier == 'shift':
-                keyboard.press('shift')
-                time.sleep(0.05)
-                pydirectinput.press(key)
-                time.sleep(0.05)
-                keyboard.release('shift')
-        else:
-            # For regular keys without modifiers
-            pydirectinput.press(key_combo)
+    def __init__(self, thread_ident, seconds, output_base):
+        super().__init__()
+        self.profiler = SamplingProfiler(thread_ident)
+        self.seconds = seconds
+        self.output_base = output_base
+    
+    def run(self):
+        """Sample, then write the collapsed stacks and a speedscope profile."""
+        self.profiler.run(self.seconds)
+        if not self.profiler.sample_count():
+            self.update_signal.emit("Profiler: no samples taken, the capture thread is not running")
+            return
+        
+        folded_path = self.output_base + ".folded"
+        speedscope_path = self.output_base + ".speedscope.json"
+        try:
+            self.profiler.write_collapsed(folded_path)
+            self.profiler.write_speedscope(speedscope_path)
+        except Exception as e:
+            self.update_signal.emit(f"Profiler: error writing results: {e}")
+            return
+        
+        self.update_signal.emit(
+            f"Profiler: {self.profiler.sample_count()} samples over {self.profiler.elapsed:.1f}s"
+        )
+        self.update_signal.emit("Hottest lines:")
+        for label, fraction in self.profiler.hotspots(5):
+            self.update_signal.emit(f"  {fraction:6.1%}  {label}")
+        self.update_signal.emit(f"Collapsed stacks: {folded_path}")
+        self.update_signal.emit(f"Speedscope profile: {speedscope_path} (open at https://www.speedscope.app)")
+
+
+class IconLibraryThread(QThread):
+    """Thread that loads the icon index, rehashing changed icons, off the GUI thread."""
+    update_signal = pyqtSignal(str)
+    library_signal = pyqtSignal(object)
+    
+    def run(self):
+        try:
+            library = load_library_index(IMG_DIR, executor=ThreadPoolExecutor)
+        except Exception as e:
+            self.update_signal.emit(f"Error loading icon index, reading icons directly: {e}")
+            return
+        self.library_signal.emit(library)
 
 
 class SpellTestThread(QThread):
@@ -269,17 +311,11 @@ class SpellTestThread(QThread):
         os.makedirs(DEBUG_DIR, exist_ok=True)
         
         # Find the spell
-        test_spell = None
-        for spell_name, info in self.spell_info.items():
-            if self.spell_to_test.lower() in spell_name.lower():
-                test_spell = (spell_name, info)
-                break
-        
-        if not test_spell:
+        if self.spell_to_test not in self.spell_info:
             self.update_signal.emit(f"Error: {self.spell_to_test} not found in current class/spec")
             return
         
-        spell_name, info = test_spell
+        spell_name, info = self.spell_to_test, self.spell_info[self.spell_to_test]
         self.update_signal.emit(f"Testing recognition for: {spell_name}")
         self.update_signal.emit(f"Icon path: {info['icon_path']}")
         
@@ -299,36 +335,38 @@ class SpellTestThread(QThread):
         # Save for debugging
         screenshot.save(os.path.join(DEBUG_DIR, f"test_{spell_name}.png"))
         
-        # Test recognition with perceptual hash
-        ref_img = Image.open(info["icon_path"])
-        ref_hash = imagehash.phash(ref_img)
-        current_hash = imagehash.phash(screenshot)
-        hash_diff = ref_hash - current_hash
+        # Reference icons and capture are compared in the same canonical domain
+        recognizer = SpellRecognizer.from_spell_info(self.spell_info, threshold=self.threshold)
+        features = preprocess(screenshot)
+        self.update_signal.emit(f"Matching strategy: {recognizer.strategies.get(spell_name, STRATEGY_HASH)}")
+        
+        # Show which spells the recognizer thinks are closest to this capture
+        self.update_signal.emit("Top candidates:")
+        for rank, candidate in enumerate(recognizer.rank(features, k=5), start=1):
+            self.update_signal.emit(
+                f"  {rank}. {candidate.spell_name} (diff: {candidate.distance:.1f}, "
+                f"confidence: {candidate.confidence:.2f}){' <- match' if candidate.matched else ''}"
+            )
+        
+        # Test recognition with the combined hashes, and show each hash on its own
+        index = recognizer.index
+        hash_diff = recognizer.hash_distance(features, spell_name, index)
+        kind_diffs = ", ".join(f"{kind} {diff}" for kind, diff in recognizer.hash_kind_distances(features, spell_name, index).items())
         
-        self.update_signal.emit(f"Hash comparison: diff = {hash_diff}")
+        self.update_signal.emit(f"Hash comparison: diff = {hash_diff:.1f} ({kind_diffs})")
         self.update_signal.emit(f"Current threshold: {self.threshold}")
         result = "MATCH" if hash_diff < self.threshold else "NO MATCH"
         self.update_signal.emit(f"Result: {result}")
         
-        # Test with template matching
-        screenshot_cv = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
-        template = cv2.imread(info["icon_path"])
-        if template is not None:
-            # Try different scales for template matching
-            for scale in [1.0, 0.95, 0.9, 0.85]:
-                scaled_template = cv2.resize(template, (0, 0), fx=scale, fy=scale)
-                
-                # Skip if template is larger than image
-                if scaled_template.shape[0] > screenshot_cv.shape[0] or scaled_template.shape[1] > screenshot_cv.shape[1]:
-                    self.update_signal.emit(f"Template matching (scale {scale}): skipped - template too large")
-                    continue
-                
-                result = cv2.matchTemplate(screenshot_cv, scaled_template, cv2.TM_CCOEFF_NORMED)
-                _, max_val, _, _ = cv2.minMaxLoc(result)
-                
-                self.update_signal.emit(f"Template matching (scale {scale}): confidence = {max_val:.4f}")
-                tm_result = "MATCH" if max_val >= 0.7 else "NO MATCH"
-                self.update_signal.emit(f"Template result: {tm_result}")
+        # Test with template matching at different scales
+        for scale, max_val in recognizer.template_scores(features, spell_name, index=index).items():
+            self.update_signal.emit(f"Template matching (scale {scale}): confidence = {max_val:.4f}")
+            tm_result = "MATCH" if max_val >= recognizer.template_threshold_for(spell_name) else "NO MATCH"
+            self.update_signal.emit(f"Template result: {tm_result}")
+        
+        # Result of the strategy the capture loop would use for this spell
+        candidate = recognizer.match_spell(features, spell_name)
+        self.update_signal.emit(f"Strategy result: {'MATCH via ' + candidate.method if candidate else 'NO MATCH'}")
 
 
 class AutoHekiliGUI(QMainWindow):
@@ -340,9 +378,14 @@ class AutoHekiliGUI(QMainWindow):
         
         # App state
         self.config = self.load_config()
+        # Filled in by IconLibraryThread; until then icons are read from IMG_DIR
+        self.library = None
+        self.library_thread = None
         self.box_position = None
         self.spell_info = {}
+        self.key_actions = {}
         self.capture_thread = None
+        self.profiler_thread = None
         self.current_spell = None
         
         # License tracking
@@ -356,6 +399,8 @@ class AutoHekiliGUI(QMainWindow):
         
         # Load existing configuration if available
         self.load_existing_config()
+        
+        self.load_icon_library()
 
         # Validate license against database
         self.validate_license_against_database()
@@ -693,6 +738,26 @@ class AutoHekiliGUI(QMainWindow):
 
     def validate_license_against_database(self):
         """Check license validity against the database and update the local license file."""
+        service_url = license_service_url()
+        if service_url:
+            return self.validate_license_against_service(service_url)
+        
+        # Get the hardware ID
+        hardware_id = generate_hardware_id()
+        
+        # Load the local license file to get the license key
+        local_license = self.load_license_file()
+        license_key = local_license.get("license_key") if local_license else None
+        
+        if not license_key:
+            self.log("No license key found in local file.")
+            return False
+        
+        circuit = license_db.circuit_breaker(license_db.DB_CIRCUIT)
+        if not circuit.allow():
+            self.log(f"License database unreachable, next retry in {circuit.stats()['retry_in']:.0f}s")
+            return False
+        
         try:
             # Connect to the database
             conn = mysql.connector.connect(
@@ -705,17 +770,6 @@ class AutoHekiliGUI(QMainWindow):
             )
             cursor = conn.cursor(dictionary=True)  # Return results as dictionaries
             
-            # Get the hardware ID
-            hardware_id = generate_hardware_id()
-            
-            # Load the local license file to get the license key
-            local_license = self.load_license_file()
-            license_key = local_license.get("license_key") if local_license else None
-            
-            if not license_key:
-                self.log("No license key found in local file.")
-                return False
-                
             # Check if this license key exists and is valid
             cursor.execute("""
                 SELECT l.*, a.hardware_id, a.is_legitimate 
@@ -725,33 +779,25 @@ class AutoHekiliGUI(QMainWindow):
             """, (license_key,))
             
             result = cursor.fetchone()
+            circuit.record_success()
             
             if not result:
                 self.log(f"License key {license_key} not found in database.")
                 return False
                 
             # Update local license file with latest info from database
-            license_data = {
-                "license_key": result["license_key"],
-                "status": result["status"],
-                "creation_date": result["creation_date"].isoformat() if result["creation_date"] else None,
-                "expiration_date": result["expiration_date"].isoformat() if result["expiration_date"] else None,
-                "hardware_id": hardware_id
-            }
-            
-            # Save updated license data to file
-            os.makedirs(os.path.dirname(LICENSE_FILE), exist_ok=True)
-            with open(LICENSE_FILE, 'w') as f:
-                json.dump(license_data, f, indent=4)
+            self.save_license_record(license_to_json(result), hardware_id)
                 
             self.log(f"License updated from database: {license_key}")
             return True
                 
         except mysql.connector.Error as e:
             self.log(f"Database error: {e}")
+            circuit.record_failure()
             return False
         except Exception as e:
             self.log(f"Error validating license: {e}")
+            circuit.record_failure()
             return False
         finally:
             if 'cursor' in locals() and cursor:
@@ -759,6 +805,56 @@ class AutoHekiliGUI(QMainWindow):
             if 'conn' in locals() and conn:
                 conn.close()
         
+    def validate_license_against_service(self, service_url):
+        """Check license validity through the licensing service and update the local license file."""
+        local_license = self.load_license_file()
+        license_key = local_license.get("license_key") if local_license else None
+        if not license_key:
+            self.log("No license key found in local file.")
+            return False
+        
+        circuit = license_db.circuit_breaker(license_db.SERVICE_CIRCUIT)
+        if not circuit.allow():
+            self.log(f"Licensing service unreachable, next retry in {circuit.stats()['retry_in']:.0f}s")
+            return False
+        
+        hardware_id = generate_hardware_id()
+        client = LicenseServiceClient(service_url)
+        try:
+            record = client.license_info(license_key)
+            circuit.record_success()
+            if not record:
+                self.log(f"License key {license_key} not found in database.")
+                return False
+            # Also refreshes this device's last verification time
+            client.heartbeat(license_key, hardware_id)
+        except LicenseServiceError as e:
+            self.log(f"Licensing service error: {e}")
+            circuit.record_failure()
+            return False
+        except Exception:
+            circuit.record_failure()
+            raise
+                
+        self.save_license_record(record, hardware_id)
+        self.log(f"License updated from licensing service: {license_key}")
+        return True
+    
+    def save_license_record(self, record, hardware_id):
+        """Write a licenses row (dates as ISO strings) to the local license file."""
+        license_data = {
+            "license_key": record["license_key"],
+            "status": record["status"],
+            "creation_date": record["creation_date"],
+            "expiration_date": record["expiration_date"],
+            "hardware_id": hardware_id
+        }
+        
+        # Save updated license data to file
+        os.makedirs(os.path.dirname(LICENSE_FILE), exist_ok=True)
+        with open(LICENSE_FILE, 'w') as f:
+            json.dump(license_data, f, indent=4)
+    
     def load_license_file(self):
         """Load license data from file if it exists."""
         try:
@@ -1086,10 +1182,66 @@ class AutoHekiliGUI(QMainWindow):
         self.region_label = QLabel("Not selected")
         self.select_region_btn = QPushButton("Select Region")
         self.select_region_btn.clicked.connect(self.select_region)
+        self.auto_locate_btn = QPushButton("Auto-Locate")
+        self.auto_locate_btn.setToolTip("Search the screen for the selected class/spec's icons while Hekili shows a recommendation")
+        self.auto_locate_btn.clicked.connect(self.auto_locate_region)
         region_btn_layout.addWidget(self.region_label)
+        region_btn_layout.addWidget(self.auto_locate_btn)
         region_btn_layout.addWidget(self.select_region_btn)
         
         region_layout.addRow("Spellbox Region:", region_btn_layout)
+        
+        # Hekili queue - upcoming recommendations read from the same grab
+        queue_layout = QHBoxLayout()
+        self.queue_length_spin = QSpinBox()
+        self.queue_length_spin.setRange(0, 4)
+        self.queue_length_spin.setValue(self.config.get("queue_length", 0))
+        self.queue_length_spin.setToolTip("Number of queued Hekili icons to read after the primary icon")
+        queue_layout.addWidget(self.queue_length_spin)
+        
+        queue_layout.addWidget(QLabel("Direction:"))
+        self.queue_direction_combo = QComboBox()
+        self.queue_direction_combo.addItems(["right", "left", "down", "up"])
+        idx = self.queue_direction_combo.findText(self.config.get("queue_direction", "right"))
+        if idx >= 0:
+            self.queue_direction_combo.setCurrentIndex(idx)
+        queue_layout.addWidget(self.queue_direction_combo)
+        
+        queue_layout.addWidget(QLabel("Icon Size:"))
+        self.queue_size_spin = QSpinBox()
+        self.queue_size_spin.setRange(0, 200)
+        self.queue_size_spin.setSpecialValueText("Same")
+        self.queue_size_spin.setValue(self.config.get("queue_icon_size", 0))
+        queue_layout.addWidget(self.queue_size_spin)
+        
+        queue_layout.addWidget(QLabel("Spacing:"))
+        self.queue_spacing_spin = QSpinBox()
+        self.queue_spacing_spin.setRange(0, 100)
+        self.queue_spacing_spin.setValue(self.config.get("queue_spacing", 5))
+        queue_layout.addWidget(self.queue_spacing_spin)
+        
+        region_layout.addRow("Queued Icons:", queue_layout)
+        
+        # Temporal smoothing of recognition results
+        smoothing_layout = QHBoxLayout()
+        self.smoothing_combo = QComboBox()
+        self.smoothing_combo.addItems(SMOOTHING_MODES)
+        self.smoothing_combo.setToolTip("off: press on every matching frame\n"
+                                        "vote: the spell must match most of the last frames\n"
+                                        "ema: the spell's averaged confidence must be high enough")
+        idx = self.smoothing_combo.findText(self.config.get("smoothing", "vote"))
+        if idx >= 0:
+            self.smoothing_combo.setCurrentIndex(idx)
+        smoothing_layout.addWidget(self.smoothing_combo)
+        
+        smoothing_layout.addWidget(QLabel("Frames:"))
+        self.smoothing_window_spin = QSpinBox()
+        self.smoothing_window_spin.setRange(1, 10)
+        self.smoothing_window_spin.setValue(self.config.get("smoothing_window", 3))
+        smoothing_layout.addWidget(self.smoothing_window_spin)
+        smoothing_layout.addStretch()
+        
+        region_layout.addRow("Smoothing:", smoothing_layout)
         region_box.setLayout(region_layout)
         layout.addWidget(region_box)
         
@@ -1121,7 +1273,8 @@ class AutoHekiliGUI(QMainWindow):
         instructions = QLabel(
             "Configure keybindings for your spells. These must match your in-game keybindings.<br>"
             "• Leave empty or type 'skip' to ignore spells you don't want to cast<br>"
-            "• For modifier keys, use format: <b>alt+key</b>, <b>ctrl+key</b>, <b>shift+key</b> (e.g., 'alt+1', 'ctrl+f')"
+            "• For modifier keys, use format: <b>alt+key</b>, <b>ctrl+key</b>, <b>shift+key</b> (e.g., 'alt+1', 'ctrl+f')<br>"
+            "• Modifiers can be combined, e.g. <b>ctrl+shift+1</b>"
         )
         instructions.setTextFormat(Qt.RichText)
         instructions.setWordWrap(True)
@@ -1234,26 +1387,25 @@ class AutoHekiliGUI(QMainWindow):
         top_widget = QWidget()
         top_layout = QVBoxLayout(top_widget)
         
-        # Problem spell testing
-        problem_box = QGroupBox("Test Problematic Spells")
+        # Spell recognition testing
+        problem_box = QGroupBox("Test Spell Recognition")
         problem_layout = QVBoxLayout()
         
         # Instructions
         test_instructions = QLabel(
-            "Test recognition for problematic spells like Storm Elemental and Ascendance.\n"
+            "Test recognition for any spell of the current class/spec and see which matching strategy it uses.\n"
             "Make sure Hekili is showing the spell you want to test before clicking the test button."
         )
         test_instructions.setWordWrap(True)
         problem_layout.addWidget(test_instructions)
         
-        # Test buttons for specific problem spells
+        # Spell picker and test button
         btn_layout = QHBoxLayout()
-        self.test_storm_btn = QPushButton("Test Storm Elemental")
-        self.test_storm_btn.clicked.connect(lambda: self.test_spell_recognition("storm_elemental"))
-        self.test_ascendance_btn = QPushButton("Test Ascendance")
-        self.test_ascendance_btn.clicked.connect(lambda: self.test_spell_recognition("ascendance"))
-        btn_layout.addWidget(self.test_storm_btn)
-        btn_layout.addWidget(self.test_ascendance_btn)
+        self.test_spell_combo = QComboBox()
+        self.test_spell_btn = QPushButton("Test Spell")
+        self.test_spell_btn.clicked.connect(lambda: self.test_spell_recognition(self.test_spell_combo.currentText()))
+        btn_layout.addWidget(self.test_spell_combo, 1)
+        btn_layout.addWidget(self.test_spell_btn)
         problem_layout.addLayout(btn_layout)
         
         # Threshold adjustment
@@ -1279,6 +1431,25 @@ class AutoHekiliGUI(QMainWindow):
         capture_layout.addWidget(self.refresh_capture_btn)
         problem_layout.addLayout(capture_layout)
         
+        # Session recording, replayable with hekili_engine.py --frames <recording>
+        self.record_checkbox = QCheckBox("Record capture session while automation runs")
+        self.record_checkbox.setToolTip(f"Frames are written to a memory-mapped recording in {DEBUG_DIR}")
+        problem_layout.addWidget(self.record_checkbox)
+        
+        # Sampling profiler for "feels laggy" reports
+        profile_layout = QHBoxLayout()
+        self.profile_btn = QPushButton("Profile Capture Thread")
+        self.profile_btn.setToolTip(f"Samples where the capture thread spends its time and writes the profile to {DEBUG_DIR}")
+        self.profile_btn.clicked.connect(self.profile_capture_thread)
+        self.profile_seconds_spin = QSpinBox()
+        self.profile_seconds_spin.setRange(1, 120)
+        self.profile_seconds_spin.setValue(10)
+        self.profile_seconds_spin.setSuffix(" s")
+        profile_layout.addWidget(self.profile_btn)
+        profile_layout.addWidget(self.profile_seconds_spin)
+        profile_layout.addStretch()
+        problem_layout.addLayout(profile_layout)
+        
         self.preview_label = QLabel()
         self.preview_label.setFixedSize(100, 100)
         self.preview_label.setAlignment(Qt.AlignCenter)
@@ -1355,8 +1526,14 @@ class AutoHekiliGUI(QMainWindow):
         
         status_layout.addWidget(spell_container, 1, 1)
         
+        # Upcoming spells read from the Hekili queue
+        status_layout.addWidget(QLabel("Up Next:"), 2, 0)
+        self.queue_label = QLabel("None")
+        self.queue_label.setStyleSheet("color: #BBBBBB;")
+        status_layout.addWidget(self.queue_label, 2, 1)
+        
         # Toggle key with WoW keybind styling
-        status_layout.addWidget(QLabel("Toggle Key:"), 2, 0)
+        status_layout.addWidget(QLabel("Toggle Key:"), 3, 0)
         
         f3_key = QLabel("F3")
         f3_key.setStyleSheet("""
@@ -1369,12 +1546,12 @@ class AutoHekiliGUI(QMainWindow):
             min-width: 30px;
             text-align: center;
         """)
-        status_layout.addWidget(f3_key, 2, 1)
+        status_layout.addWidget(f3_key, 3, 1)
         
         # Add warning about ENTER key (important for WoW chat)
         warning_label = QLabel("WARNING: Pressing ENTER in-game will send keys to chat!")
         warning_label.setStyleSheet("color: #FF6060; font-style: italic;")
-        status_layout.addWidget(warning_label, 3, 0, 1, 2)
+        status_layout.addWidget(warning_label, 4, 0, 1, 2)
         
         status_box.setLayout(status_layout)
         layout.addWidget(status_box)
@@ -1514,8 +1691,31 @@ class AutoHekiliGUI(QMainWindow):
         with open(CONFIG_PATH, "w") as f:
             json.dump(self.config, f, indent=4, sort_keys=True)
     
+    def load_icon_library(self):
+        """Load the combined icon index in a background thread; only changed icons are rehashed."""
+        self.library_thread = IconLibraryThread()
+        self.library_thread.update_signal.connect(self.log)
+        self.library_thread.library_signal.connect(self.set_icon_library)
+        self.library_thread.start()
+    
+    def set_icon_library(self, library):
+        """Switch to the loaded icon index and refresh the class/spec list from it."""
+        self.library = library
+        current = self.class_combo.currentText()
+        self.class_combo.blockSignals(True)
+        self.class_combo.clear()
+        self.class_combo.addItems(self.get_available_classes_specs())
+        idx = self.class_combo.findText(current)
+        if idx >= 0:
+            self.class_combo.setCurrentIndex(idx)
+        self.class_combo.blockSignals(False)
+        self.log(f"Icon index loaded: {len(library)} icons in {len(library.class_specs())} specs")
+    
     def get_available_classes_specs(self):
         """Get all available class and spec combinations from img directory."""
+        if self.library is not None:
+            return self.library.class_specs()
+        
         available = []
         if os.path.exists(IMG_DIR):
             for item in os.listdir(IMG_DIR):
@@ -1523,32 +1723,81 @@ class AutoHekiliGUI(QMainWindow):
                     available.append(item)
         return sorted(available)
     
-    def select_region(self):
-        """Allow user to select a region of the screen."""
+    def grab_full_screen(self):
+        """Minimize the window and grab the whole screen as an RGB array."""
         self.setWindowState(self.windowState() | Qt.WindowMinimized)
         QApplication.processEvents()
         time.sleep(0.5)  # Small delay to ensure window is minimized
+        return np.array(pyautogui.screenshot())
+    
+    def restore_window(self):
+        self.setWindowState(self.windowState() & ~Qt.WindowMinimized)
+        self.show()
+        self.activateWindow()
+    
+    def auto_locate_region(self):
+        """Search the screen for the selected class/spec's icons and propose the spellbox region."""
+        class_spec = self.class_combo.currentText()
+        if not class_spec:
+            QMessageBox.warning(self, "Setup Error", "Please select a class/spec first.")
+            return
+        
+        if self.library is not None:
+            index = self.library.icon_index(class_spec)
+        else:
+            spells = self.get_spells_for_class_spec(class_spec)
+            index = build_icon_index({spell_name: info["icon_path"] for spell_name, info in spells.items()})
+        if not len(index):
+            QMessageBox.warning(self, "Setup Error", f"No spell icons found for {class_spec}.")
+            return
         
-        # Capture the screen
-        screenshot = pyautogui.screenshot()
-        screenshot = cv2.cvtColor(np.array(screenshot), cv2.COLOR_RGB2BGR)
+        try:
+            screenshot = self.grab_full_screen()
+            match = locate_spellbox(screenshot, index)
+        except Exception as e:
+            self.log(f"Error locating spellbox: {e}")
+            return
+        finally:
+            self.restore_window()
+        
+        if match is None:
+            self.log(f"Auto-locate: no {class_spec} icon found on screen. "
+                     f"Make sure Hekili is showing a recommendation, or select the region manually.")
+            return
+        
+        self.box_position = match.box
+        left, top, width, height = match.box
+        self.region_label.setText(f"{left}, {top}, {width}x{height}")
+        self.log(f"Auto-located spellbox at {match.box} showing {match.spell_name} (score {match.score:.2f}). "
+                 f"Use Select Region to adjust it, then apply the setup.")
+    
+    def select_region(self):
+        """Allow user to select a region of the screen."""
+        screenshot = cv2.cvtColor(self.grab_full_screen(), cv2.COLOR_RGB2BGR)
         
-        # Selection variables
+        # Selection variables, starting from the current (e.g. auto-located) region
         selecting = False
         start_x, start_y = 0, 0
         end_x, end_y = 0, 0
         selection = None
+        if self.box_position:
+            start_x, start_y, width, height = self.box_position
+            end_x, end_y = start_x + width, start_y + height
+        # The window is only redrawn after the mouse changed the selection
+        dirty = True
         
         def mouse_callback(event, x, y, flags, param):
-            nonlocal selecting, start_x, start_y, end_x, end_y, selection
+            nonlocal selecting, start_x, start_y, end_x, end_y, selection, dirty
             
             if event == cv2.EVENT_LBUTTONDOWN:
                 selecting = True
                 start_x, start_y = x, y
                 end_x, end_y = x, y
+                dirty = True
             
             elif event == cv2.EVENT_MOUSEMOVE and selecting:
                 end_x, end_y = x, y
+                dirty = True
             
             elif event == cv2.EVENT_LBUTTONUP:
                 selecting = False
@@ -1558,29 +1807,33 @@ class AutoHekiliGUI(QMainWindow):
                     abs(end_x - start_x),
                     abs(end_y - start_y)
                 )
+                dirty = True
         
         window_name = "Select Hekili Spellbox Region (Press 'q' to exit)"
         cv2.namedWindow(window_name)
         cv2.setMouseCallback(window_name, mouse_callback)
+        img = np.empty_like(screenshot)
         
         while True:
-            img = screenshot.copy()
-            if selecting or selection:
-                x1, y1 = min(start_x, end_x), min(start_y, end_y)
-                x2, y2 = max(start_x, end_x), max(start_y, end_y)
-                cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-            
-            cv2.imshow(window_name, img)
-            key = cv2.waitKey(1) & 0xFF
-            
+            if dirty:
+                dirty = False
+                np.copyto(img, screenshot)
+                if selecting or selection or self.box_position:
+                    x1, y1 = min(start_x, end_x), min(start_y, end_y)
+                    x2, y2 = max(start_x, end_x), max(start_y, end_y)
+                    cv2.rectangle(img, (x1, y1), (x2, y2), (0, 255, 0), 2)
+                cv2.imshow(window_name, img)
+            
+            key = cv2.waitKey(20) & 0xFF
             if key == ord('q'):
                 break
+            # Closing the window counts as done too
+            if cv2.getWindowProperty(window_name, cv2.WND_PROP_VISIBLE) < 1:
+                break
         
         cv2.destroyAllWindows()
         
-        self.setWindowState(self.windowState() & ~Qt.WindowMinimized)
-        self.show()
-        self.activateWindow()
+        self.restore_window()
         
         if selection:
             self.box_position = selection
@@ -1601,6 +1854,13 @@ class AutoHekiliGUI(QMainWindow):
         # Save configuration
         self.config["Class"] = class_spec
         self.config["location"] = [self.box_position[0], self.box_position[1]]
+        self.config["size"] = [self.box_position[2], self.box_position[3]]
+        self.config["queue_length"] = self.queue_length_spin.value()
+        self.config["queue_direction"] = self.queue_direction_combo.currentText()
+        self.config["queue_icon_size"] = self.queue_size_spin.value()
+        self.config["queue_spacing"] = self.queue_spacing_spin.value()
+        self.config["smoothing"] = self.smoothing_combo.currentText()
+        self.config["smoothing_window"] = self.smoothing_window_spin.value()
         self.save_config()
         
         # Load spell info
@@ -1618,7 +1878,13 @@ class AutoHekiliGUI(QMainWindow):
         spell_dir = os.path.join(IMG_DIR, class_spec)
         spells = {}
         
-        if os.path.exists(spell_dir):
+        if self.library is not None:
+            for spell_name, icon_path in self.library.spell_paths(class_spec).items():
+                spells[spell_name] = {
+                    "icon_path": icon_path,
+                    "key": ""
+                }
+        elif os.path.exists(spell_dir):
             for file in os.listdir(spell_dir):
                 if file.endswith(('.jpg', '.jpeg', '.png')):
                     spell_name = os.path.splitext(file)[0]
@@ -1640,6 +1906,10 @@ class AutoHekiliGUI(QMainWindow):
         
         self.keybind_inputs = {}
         
+        # Keep the debug tab's spell picker in sync with the current class/spec
+        self.test_spell_combo.clear()
+        self.test_spell_combo.addItems(sorted(self.spell_info.keys()))
+        
         # Get existing keybindings if available
         if "keybindings" in self.config:
             for spell_name, key in self.config["keybindings"].items():
@@ -1664,10 +1934,14 @@ class AutoHekiliGUI(QMainWindow):
             
             # Add spell icon if available
             icon_path = self.spell_info[spell_name]["icon_path"]
-            if os.path.exists(icon_path):
+            thumbnail = self.library.thumbnail(icon_path) if self.library is not None else None
+            if thumbnail is not None or os.path.exists(icon_path):
                 icon_label = QLabel()
-                img = Image.open(icon_path)
-                img = img.resize((24, 24), Image.LANCZOS)
+                if thumbnail is not None:
+                    img = Image.fromarray(thumbnail, "RGBA")
+                else:
+                    img = Image.open(icon_path)
+                    img = img.resize((24, 24), Image.LANCZOS)
                 qimg = pil_to_qimage(img)
                 pixmap = QPixmap.fromImage(qimg)
                 icon_label.setPixmap(pixmap)
@@ -1721,12 +1995,28 @@ class AutoHekiliGUI(QMainWindow):
     def save_keybindings(self):
         """Save keybindings to configuration."""
         keybindings = {}
+        errors = []
         for spell_name, input_field in self.keybind_inputs.items():
             value = input_field.text().strip()
             if value and value.lower() != "skip":
-                self.spell_info[spell_name]["key"] = value
+                try:
+                    parse_keybinding(value)
+                except ValueError as e:
+                    errors.append(f"{spell_name}: {e}")
+                    continue
                 keybindings[spell_name] = value
         
+        if errors:
+            for error in errors:
+                self.log(f"Invalid keybinding - {error}")
+            QMessageBox.warning(self, "Invalid Keybindings",
+                                "Some keybindings could not be understood:\n\n" + "\n".join(errors))
+            return
+        
+        for spell_name in self.keybind_inputs:
+            self.spell_info[spell_name]["key"] = keybindings.get(spell_name, "")
+        self.key_actions, _ = compile_keybindings(self.spell_info)
+        
         self.config["keybindings"] = keybindings
         self.save_config()
         
@@ -1751,7 +2041,7 @@ class AutoHekiliGUI(QMainWindow):
             # Set region if available
             if "location" in self.config and len(self.config["location"]) >= 2:
                 x, y = self.config["location"]
-                width, height = 50, 50  # Default size
+                width, height = self.config.get("size", [50, 50])  # Default size for older configs
                 self.box_position = (x, y, width, height)
                 self.region_label.setText(f"{x}, {y}, {width}x{height}")
             
@@ -1761,6 +2051,16 @@ class AutoHekiliGUI(QMainWindow):
             
             self.log(f"Loaded existing configuration for {self.config['Class']}")
     
+    def get_capture_regions(self):
+        """Named capture regions for the primary icon and the configured Hekili queue."""
+        return build_capture_regions(
+            self.box_position,
+            self.queue_length_spin.value(),
+            self.queue_size_spin.value(),
+            self.queue_spacing_spin.value(),
+            self.queue_direction_combo.currentText()
+        )
+    
     def update_threshold_label(self):
         """Update the threshold label when slider changes."""
         value = self.threshold_slider.value()
@@ -1801,6 +2101,9 @@ class AutoHekiliGUI(QMainWindow):
         if not self.box_position or not self.spell_info:
             QMessageBox.warning(self, "Error", "Please configure class and screen region first.")
             return
+        if not spell_to_test:
+            QMessageBox.warning(self, "Error", "Please pick a spell to test.")
+            return
         
         # Clear previous logs related to testing
         self.log("----------------")
@@ -1817,6 +2120,42 @@ class AutoHekiliGUI(QMainWindow):
         self.test_thread.image_signal.connect(self.update_preview)
         self.test_thread.start()
     
+    def profile_capture_thread(self):
+        """Sample the running capture thread for the chosen number of seconds."""
+        if not self.capture_thread or not self.capture_thread.running or self.capture_thread.thread_ident is None:
+            QMessageBox.warning(self, "Error", "Start automation before profiling the capture thread.")
+            return
+        if self.profiler_thread and self.profiler_thread.isRunning():
+            self.log("Profiler is already running")
+            return
+        
+        seconds = self.profile_seconds_spin.value()
+        os.makedirs(DEBUG_DIR, exist_ok=True)
+        output_base = os.path.join(DEBUG_DIR, f"profile_{datetime.datetime.now():%Y%m%d_%H%M%S}")
+        self.log(f"Profiling capture thread for {seconds}s...")
+        
+        self.profiler_thread = ProfilerThread(self.capture_thread.thread_ident, seconds, output_base)
+        self.profiler_thread.update_signal.connect(self.log)
+        self.profiler_thread.finished.connect(lambda: self.profile_btn.setEnabled(True))
+        self.profile_btn.setEnabled(False)
+        self.profiler_thread.start()
+    
+    def get_record_dir(self):
+        """Folder for a new session recording, or None if recording is off."""
+        if not self.record_checkbox.isChecked():
+            return None
+        return os.path.join(DEBUG_DIR, f"recording_{datetime.datetime.now():%Y%m%d_%H%M%S}")
+    
+    def get_icon_index(self, class_spec):
+        """Prebuilt IconIndex of the configured spells, or None to load the icons from disk."""
+        if self.library is None:
+            return None
+        index = self.library.icon_index(class_spec)
+        # Only usable if it covers exactly the spells that are configured
+        if set(index.names) != set(self.spell_info):
+            return None
+        return index
+    
     def toggle_automation(self):
         """Start or stop the automation."""
         if not self.capture_thread or not self.capture_thread.running:
@@ -1825,41 +2164,44 @@ class AutoHekiliGUI(QMainWindow):
                 QMessageBox.warning(self, "Error", "Please configure class, screen region, and keybindings first.")
                 return
             
-            # Check if we have any keybindings configured
-            has_keybindings = False
-            for info in self.spell_info.values():
-                if "key" in info and info["key"]:
-                    has_keybindings = True
-                    break
+            # Compile keybindings up front so the capture loop only looks up actions
+            self.key_actions, keybind_errors = compile_keybindings(self.spell_info)
+            for error in keybind_errors:
+                self.log(f"Ignoring invalid keybinding - {error}")
             
-            if not has_keybindings:
+            if not self.key_actions:
                 QMessageBox.warning(self, "Error", "No keybindings configured. Please set up keybindings first.")
                 return
             
-            # Log problem spells
-            problem_spells = ["storm_elemental", "ascendance"]
-            found_problems = False
             self.log("----------------")
             self.log("Starting automation")
             
-            for problem in problem_spells:
-                for spell_name, info in self.spell_info.items():
-                    if problem.lower() in spell_name.lower():
-                        found_problems = True
-                        self.log(f"Special handling for: {spell_name} (Keybind: {info['key']})")
-            
-            if not found_problems:
-                self.log("Warning: No problem spells (Storm Elemental/Ascendance) found.")
+            calibration = load_calibration(self.config.get("Class", ""))
+            if calibration:
+                self.log(f"Using calibrated thresholds for {len(calibration.get('hash_thresholds', {}))} spells")
             
             # Start capture thread
             self.capture_thread = CaptureThread(
                 self.box_position, 
                 self.spell_info,
-                self.threshold_slider.value()
+                self.threshold_slider.value(),
+                self.key_actions,
+                self.get_capture_regions(),
+                calibration=calibration,
+                icon_index=self.get_icon_index(self.config.get("Class", "")),
+                stabilizer=DecisionStabilizer(self.smoothing_combo.currentText(), self.smoothing_window_spin.value()),
+                record_dir=self.get_record_dir()
             )
             self.capture_thread.update_signal.connect(self.log)
             self.capture_thread.spell_signal.connect(self.update_current_spell)
+            self.capture_thread.queue_signal.connect(self.update_spell_queue)
             self.capture_thread.image_signal.connect(self.update_live_preview)
+            
+            # Log the spells that need more than a perceptual hash to tell apart
+            for spell_name, strategy in sorted(self.capture_thread.recognizer.strategies.items()):
+                if strategy != STRATEGY_HASH:
+                    self.log(f"Using {strategy} matching for: {spell_name} (Keybind: {self.spell_info[spell_name]['key']})")
+            
             self.capture_thread.start()
             
             # Update UI
@@ -1876,12 +2218,17 @@ class AutoHekiliGUI(QMainWindow):
                 self.start_stop_btn.setText("Start Automation")
                 self.status_label.setText("Not Running")
                 self.current_spell_label.setText("None")
+                self.queue_label.setText("None")
                 self.statusBar().showMessage("Automation stopped")
     
     def update_current_spell(self, spell_name):
         """Update the current spell label."""
         self.current_spell_label.setText(spell_name)
     
+    def update_spell_queue(self, queue):
+        """Update the upcoming spells label from the Hekili queue."""
+        self.queue_label.setText("  →  ".join(spell or "?" for spell in queue) or "None")
+    
     def update_preview(self, qimg):
         """Update the preview label with a QImage."""
         pixmap = QPixmap.fromImage(qimg)
@@ -0,0 +1,237 @@
+"""Offline threshold calibration for AUTO_Hekili spell recognition.
+
+Scores a folder of labelled captures against a class/spec icon set and picks the
+combined hash and template thresholds that give the best F1 score for every spell.
+
+Frames are labelled either by file name, as saved by the capture loop
+(detected_<spell>_<n>.png, test_<spell>.png), or by folder (<frames>/<spell>/*.png).
+Frames in a folder named 'none' are negatives where no spell should be recognised.
+
+Usage:
+    python calibrate_thresholds.py img/Shaman_Elemental debug_captures
+"""
+import argparse
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from recognition import HASH_BITS, SpellRecognizer, preprocess
+
+CALIBRATION_DIR = os.path.join("config", "thresholds")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+NO_SPELL = "none"
+
+# Label pattern of the debug captures written by CaptureThread and SpellTestThread
+CAPTURE_LABEL = re.compile(r"^(?:detected|test)_(.+?)(?:_\d+)?$")
+
+# Recognizer shared by every frame scored in a worker process
+_worker_recognizer = None
+
+
+def spec_icon_paths(spec_dir):
+    """Spell name -> icon path for every icon in a class/spec folder."""
+    return {
+        os.path.splitext(file)[0]: os.path.join(spec_dir, file)
+        for file in sorted(os.listdir(spec_dir))
+        if file.lower().endswith(IMAGE_EXTENSIONS)
+    }
+
+
+def find_labelled_frames(frames_dir, spell_names):
+    """Return a list of (frame_path, label) for every frame whose label can be worked out."""
+    frames = []
+    for root, _, files in os.walk(frames_dir):
+        folder = os.path.basename(root)
+        for file in sorted(files):
+            if not file.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if root != frames_dir and (folder in spell_names or folder == NO_SPELL):
+                label = folder
+            else:
+                match = CAPTURE_LABEL.match(os.path.splitext(file)[0])
+                if not match or match.group(1) not in spell_names:
+                    continue
+                label = match.group(1)
+            frames.append((os.path.join(root, file), label))
+    return frames
+
+
+def load_calibration(class_spec, calibration_dir=CALIBRATION_DIR):
+    """Load the calibrated thresholds of a class/spec, or None if it has not been calibrated."""
+    path = os.path.join(calibration_dir, f"{class_spec}.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _init_worker(icon_paths):
+    global _worker_recognizer
+    _worker_recognizer = SpellRecognizer.from_spell_info(
+        {name: {"icon_path": path} for name, path in icon_paths.items()}
+    )
+
+
+def _score_frame(frame_path):
+    """Combined hash distances and template scores of one frame against every icon, plus timings."""
+    recognizer = _worker_recognizer
+    with Image.open(frame_path) as img:
+        frame = np.asarray(img.convert("RGB"))
+    
+    start = time.perf_counter()
+    features = preprocess(frame)
+    preprocess_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    distances = recognizer.hash_distances(features)
+    hash_ms = (time.perf_counter() - start) * 1000
+    
+    start = time.perf_counter()
+    template_scores = np.array([recognizer.template_score(features, name) for name in recognizer.index.names])
+    template_ms = (time.perf_counter() - start) * 1000
+    
+    return distances, template_scores, (preprocess_ms, hash_ms, template_ms)
+
+
+def score_frames(icon_paths, frame_paths, workers=None):
+    """Score every frame in parallel, returning (names, distances, template_scores, timings)."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(icon_paths,)) as pool:
+        results = list(pool.map(_score_frame, frame_paths, chunksize=16))
+    
+    _init_worker(icon_paths)
+    names = _worker_recognizer.index.names
+    distances = np.array([r[0] for r in results]).reshape(len(results), len(names))
+    template_scores = np.array([r[1] for r in results]).reshape(len(results), len(names))
+    timings = np.array([r[2] for r in results]).reshape(len(results), 3)
+    return names, distances, template_scores, timings
+
+
+def _f1(tp, fp, fn):
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return precision, recall, f1
+
+
+def best_cutoff(is_positive, predicted, score, cutoffs, higher_is_better):
+    """Pick the cutoff with the best F1 and return (cutoff, precision, recall, f1).
+    
+    When several cutoffs tie, the middle one is used so there is margin on both sides.
+    """
+    results = []
+    for cutoff in cutoffs:
+        passed = predicted & (score >= cutoff if higher_is_better else score < cutoff)
+        tp = int(np.sum(passed & is_positive))
+        fp = int(np.sum(passed & ~is_positive))
+        fn = int(np.sum(is_positive)) - tp
+        results.append((cutoff,) + _f1(tp, fp, fn))
+    
+    best_f1 = max(result[3] for result in results)
+    best = [result for result in results if result[3] == best_f1]
+    return best[len(best) // 2]
+
+
+def calibrate(names, labels, distances, template_scores):
+    """Choose per-spell hash and template thresholds from scored frames."""
+    labels = np.array(labels)
+    nearest = np.argmin(distances, axis=1)
+    strongest = np.argmax(template_scores, axis=1)
+    hash_cutoffs = [round(c, 2) for c in np.arange(1, HASH_BITS // 2 + 0.25, 0.25)]
+    template_cutoffs = [round(c, 2) for c in np.arange(0.3, 1.0, 0.01)]
+    
+    report = {}
+    for col, spell_name in enumerate(names):
+        is_positive = labels == spell_name
+        if not is_positive.any():
+            continue
+        
+        # A spell is recognised by hash when it is the nearest icon and under the threshold
+        threshold, precision, recall, f1 = best_cutoff(
+            is_positive, nearest == col, distances[:, col], hash_cutoffs, higher_is_better=False
+        )
+        t_cutoff, t_precision, t_recall, t_f1 = best_cutoff(
+            is_positive, strongest == col, template_scores[:, col], template_cutoffs, higher_is_better=True
+        )
+        report[spell_name] = {
+            "frames": int(is_positive.sum()),
+            "hash_threshold": threshold,
+            "hash_precision": precision,
+            "hash_recall": recall,
+            "hash_f1": f1,
+            "template_threshold": t_cutoff,
+            "template_precision": t_precision,
+            "template_recall": t_recall,
+            "template_f1": t_f1
+        }
+    return report
+
+
+def timing_summary(timings):
+    """Mean / p50 / p95 milliseconds for each recognition stage."""
+    summary = {}
+    for column, stage in enumerate(("preprocess", "hash", "template")):
+        values = timings[:, column]
+        summary[stage] = {
+            "mean_ms": float(values.mean()) if len(values) else 0.0,
+            "p50_ms": float(np.percentile(values, 50)) if len(values) else 0.0,
+            "p95_ms": float(np.percentile(values, 95)) if len(values) else 0.0
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate AUTO_Hekili recognition thresholds")
+    parser.add_argument("spec_dir", help="Class/spec icon folder, e.g. img/Shaman_Elemental")
+    parser.add_argument("frames_dir", help="Folder of labelled captures")
+    parser.add_argument("-o", "--output", help="Output JSON (default: config/thresholds/<spec>.json)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+    
+    icon_paths = spec_icon_paths(args.spec_dir)
+    frames = find_labelled_frames(args.frames_dir, set(icon_paths))
+    if not frames:
+        print(f"No labelled frames found in {args.frames_dir}")
+        return 1
+    print(f"Scoring {len(frames)} frames against {len(icon_paths)} icons...")
+    
+    start = time.perf_counter()
+    names, distances, template_scores, timings = score_frames(
+        icon_paths, [path for path, _ in frames], args.workers
+    )
+    elapsed = time.perf_counter() - start
+    
+    report = calibrate(names, [label for _, label in frames], distances, template_scores)
+    spec = os.path.basename(os.path.normpath(args.spec_dir))
+    result = {
+        "spec": spec,
+        "frames": len(frames),
+        "elapsed_s": elapsed,
+        "hash_thresholds": {name: r["hash_threshold"] for name, r in report.items()},
+        "template_thresholds": {name: r["template_threshold"] for name, r in report.items()},
+        "spells": report,
+        "timing": timing_summary(timings)
+    }
+    
+    output = args.output or os.path.join(CALIBRATION_DIR, f"{spec}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(result, f, indent=4, sort_keys=True)
+    
+    print(f"{'Spell':<30} {'Frames':>6} {'Hash':>5} {'P':>5} {'R':>5} {'Tmpl':>5} {'P':>5} {'R':>5}")
+    for name, r in sorted(report.items()):
+        print(f"{name:<30} {r['frames']:>6} {r['hash_threshold']:>5.2f} {r['hash_precision']:>5.2f} "
+              f"{r['hash_recall']:>5.2f} {r['template_threshold']:>5.2f} {r['template_precision']:>5.2f} "
+              f"{r['template_recall']:>5.2f}")
+    for stage, stats in result["timing"].items():
+        print(f"{stage:>10}: mean {stats['mean_ms']:.2f} ms, p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms")
+    print(f"Scored {len(frames)} frames in {elapsed:.1f} s, thresholds written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
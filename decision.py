@@ -0,0 +1,69 @@
+"""Temporal smoothing of per-frame recognition results for AUTO_Hekili.
+
+A single frame caught during an icon fade or a GCD swipe can match the wrong
+spell. The stabilizer only reports a spell once it has been seen consistently
+over the last few frames, so the capture loop presses keys on stable
+recommendations only.
+
+Modes:
+    off   - every per-frame match is passed through unchanged
+    vote  - the spell must win a majority of the last `window` frames
+    ema   - an exponential moving average of each spell's confidence must
+            reach `min_confidence` (the span of the average is `window` frames)
+"""
+from collections import Counter, deque
+
+SMOOTHING_MODES = ("off", "vote", "ema")
+
+
+def decision_confidence(candidate):
+    """0..1 confidence of a confirmed candidate, from its template score or hash distance."""
+    if candidate.score is not None:
+        return max(0.0, min(1.0, candidate.score))
+    return candidate.confidence
+
+
+class DecisionStabilizer:
+    """Turns a stream of per-frame matches into stable spell decisions."""
+    
+    def __init__(self, mode="vote", window=3, min_confidence=0.5):
+        if mode not in SMOOTHING_MODES:
+            raise ValueError(f"Unknown smoothing mode: {mode}")
+        self.mode = mode
+        self.window = max(1, window)
+        self.min_votes = self.window // 2 + 1
+        self.alpha = 2.0 / (self.window + 1)
+        self.min_confidence = min_confidence
+        self.reset()
+    
+    def reset(self):
+        """Forget all history, e.g. when automation is paused."""
+        self.history = deque(maxlen=self.window)
+        self.scores = {}
+    
+    def update(self, candidate):
+        """Feed one frame's match (a Candidate or None) and return the stable spell name or None.
+        
+        A spell is only reported on frames where it is also the current match,
+        so a spell that just left the spellbox is never pressed again.
+        """
+        spell_name = candidate.spell_name if candidate else None
+        if self.mode == "off":
+            return spell_name
+        
+        if self.mode == "vote":
+            self.history.append(spell_name)
+            if spell_name is None:
+                return None
+            votes = Counter(self.history)[spell_name]
+            return spell_name if votes >= self.min_votes else None
+        
+        # Exponential moving average of every spell's confidence
+        for name in list(self.scores):
+            self.scores[name] *= 1.0 - self.alpha
+            if self.scores[name] < 1e-3:
+                del self.scores[name]
+        if spell_name is None:
+            return None
+        self.scores[spell_name] = self.scores.get(spell_name, 0.0) + self.alpha * decision_confidence(candidate)
+        return spell_name if self.scores[spell_name] >= self.min_confidence else None
@@ -0,0 +1,168 @@
+"""Memory-mapped recordings of AUTO_Hekili capture sessions.
+
+A recording is a folder holding:
+    frames.raw      - fixed-size RGB frames back to back (uint8, count x height x width x 3)
+    timestamps.raw  - one float64 wall-clock timestamp per frame
+    meta.json       - frame shape, frame count and whether the recording was closed cleanly
+
+Appending a frame is a single copy into the mapped file, and reading one back is
+a view into the mapping with no copy at all. Recordings that were not closed
+(e.g. the process crashed) are still readable up to the last written timestamp.
+"""
+import json
+import os
+import time
+
+import numpy as np
+
+FRAMES_FILE = "frames.raw"
+TIMESTAMPS_FILE = "timestamps.raw"
+META_FILE = "meta.json"
+FORMAT_VERSION = 1
+
+
+def is_recording(path):
+    """Whether a folder is a frame recording."""
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+def _write_meta(path, meta):
+    temp_path = os.path.join(path, META_FILE + ".tmp")
+    with open(temp_path, "w") as f:
+        json.dump(meta, f, indent=4, sort_keys=True)
+    os.replace(temp_path, os.path.join(path, META_FILE))
+
+
+class FrameRecorder:
+    """Appends frames of one fixed shape to a recording folder.
+    
+    The files are preallocated `capacity` frames at a time and grown as needed,
+    so appending never reallocates on every frame.
+    """
+    
+    def __init__(self, path, frame_shape, capacity=1024):
+        self.path = path
+        self.frame_shape = tuple(frame_shape)
+        self.count = 0
+        self.capacity = 0
+        self.frames = None
+        self.timestamps = None
+        os.makedirs(path, exist_ok=True)
+        self.meta = {
+            "version": FORMAT_VERSION,
+            "shape": list(self.frame_shape),
+            "dtype": "uint8",
+            "count": 0,
+            "complete": False,
+            "started": time.time()
+        }
+        _write_meta(path, self.meta)
+        self._grow(capacity)
+    
+    def _grow(self, capacity):
+        """Extend both files to hold `capacity` frames and map them again."""
+        # The old mappings must be released first, Windows cannot resize a mapped file
+        self.flush()
+        self.frames = None
+        self.timestamps = None
+        self._resize(capacity)
+        self.frames = np.memmap(os.path.join(self.path, FRAMES_FILE), dtype=np.uint8, mode="r+",
+                                shape=(capacity,) + self.frame_shape)
+        self.timestamps = np.memmap(os.path.join(self.path, TIMESTAMPS_FILE), dtype=np.float64, mode="r+",
+                                    shape=(capacity,))
+        self.capacity = capacity
+    
+    def _resize(self, frame_count):
+        for name, item_bytes in (
+            (FRAMES_FILE, int(np.prod(self.frame_shape))),
+            (TIMESTAMPS_FILE, 8)
+        ):
+            with open(os.path.join(self.path, name), "ab") as f:
+                f.truncate(frame_count * item_bytes)
+    
+    def append(self, frame, timestamp=None):
+        """Copy one frame into the recording."""
+        if frame.shape != self.frame_shape:
+            raise ValueError(f"Frame shape {frame.shape} does not match recording shape {self.frame_shape}")
+        if self.count == self.capacity:
+            self._grow(self.capacity * 2)
+        np.copyto(self.frames[self.count], frame)
+        # The timestamp is written last, so a readable timestamp means a complete frame
+        self.timestamps[self.count] = timestamp if timestamp is not None else time.time()
+        self.count += 1
+    
+    def flush(self):
+        if self.frames is not None:
+            self.frames.flush()
+            self.timestamps.flush()
+    
+    def close(self):
+        """Trim the preallocated space and mark the recording complete."""
+        if self.frames is None:
+            return
+        self.flush()
+        self.frames = None
+        self.timestamps = None
+        self._resize(self.count)
+        self.meta.update(count=self.count, complete=True)
+        _write_meta(self.path, self.meta)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class FrameReader:
+    """Read-only, zero-copy access to a recording.
+    
+    reader[i] is a view into the mapped file; copy it if it has to outlive the reader.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), "r") as f:
+            self.meta = json.load(f)
+        self.frame_shape = tuple(self.meta["shape"])
+        frame_bytes = int(np.prod(self.frame_shape))
+        
+        frames_path = os.path.join(path, FRAMES_FILE)
+        timestamps_path = os.path.join(path, TIMESTAMPS_FILE)
+        capacity = min(os.path.getsize(frames_path) // frame_bytes, os.path.getsize(timestamps_path) // 8)
+        if capacity == 0:
+            self.frames = np.empty((0,) + self.frame_shape, dtype=np.uint8)
+            self.timestamps = np.empty(0, dtype=np.float64)
+            return
+        
+        timestamps = np.memmap(timestamps_path, dtype=np.float64, mode="r", shape=(capacity,))
+        if self.meta.get("complete"):
+            count = min(self.meta["count"], capacity)
+        else:
+            # Unclosed recording: frames were written up to the first empty timestamp
+            empty = np.flatnonzero(timestamps == 0)
+            count = int(empty[0]) if len(empty) else capacity
+        self.timestamps = timestamps[:count]
+        self.frames = np.memmap(frames_path, dtype=np.uint8, mode="r", shape=(capacity,) + self.frame_shape)[:count]
+    
+    def __len__(self):
+        return len(self.timestamps)
+    
+    def __getitem__(self, i):
+        return self.frames[i]
+    
+    def __iter__(self):
+        return iter(self.frames)
+    
+    def duration(self):
+        """Seconds between the first and last frame."""
+        return float(self.timestamps[-1] - self.timestamps[0]) if len(self) > 1 else 0.0
+    
+    def frames_between(self, start, end):
+        """Frames with start <= timestamp < end, as a view."""
+        first, last = np.searchsorted(self.timestamps, [start, end])
+        return self.frames[first:last]
+    
+    def frame_at(self, timestamp):
+        """Index of the last frame captured at or before timestamp."""
+        return max(0, int(np.searchsorted(self.timestamps, timestamp, side="right")) - 1)
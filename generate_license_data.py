@@ -0,0 +1,258 @@
+"""Fill the license database with synthetic data at production scale.
+
+Generates licenses, hardware IDs, activations and login attempts with
+configurable sizes and distributions, loaded with multi-row INSERTs, so the
+admin panel, the client's license queries and license_load_test.py can be
+benchmarked against a local MySQL that looks like production.
+
+    licenses        creation dates spread over --days, status and term mix
+    hardware_ids    a fraction banned, first seen over --days
+    activations     0..N devices per license from --activations
+    login_attempts  in time order, skewed towards a few busy devices
+
+Rows go into --database (default: auto_hekili_licenses_bench), which is
+created and migrated first, and are added to what is already there.
+Activation counters are kept by the triggers and reconciled at the end.
+
+Usage:
+    python generate_license_data.py --licenses 1000000 --hardware 1500000 --attempts 5000000
+    python generate_license_data.py --licenses 10000 --attempts 50000 --seed 1
+    python generate_license_data.py --database auto_hekili_licenses_staging --licenses 10000
+"""
+import argparse
+import datetime
+import random
+import time
+import uuid
+from array import array
+
+import mysql.connector
+
+import license_db
+from license_db import DB_CONFIG
+from license_manager import initialize_database
+
+BENCH_DATABASE = "auto_hekili_licenses_bench"
+BATCH_SIZE = 1000
+STATUS_MIX = "active=0.85,expired=0.08,inactive=0.04,banned=0.03"
+# Days until expiration, 0 for licenses that never expire
+TERM_MIX = "30=0.3,90=0.3,365=0.3,0=0.1"
+# Devices activated per license
+ACTIVATION_MIX = "0=0.25,1=0.45,2=0.3"
+CLIENT_VERSIONS = ("AUTO_Hekili 1.0", "AUTO_Hekili 1.1", "AUTO_Hekili 1.2")
+BAN_REASONS = ("Key sharing", "Chargeback", "Cracked client", "Too many devices")
+
+
+def parse_mix(text):
+    """'a=0.5,b=0.5' -> (values, weights); numeric values become ints."""
+    values, weights = [], []
+    for part in text.split(","):
+        value, weight = part.split("=")
+        values.append(int(value) if value.strip().lstrip("-").isdigit() else value.strip())
+        weights.append(float(weight))
+    return values, weights
+
+
+def insert_rows(cursor, table, columns, rows):
+    """Insert rows with one multi-row INSERT."""
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    cursor.execute(
+        f"INSERT INTO {table} ({', '.join(columns)}) VALUES " + ", ".join([placeholders] * len(rows)),
+        [value for row in rows for value in row]
+    )
+
+
+class Loader:
+    """Buffers rows of one table and writes them BATCH_SIZE at a time, one commit per batch.
+    
+    insert(cursor, rows) writes a batch; by default a multi-row INSERT of columns.
+    """
+    
+    def __init__(self, conn, table, columns, total, batch_size=BATCH_SIZE, insert=None):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.table = table
+        self.insert = insert or (lambda cursor, rows: insert_rows(cursor, table, columns, rows))
+        self.total = total
+        self.batch_size = batch_size
+        self.rows = []
+        self.written = 0
+        self.started = time.perf_counter()
+        self.reported = self.started
+    
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        if not self.rows:
+            return
+        self.insert(self.cursor, self.rows)
+        self.conn.commit()
+        self.written += len(self.rows)
+        self.rows = []
+        now = time.perf_counter()
+        if now - self.reported >= 5:
+            self.reported = now
+            print(f"  {self.table}: {self.written}/{self.total} ({self.written / (now - self.started):.0f} rows/s)")
+    
+    def close(self):
+        self.flush()
+        self.cursor.close()
+        elapsed = time.perf_counter() - self.started
+        print(f"{self.table}: {self.written} rows in {elapsed:.1f}s ({self.written / elapsed if elapsed else 0:.0f} rows/s)")
+
+
+def random_time(rng, start, span_seconds):
+    return start + datetime.timedelta(seconds=rng.random() * span_seconds)
+
+
+def generate_licenses(conn, rng, count, start, span, status_mix, term_mix, now, batch_size=BATCH_SIZE):
+    statuses, status_weights = status_mix
+    terms, term_weights = term_mix
+    keys = []
+    loader = Loader(conn, "licenses", ("license_key", "status", "creation_date", "expiration_date", "notes"), count,
+                    batch_size)
+    for _ in range(count):
+        key = str(uuid.UUID(int=rng.getrandbits(128), version=4)).upper()
+        created = random_time(rng, start, span)
+        term = rng.choices(terms, term_weights)[0]
+        expires = created + datetime.timedelta(days=term) if term else None
+        status = rng.choices(statuses, status_weights)[0]
+        if status == "active" and expires and expires < now:
+            status = "expired"
+        loader.add((key, status, created, expires, None))
+        keys.append(key)
+    loader.close()
+    return keys
+
+
+def generate_hardware(conn, rng, count, start, span, banned_ratio, batch_size=BATCH_SIZE):
+    hardware_ids = []
+    loader = Loader(conn, "hardware_ids", ("hardware_id", "status", "first_seen", "ban_reason"), count, batch_size)
+    for _ in range(count):
+        hardware_id = uuid.UUID(int=rng.getrandbits(128)).hex
+        if rng.random() < banned_ratio:
+            loader.add((hardware_id, "banned", random_time(rng, start, span), rng.choice(BAN_REASONS)))
+        else:
+            loader.add((hardware_id, "active", random_time(rng, start, span), None))
+        hardware_ids.append(hardware_id)
+    loader.close()
+    return hardware_ids
+
+
+def generate_activations(conn, rng, license_keys, hardware_ids, activation_mix, start, span, illegitimate_ratio, now,
+                         batch_size=BATCH_SIZE):
+    """Returns the activations as parallel (license index, hardware index) arrays."""
+    counts, weights = activation_mix
+    per_license = rng.choices(counts, weights, k=len(license_keys))
+    license_index = array("i")
+    hardware_index = array("i")
+    loader = Loader(conn, "activations",
+                    ("license_key", "hardware_id", "activation_date", "last_verification", "is_legitimate"),
+                    sum(per_license), batch_size)
+    for i, devices in enumerate(per_license):
+        for h in rng.sample(range(len(hardware_ids)), min(devices, len(hardware_ids))):
+            activated = random_time(rng, start, span)
+            verified = min(activated + datetime.timedelta(seconds=rng.random() * span * 0.2), now)
+            loader.add((license_keys[i], hardware_ids[h], activated, verified, rng.random() >= illegitimate_ratio))
+            license_index.append(i)
+            hardware_index.append(h)
+    loader.close()
+    return license_index, hardware_index
+
+
+def generate_attempts(conn, rng, count, license_keys, hardware_ids, activations, start, span,
+                      failed_ratio, stranger_ratio, skew, batch_size=BATCH_SIZE):
+    """Login attempts in time order; most come from activated devices, a few from unknown ones."""
+    license_index, hardware_index = activations
+    loader = Loader(conn, "login_attempts", None, count, batch_size, insert=license_db.insert_login_attempts)
+    mean_gap = span / max(count, 1)
+    when = start
+    for _ in range(count):
+        when += datetime.timedelta(seconds=rng.expovariate(1 / mean_gap))
+        if license_index and rng.random() >= stranger_ratio:
+            # random() ** skew piles up on low indices: a few devices verify far more often
+            a = int(len(license_index) * rng.random() ** skew)
+            license_key, hardware_id = license_keys[license_index[a]], hardware_ids[hardware_index[a]]
+            success = rng.random() >= failed_ratio
+        else:
+            license_key, hardware_id = rng.choice(license_keys), uuid.UUID(int=rng.getrandbits(128)).hex
+            success = False
+        ip_address = f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}"
+        loader.add(license_db.login_attempt_row(license_key, hardware_id, success, ip_address,
+                                                rng.choice(CLIENT_VERSIONS), when))
+    loader.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill the AUTO_Hekili license database with synthetic data")
+    parser.add_argument("--database", default=BENCH_DATABASE,
+                        help=f"Database to create, migrate and fill (default: {BENCH_DATABASE})")
+    parser.add_argument("--licenses", type=int, default=100000, help="Licenses to add (default: 100000)")
+    parser.add_argument("--hardware", type=int, default=150000, help="Hardware IDs to add (default: 150000)")
+    parser.add_argument("--attempts", type=int, default=500000, help="Login attempts to add (default: 500000)")
+    parser.add_argument("--days", type=float, default=365, help="History the rows are spread over (default: 365)")
+    parser.add_argument("--status-mix", type=parse_mix, default=STATUS_MIX,
+                        help=f"License status weights (default: {STATUS_MIX})")
+    parser.add_argument("--term-mix", type=parse_mix, default=TERM_MIX,
+                        help=f"License term in days, 0 = no expiration (default: {TERM_MIX})")
+    parser.add_argument("--activations", type=parse_mix, default=ACTIVATION_MIX,
+                        help=f"Devices activated per license (default: {ACTIVATION_MIX})")
+    parser.add_argument("--banned-hardware", type=float, default=0.01,
+                        help="Fraction of hardware IDs that are banned (default: 0.01)")
+    parser.add_argument("--illegitimate", type=float, default=0.02,
+                        help="Fraction of activations flagged illegitimate (default: 0.02)")
+    parser.add_argument("--failed-attempts", type=float, default=0.05,
+                        help="Fraction of attempts from activated devices that fail (default: 0.05)")
+    parser.add_argument("--strangers", type=float, default=0.03,
+                        help="Fraction of attempts from unknown devices (default: 0.03)")
+    parser.add_argument("--skew", type=float, default=2.0,
+                        help="How strongly attempts concentrate on few devices, 1 = uniform (default: 2.0)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help=f"Rows per INSERT (default: {BATCH_SIZE})")
+    parser.add_argument("--seed", type=int, help="Random seed for a repeatable data set")
+    args = parser.parse_args()
+    if args.attempts and not args.licenses:
+        parser.error("--attempts needs at least one license, --licenses must be > 0")
+        
+    config = dict(DB_CONFIG, database=args.database)
+    # Make sure the schema is current before loading
+    initialize_database(config)
+    
+    rng = random.Random(args.seed)
+    now = datetime.datetime.now().replace(microsecond=0)
+    span = args.days * 86400
+    start = now - datetime.timedelta(seconds=span)
+    
+    conn = mysql.connector.connect(**config)
+    try:
+        # Every generated key is unique by construction and parents are loaded first
+        cursor = conn.cursor()
+        cursor.execute("SET SESSION unique_checks = 0, foreign_key_checks = 0")
+        cursor.close()
+        
+        started = time.perf_counter()
+        license_keys = generate_licenses(conn, rng, args.licenses, start, span, args.status_mix, args.term_mix, now,
+                                         args.batch_size)
+        hardware_ids = generate_hardware(conn, rng, args.hardware, start, span, args.banned_hardware, args.batch_size)
+        activations = generate_activations(conn, rng, license_keys, hardware_ids, args.activations,
+                                           start, span, args.illegitimate, now, args.batch_size)
+        generate_attempts(conn, rng, args.attempts, license_keys, hardware_ids, activations, start, span,
+                          args.failed_attempts, args.strangers, args.skew, args.batch_size)
+        
+        print("Reconciling activation counts...")
+        cursor = conn.cursor()
+        licenses_fixed, hardware_fixed = license_db.reconcile_activation_counts(cursor)
+        conn.commit()
+        cursor.execute("ANALYZE TABLE licenses, hardware_ids, activations, login_attempts")
+        cursor.fetchall()
+        cursor.close()
+        print(f"Fixed activation counts of {licenses_fixed} licenses and {hardware_fixed} hardware IDs")
+        print(f"Done in {time.perf_counter() - started:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
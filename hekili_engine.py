@@ -0,0 +1,470 @@
+"""Headless capture, recognition and dispatch core of AUTO_Hekili.
+
+Nothing here depends on Qt: the GUI's CaptureThread wraps a RecognitionEngine,
+and the same engine can be run from the command line against a frame source to
+print per-frame decisions and timings, e.g. on a build server or under a profiler.
+
+Usage:
+    python hekili_engine.py --frames debug_captures            # replay saved captures, dry run
+    python hekili_engine.py --frames debug_captures/recording_20250101_120000   # replay a recording
+    python hekili_engine.py --frames live --max-frames 500     # live screen, dry run
+    python hekili_engine.py --frames live --press              # live screen, send keys
+    python hekili_engine.py --frames live --profile lag.speedscope.json   # sample where the time goes
+
+Keyboard libraries are only imported when a key is actually pressed or
+validated, so dry runs work on machines without them.
+"""
+import argparse
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+from decision import SMOOTHING_MODES, DecisionStabilizer
+from frame_recording import FrameReader, is_recording
+from recognition import STRATEGY_HASH, SpellRecognizer, preprocess
+from sampling_profiler import SamplingProfiler
+from screen_capture import create_capture_backend
+
+CONFIG_PATH = os.path.join("config", "config.json")
+IMG_DIR = "img"
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Pause after a key press so the same recommendation is not spammed
+PRESS_DELAY = 0.1
+
+# Modifier names accepted in keybindings, mapped to the key name held down while pressing
+MODIFIER_KEYS = {
+    "ctrl": "ctrl",
+    "control": "ctrl",
+    "alt": "alt",
+    "shift": "shift"
+}
+MODIFIER_ORDER = ("ctrl", "alt", "shift")
+
+
+def _key_mapping():
+    """pydirectinput's key table, or None where pydirectinput is unavailable."""
+    try:
+        import pydirectinput
+    except Exception:
+        return None
+    return pydirectinput.KEYBOARD_MAPPING
+
+
+class KeyAction:
+    """A keybinding parsed ahead of time into the modifiers to hold and the key to press."""
+    
+    def __init__(self, modifiers, key, text=""):
+        self.modifiers = tuple(modifiers)
+        self.key = key
+        self.text = text
+    
+    def press(self):
+        """Send the keybinding, holding any modifiers around the key press."""
+        import pydirectinput
+        if not self.modifiers:
+            pydirectinput.press(self.key)
+            return
+        
+        import keyboard
+        for modifier in self.modifiers:
+            keyboard.press(modifier)
+        time.sleep(0.05)  # Small delay to ensure modifiers are registered
+        pydirectinput.press(self.key)
+        time.sleep(0.05)
+        for modifier in reversed(self.modifiers):
+            keyboard.release(modifier)
+    
+    def __repr__(self):
+        return f"KeyAction({'+'.join(self.modifiers + (self.key,))})"
+
+
+def parse_keybinding(key_combo):
+    """Parse a keybinding such as 'ctrl+shift+1' into a KeyAction.
+    
+    Raises ValueError if the binding uses an unknown modifier or key. Key names
+    are only checked against pydirectinput where it is installed.
+    """
+    parts = [part.strip().lower() for part in key_combo.split('+')]
+    if any(not part for part in parts):
+        raise ValueError(f"'{key_combo}' has an empty key")
+    
+    *modifier_parts, key = parts
+    modifiers = set()
+    for part in modifier_parts:
+        if part not in MODIFIER_KEYS:
+            raise ValueError(f"unknown modifier '{part}' in '{key_combo}'")
+        modifier = MODIFIER_KEYS[part]
+        if modifier in modifiers:
+            raise ValueError(f"modifier '{part}' is repeated in '{key_combo}'")
+        modifiers.add(modifier)
+    
+    if key in MODIFIER_KEYS:
+        raise ValueError(f"'{key_combo}' has no key besides modifiers")
+    key_mapping = _key_mapping()
+    if key_mapping is not None and key_mapping.get(key) is None:
+        raise ValueError(f"unknown key '{key}' in '{key_combo}'")
+    
+    ordered = [m for m in MODIFIER_ORDER if m in modifiers]
+    return KeyAction(ordered, key, key_combo)
+
+
+def compile_keybindings(spell_info):
+    """Build the spell -> KeyAction table used by the capture loop.
+    
+    Returns (actions, errors) where errors lists the bindings that could not be parsed.
+    Spells with no binding or 'skip' are left out of the table.
+    """
+    actions = {}
+    errors = []
+    for spell_name, info in spell_info.items():
+        key_combo = (info.get("key") or "").strip()
+        if not key_combo or key_combo.lower() == "skip":
+            continue
+        try:
+            actions[spell_name] = parse_keybinding(key_combo)
+        except ValueError as e:
+            errors.append(f"{spell_name}: {e}")
+    return actions, errors
+
+
+def build_capture_regions(box_position, queue_length=0, queue_icon_size=0, queue_spacing=5, queue_direction="right"):
+    """Build the named capture regions for the primary icon and the Hekili queue.
+    
+    Queued icons are laid out next to the primary icon in the given direction,
+    centred on it. A queue_icon_size of 0 uses the primary icon's size.
+    Returns an ordered dict of name -> (left, top, width, height).
+    """
+    left, top, width, height = box_position
+    regions = {"primary": (left, top, width, height)}
+    size = queue_icon_size or width
+    
+    for i in range(queue_length):
+        if queue_direction == "right":
+            q_left = left + width + queue_spacing + i * (size + queue_spacing)
+            q_top = top + (height - size) // 2
+        elif queue_direction == "left":
+            q_left = left - (i + 1) * (size + queue_spacing)
+            q_top = top + (height - size) // 2
+        elif queue_direction == "down":
+            q_left = left + (width - size) // 2
+            q_top = top + height + queue_spacing + i * (size + queue_spacing)
+        elif queue_direction == "up":
+            q_left = left + (width - size) // 2
+            q_top = top - (i + 1) * (size + queue_spacing)
+        else:
+            raise ValueError(f"Unknown queue direction: {queue_direction}")
+        regions[f"queue_{i + 1}"] = (q_left, q_top, size, size)
+    
+    return regions
+
+
+def regions_bounding_box(regions):
+    """Return the (left, top, right, bottom) box covering every region, for a single grab."""
+    left = min(r[0] for r in regions.values())
+    top = min(r[1] for r in regions.values())
+    right = max(r[0] + r[2] for r in regions.values())
+    bottom = max(r[1] + r[3] for r in regions.values())
+    return left, top, right, bottom
+
+
+class FrameResult:
+    """What the engine decided for one frame.
+    
+    spell is the stable decision (None if nothing is stable yet), candidate the raw
+    per-frame match, changed tells whether spell differs from the previous decision,
+    pressed is the keybinding sent (or that would have been sent in a dry run) and
+    timings holds milliseconds per stage.
+    """
+    
+    def __init__(self, frame_number, candidate, spell, changed, queue, queue_changed, pressed, timings):
+        self.frame_number = frame_number
+        self.candidate = candidate
+        self.spell = spell
+        self.changed = changed
+        self.queue = queue
+        self.queue_changed = queue_changed
+        self.pressed = pressed
+        self.timings = timings
+    
+    def to_dict(self):
+        candidate = self.candidate
+        return {
+            "frame": self.frame_number,
+            "spell": self.spell,
+            "match": candidate.spell_name if candidate else None,
+            "method": candidate.method if candidate else None,
+            "distance": candidate.distance if candidate else None,
+            "queue": self.queue,
+            "pressed": self.pressed,
+            "timings_ms": self.timings
+        }
+
+
+class RecognitionEngine:
+    """Turns grabbed frames into spell decisions and key presses.
+    
+    Frames are RGB arrays covering regions_bounding_box(regions). With dispatch
+    off the engine only reports which keys it would have pressed.
+    """
+    
+    def __init__(self, recognizer, regions, key_actions=None, stabilizer=None, dispatch=True, on_log=None):
+        self.recognizer = recognizer
+        self.regions = regions
+        self.key_actions = key_actions or {}
+        self.stabilizer = stabilizer or DecisionStabilizer("off")
+        self.dispatch = dispatch
+        self.on_log = on_log or (lambda message: None)
+        
+        # All regions are cut out of one grab of their bounding box
+        self.grab_box = regions_bounding_box(regions)
+        left, top = self.grab_box[:2]
+        self.crop_slices = {
+            name: (slice(t - top, t - top + h), slice(l - left, l - left + w))
+            for name, (l, t, w, h) in regions.items()
+        }
+        self.queue_names = [name for name in regions if name != "primary"]
+        self.reset()
+    
+    def reset(self):
+        """Forget the previous decisions, e.g. after automation was paused."""
+        self.frame_number = 0
+        self.last_spell = None
+        self.last_queue = None
+        self.primed_spell = None
+        self.primed_action = None
+        self.stabilizer.reset()
+    
+    def process(self, frame):
+        """Recognise, decide and dispatch for one frame; returns a FrameResult."""
+        timings = {}
+        start = time.perf_counter()
+        
+        # One canonical conversion per frame, shared by every matcher
+        features = preprocess(frame[self.crop_slices["primary"]])
+        mark = time.perf_counter()
+        timings["preprocess"] = (mark - start) * 1000
+        
+        # Always the full ranking: a queued spell that is merely under its threshold
+        # must not win over a nearer, similar-looking icon
+        candidate = self.recognizer.best_match(features)
+        
+        # Noisy single frames (fades, GCD swipe) are held back until the match is stable
+        spell = self.stabilizer.update(candidate)
+        changed = spell is not None and spell != self.last_spell
+        if changed:
+            if candidate.method == STRATEGY_HASH:
+                self.on_log(f"Hash matching found: {spell} (diff: {candidate.distance:.1f})")
+            else:
+                self.on_log(f"{candidate.method.capitalize()} matching found: {spell} (score: {candidate.score:.2f})")
+            self.last_spell = spell
+        timings["match"] = (time.perf_counter() - mark) * 1000
+        mark = time.perf_counter()
+        
+        pressed = None
+        # The keybinding of the spell queued last frame is already looked up
+        if spell and spell == self.primed_spell:
+            action = self.primed_action
+        else:
+            action = self.key_actions.get(spell) if spell else None
+        if action:
+            pressed = action.text
+            if self.dispatch:
+                action.press()
+                time.sleep(PRESS_DELAY)  # Small delay to prevent key spamming
+        timings["dispatch"] = (time.perf_counter() - mark) * 1000
+        mark = time.perf_counter()
+        
+        # Read the upcoming recommendations from the same grab
+        queue = []
+        queue_changed = False
+        if self.queue_names:
+            # All queue slots are ranked together in one pass
+            queue_features = [preprocess(frame[self.crop_slices[name]]) for name in self.queue_names]
+            for slot_features, candidates in zip(queue_features, self.recognizer.rank_many(queue_features)):
+                match = self.recognizer.match(slot_features, candidates)
+                queue.append(match.spell_name if match else None)
+            self.primed_spell = queue[0]
+            self.primed_action = self.key_actions.get(queue[0]) if queue[0] else None
+            queue_changed = queue != self.last_queue
+            self.last_queue = queue
+        timings["queue"] = (time.perf_counter() - mark) * 1000
+        timings["total"] = (time.perf_counter() - start) * 1000
+        
+        result = FrameResult(self.frame_number, candidate, spell, changed, queue, queue_changed, pressed, timings)
+        self.frame_number += 1
+        return result
+
+
+def live_frames(grab_box, backend="auto", interval=0.05):
+    """Yield frames grabbed from the screen, one every `interval` seconds."""
+    with create_capture_backend(backend) as capture:
+        while True:
+            yield capture.grab(grab_box)
+            time.sleep(interval)
+
+
+def _natural_key(path):
+    return [int(part) if part.isdigit() else part for part in re.split(r"(\d+)", os.path.basename(path))]
+
+
+def directory_frames(frames_dir):
+    """Yield every image in a folder as an RGB array, in natural file name order.
+    
+    The images must cover the engine's grab box, as the capture_*.png files saved
+    by the capture loop do.
+    """
+    paths = [
+        os.path.join(frames_dir, file) for file in os.listdir(frames_dir)
+        if file.lower().endswith(IMAGE_EXTENSIONS)
+    ]
+    for path in sorted(paths, key=_natural_key):
+        with Image.open(path) as img:
+            yield np.asarray(img.convert("RGB"))
+
+
+def open_frame_source(source, grab_box, backend="auto"):
+    """Frame iterator for 'live', a frame recording or a folder of saved frames."""
+    if source == "live":
+        return live_frames(grab_box, backend)
+    if is_recording(source):
+        # Frames are views into the mapped recording, nothing is decoded or copied
+        return iter(FrameReader(source))
+    if os.path.isdir(source):
+        return directory_frames(source)
+    raise ValueError(f"Unknown frame source: {source}")
+
+
+def summarize_timings(results):
+    """Mean / p50 / p95 milliseconds for each engine stage over a run."""
+    summary = {}
+    if not results:
+        return summary
+    for stage in results[0].timings:
+        values = np.array([result.timings[stage] for result in results])
+        summary[stage] = {
+            "mean_ms": float(values.mean()),
+            "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95))
+        }
+    return summary
+
+
+def load_config(config_path=CONFIG_PATH):
+    try:
+        with open(config_path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the AUTO_Hekili recognition engine without the GUI")
+    parser.add_argument("--config", default=CONFIG_PATH, help=f"GUI config to read (default: {CONFIG_PATH})")
+    parser.add_argument("--frames", default="live",
+                        help="'live', a frame recording or a folder of saved frames (default: live)")
+    parser.add_argument("--spec", help="Class/spec icon folder (default: img/<Class> from the config)")
+    parser.add_argument("--region", type=int, nargs=4, metavar=("LEFT", "TOP", "WIDTH", "HEIGHT"),
+                        help="Spellbox region (default: from the config)")
+    parser.add_argument("--threshold", type=int, default=15, help="Hash distance threshold (default: 15)")
+    parser.add_argument("--smoothing", choices=SMOOTHING_MODES, help="Smoothing mode (default: from the config)")
+    parser.add_argument("--window", type=int, help="Smoothing window in frames (default: from the config)")
+    parser.add_argument("--backend", default="auto", help="Capture backend for live frames (default: auto)")
+    parser.add_argument("--max-frames", type=int, default=0, help="Stop after this many frames (default: no limit)")
+    parser.add_argument("--press", action="store_true", help="Actually send key presses instead of a dry run")
+    parser.add_argument("--json", action="store_true", help="Print one JSON object per frame")
+    parser.add_argument("--profile", metavar="PATH",
+                        help="Sample the engine loop and write a speedscope (.json) or collapsed-stack profile")
+    args = parser.parse_args()
+    
+    config = load_config(args.config)
+    spec_dir = args.spec or os.path.join(IMG_DIR, config.get("Class", ""))
+    if not os.path.isdir(spec_dir):
+        parser.error(f"icon folder not found: {spec_dir}")
+    
+    if args.region:
+        box_position = tuple(args.region)
+    elif "location" in config:
+        box_position = tuple(config["location"]) + tuple(config.get("size", [50, 50]))
+    elif os.path.isdir(args.frames):
+        # Without a configured region, each saved frame is taken to be just the spellbox
+        first_frame = next(open_frame_source(args.frames, None), None)
+        if first_frame is None:
+            parser.error(f"no frames found in {args.frames}")
+        box_position = (0, 0, first_frame.shape[1], first_frame.shape[0])
+    else:
+        parser.error("no spellbox region configured, pass --region")
+    
+    regions = build_capture_regions(
+        box_position,
+        config.get("queue_length", 0),
+        config.get("queue_icon_size", 0),
+        config.get("queue_spacing", 5),
+        config.get("queue_direction", "right")
+    )
+    
+    keybindings = config.get("keybindings", {})
+    spell_info = {
+        os.path.splitext(file)[0]: {
+            "icon_path": os.path.join(spec_dir, file),
+            "key": keybindings.get(os.path.splitext(file)[0], "")
+        }
+        for file in sorted(os.listdir(spec_dir)) if file.lower().endswith(IMAGE_EXTENSIONS)
+    }
+    key_actions, errors = compile_keybindings(spell_info)
+    for error in errors:
+        print(f"Ignoring invalid keybinding - {error}")
+    
+    engine = RecognitionEngine(
+        SpellRecognizer.from_spell_info(spell_info, threshold=args.threshold),
+        regions,
+        key_actions,
+        DecisionStabilizer(args.smoothing or config.get("smoothing", "vote"),
+                           args.window or config.get("smoothing_window", 3)),
+        dispatch=args.press,
+        on_log=None if args.json else print
+    )
+    
+    profiler = SamplingProfiler(threading.get_ident()).start() if args.profile else None
+    results = []
+    try:
+        for frame in open_frame_source(args.frames, engine.grab_box, args.backend):
+            result = engine.process(frame)
+            results.append(result)
+            if args.json:
+                print(json.dumps(result.to_dict()))
+            else:
+                match = result.candidate.spell_name if result.candidate else "-"
+                queue = ",".join(spell or "-" for spell in result.queue)
+                print(f"{result.frame_number:>6} {result.spell or '-':<25} match={match:<25} "
+                      f"queue={queue or '-'} pressed={result.pressed or '-'} {result.timings['total']:.2f} ms")
+            if args.max_frames and len(results) >= args.max_frames:
+                break
+    except KeyboardInterrupt:
+        pass
+    
+    if profiler:
+        profiler.stop()
+        if args.profile.endswith(".json"):
+            profiler.write_speedscope(args.profile, name="hekili_engine")
+        else:
+            profiler.write_collapsed(args.profile)
+        if not args.json:
+            print(f"Profile with {profiler.sample_count()} samples written to {args.profile}")
+    
+    summary = summarize_timings(results)
+    if args.json:
+        print(json.dumps({"frames": len(results), "timings": summary}))
+    else:
+        for stage, stats in summary.items():
+            print(f"{stage:>10}: mean {stats['mean_ms']:.2f} ms, p50 {stats['p50_ms']:.2f} ms, p95 {stats['p95_ms']:.2f} ms")
+        print(f"{len(results)} frames, {sum(1 for r in results if r.pressed)} key presses"
+              f"{'' if args.press else ' (dry run)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""Combined icon index for the whole AUTO_Hekili icon library.
+
+Every icon under img/<class_spec>/ is reduced to its canonical array, packed
+hash row and keybinding thumbnail once, by a pool of workers, and the result
+is stored in a single .npz file. Later runs only rehash icons that were
+added or changed, so switching specs in the GUI needs no image decoding.
+
+Run directly to (re)build the index:
+    python icon_index.py --img-dir img -j 8
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from recognition import CANONICAL_SIZE, HASH_KINDS, IconIndex, preprocess
+
+INDEX_PATH = os.path.join("config", "icon_index.npz")
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+# Side length of the thumbnails shown next to each keybinding
+THUMBNAIL_SIZE = 24
+
+
+def scan_spec(spec_dir):
+    """Return {icon_path: (spell_name, mtime)} for every icon in one class/spec folder."""
+    icons = {}
+    if not os.path.isdir(spec_dir):
+        return icons
+    for entry in os.scandir(spec_dir):
+        if entry.is_file() and entry.name.endswith(IMAGE_EXTENSIONS):
+            icons[entry.path] = (os.path.splitext(entry.name)[0], entry.stat().st_mtime)
+    return icons
+
+
+def scan_library(img_dir):
+    """Return {icon_path: (class_spec, spell_name, mtime)} for every icon in the library."""
+    icons = {}
+    if not os.path.exists(img_dir):
+        return icons
+    for spec_entry in os.scandir(img_dir):
+        if not spec_entry.is_dir():
+            continue
+        for icon_path, (spell_name, mtime) in scan_spec(spec_entry.path).items():
+            icons[icon_path] = (spec_entry.name, spell_name, mtime)
+    return icons
+
+
+def index_icon(icon_path):
+    """Canonical array, packed hash row and RGBA thumbnail of one icon."""
+    with Image.open(icon_path) as img:
+        features = preprocess(img)
+        thumbnail = np.asarray(img.convert("RGBA").resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS))
+    return features.canonical, features.hashes, thumbnail
+
+
+class LibraryIndex:
+    """Canonical arrays, hashes and thumbnails of every icon in the library."""
+    
+    def __init__(self, paths, specs, spell_names, mtimes, canonicals, hashes, thumbnails):
+        self.paths = list(paths)
+        self.specs = list(specs)
+        self.spell_names = list(spell_names)
+        self.mtimes = np.asarray(mtimes, dtype=np.float64)
+        self.canonicals = np.asarray(canonicals, dtype=np.float32).reshape(-1, CANONICAL_SIZE, CANONICAL_SIZE)
+        self.hashes = np.asarray(hashes, dtype=np.uint64).reshape(-1, len(HASH_KINDS))
+        self.thumbnails = np.asarray(thumbnails, dtype=np.uint8).reshape(-1, THUMBNAIL_SIZE, THUMBNAIL_SIZE, 4)
+        self.rows = {path: i for i, path in enumerate(self.paths)}
+        self._icon_indexes = {}
+    
+    def __len__(self):
+        return len(self.paths)
+    
+    def class_specs(self):
+        """Every class/spec that has at least one icon."""
+        return sorted(set(self.specs))
+    
+    def spec_rows(self, class_spec):
+        return [i for i, spec in enumerate(self.specs) if spec == class_spec]
+    
+    def spell_paths(self, class_spec):
+        """Spell name -> icon path for one class/spec."""
+        return {self.spell_names[i]: self.paths[i] for i in self.spec_rows(class_spec)}
+    
+    def thumbnail(self, icon_path):
+        """RGBA thumbnail array of an icon, or None if it is not indexed."""
+        row = self.rows.get(icon_path)
+        return None if row is None else self.thumbnails[row]
+    
+    def icon_index(self, class_spec):
+        """IconIndex of one class/spec, built from the stored arrays and cached."""
+        if class_spec not in self._icon_indexes:
+            rows = self.spec_rows(class_spec)
+            self._icon_indexes[class_spec] = IconIndex(
+                [self.spell_names[i] for i in rows],
+                self.canonicals[rows],
+                self.hashes[rows]
+            )
+        return self._icon_indexes[class_spec]
+    
+    def is_fresh(self, icons):
+        """Whether the index matches a scan_library() result exactly."""
+        if len(icons) != len(self.paths):
+            return False
+        return all(
+            path in icons and icons[path][2] == self.mtimes[row]
+            for path, row in self.rows.items()
+        )
+    
+    def save(self, index_path=INDEX_PATH):
+        os.makedirs(os.path.dirname(index_path) or ".", exist_ok=True)
+        # Write to a temporary file first so a crash never leaves a truncated index behind
+        temp_path = index_path + ".tmp.npz"
+        np.savez(
+            temp_path,
+            paths=np.array(self.paths, dtype=str),
+            specs=np.array(self.specs, dtype=str),
+            spell_names=np.array(self.spell_names, dtype=str),
+            mtimes=self.mtimes,
+            canonicals=self.canonicals,
+            hash_kinds=np.array(HASH_KINDS, dtype=str),
+            hashes=self.hashes,
+            thumbnails=self.thumbnails
+        )
+        os.replace(temp_path, index_path)
+    
+    @classmethod
+    def load(cls, index_path=INDEX_PATH):
+        with np.load(index_path) as data:
+            if tuple(data["hash_kinds"].tolist()) != HASH_KINDS:
+                raise ValueError("index was built with different hash kinds")
+            return cls(
+                data["paths"].tolist(),
+                data["specs"].tolist(),
+                data["spell_names"].tolist(),
+                data["mtimes"],
+                data["canonicals"],
+                data["hashes"],
+                data["thumbnails"]
+            )
+
+
+def build_library_index(img_dir, previous=None, workers=None, executor=ProcessPoolExecutor):
+    """Index every icon under img_dir, reusing unchanged entries from a previous index.
+    
+    Changed icons are hashed by an `executor` pool: worker processes for the
+    command line, threads inside the GUI, where spawned workers would import
+    the GUI's entry module again.
+    """
+    icons = scan_library(img_dir)
+    paths = sorted(icons)
+    
+    reused = {}
+    if previous is not None:
+        for path in paths:
+            row = previous.rows.get(path)
+            if row is not None and previous.mtimes[row] == icons[path][2]:
+                reused[path] = (previous.canonicals[row], previous.hashes[row], previous.thumbnails[row])
+    
+    changed = [path for path in paths if path not in reused]
+    results = dict(reused)
+    if changed:
+        if len(changed) == 1:
+            results[changed[0]] = index_icon(changed[0])
+        else:
+            with executor(max_workers=workers) as pool:
+                for path, result in zip(changed, pool.map(index_icon, changed, chunksize=8)):
+                    results[path] = result
+    
+    return LibraryIndex(
+        paths,
+        [icons[path][0] for path in paths],
+        [icons[path][1] for path in paths],
+        [icons[path][2] for path in paths],
+        [results[path][0] for path in paths],
+        [results[path][1] for path in paths],
+        [results[path][2] for path in paths]
+    ), len(changed)
+
+
+def load_library_index(img_dir, index_path=INDEX_PATH, workers=None, executor=ProcessPoolExecutor):
+    """Load the saved index, rehashing and saving it again if any icon changed."""
+    previous = None
+    if os.path.exists(index_path):
+        try:
+            previous = LibraryIndex.load(index_path)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable icon index {index_path}: {e}")
+    
+    if previous is not None and previous.is_fresh(scan_library(img_dir)):
+        return previous
+    
+    library, changed = build_library_index(img_dir, previous, workers, executor)
+    library.save(index_path)
+    logging.info(f"Icon index updated: {changed} of {len(library)} icons hashed")
+    return library
+
+
+class IconWatcher(threading.Thread):
+    """Polls one class/spec folder and rebuilds its IconIndex when icons change.
+    
+    Only added or modified icons are rehashed. Every change produces a complete new
+    IconIndex that is handed to on_change(index, changes), so the consumer can swap
+    it in with a single assignment while the old one is still in use.
+    """
+    
+    def __init__(self, spec_dir, on_change, index=None, interval=1.0, on_error=None):
+        super().__init__(daemon=True)
+        self.spec_dir = spec_dir
+        self.on_change = on_change
+        self.on_error = on_error
+        self.interval = interval
+        self._stop_event = threading.Event()
+        
+        # Seed from the index already in use so nothing is rehashed at startup
+        known = {}
+        if index is not None:
+            known = {name: (index.canonicals[i], index.hashes[i]) for i, name in enumerate(index.names)}
+        self.entries = {}
+        for icon_path, (spell_name, mtime) in scan_spec(spec_dir).items():
+            if spell_name in known:
+                self.entries[icon_path] = (spell_name, mtime) + known[spell_name]
+            else:
+                self._update_entry(icon_path, spell_name, mtime)
+    
+    def _update_entry(self, icon_path, spell_name, mtime):
+        try:
+            canonical, icon_hashes, _ = index_icon(icon_path)
+        except Exception as e:
+            # Usually a file that is still being written; it is retried on the next poll
+            if self.on_error:
+                self.on_error(spell_name, e)
+            return False
+        self.entries[icon_path] = (spell_name, mtime, canonical, icon_hashes)
+        return True
+    
+    def build_index(self):
+        entries = sorted(self.entries.values(), key=lambda entry: entry[0])
+        return IconIndex(
+            [entry[0] for entry in entries],
+            [entry[2] for entry in entries],
+            [entry[3] for entry in entries]
+        )
+    
+    def poll(self):
+        """Check the folder once; returns the list of (change, spell_name) that were applied."""
+        icons = scan_spec(self.spec_dir)
+        changes = []
+        for icon_path in list(self.entries):
+            if icon_path not in icons:
+                changes.append(("removed", self.entries.pop(icon_path)[0]))
+        for icon_path, (spell_name, mtime) in icons.items():
+            entry = self.entries.get(icon_path)
+            if entry is not None and entry[1] == mtime:
+                continue
+            if self._update_entry(icon_path, spell_name, mtime):
+                changes.append(("added" if entry is None else "updated", spell_name))
+        
+        if changes:
+            self.on_change(self.build_index(), changes)
+        return changes
+    
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                logging.error(f"Error watching {self.spec_dir}: {e}")
+    
+    def stop(self):
+        self._stop_event.set()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the AUTO_Hekili icon library index")
+    parser.add_argument("--img-dir", default="img", help="Icon library folder (default: img)")
+    parser.add_argument("-o", "--output", default=INDEX_PATH, help=f"Index file (default: {INDEX_PATH})")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Rehash every icon instead of only changed ones")
+    args = parser.parse_args()
+    
+    previous = None
+    if not args.force and os.path.exists(args.output):
+        try:
+            previous = LibraryIndex.load(args.output)
+        except Exception as e:
+            print(f"Rebuilding unreadable index {args.output}: {e}")
+    
+    start = time.perf_counter()
+    library, changed = build_library_index(args.img_dir, previous, args.workers)
+    library.save(args.output)
+    elapsed = time.perf_counter() - start
+    print(f"Indexed {len(library)} icons in {len(library.class_specs())} specs "
+          f"({changed} hashed) in {elapsed:.2f} s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
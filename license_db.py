@@ -0,0 +1,863 @@
+"""License database queries shared by the desktop client, the licensing service and tools.
+
+Every statement of the license flow lives here once, so the direct MySQL client
+(main.DatabaseManager), license_service.py and the load test all run exactly
+the same queries. The helpers take an open cursor created with dictionary=True
+and leave committing to the caller.
+"""
+import atexit
+import datetime
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import mysql.connector
+from mysql.connector import pooling
+
+# Database connection settings - match the ones from license_manager.py
+DB_CONFIG = {
+    'host': '127.0.0.1',
+    'database': 'auto_hekili_licenses',
+    'user': 'root',
+    'password': 'ascent',
+    'port': 3306,
+    'connection_timeout': 10
+}
+
+# Statements slower than this many milliseconds are logged with their EXPLAIN plan
+SLOW_QUERY_MS = 100
+SLOW_QUERY_ENV = "AUTO_HEKILI_SLOW_QUERY_MS"
+EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# Devices a single license may be activated on
+ACTIVATION_LIMIT = 2
+
+SELECT_ACTIVE_LICENSE = """
+    SELECT * FROM licenses
+    WHERE license_key = %s AND status = 'active'
+"""
+SELECT_LICENSE = "SELECT * FROM licenses WHERE license_key = %s"
+SELECT_HARDWARE_STATUS = """
+    SELECT status, ban_reason FROM hardware_ids
+    WHERE hardware_id = %s
+"""
+SELECT_HARDWARE_ID = "SELECT * FROM hardware_ids WHERE hardware_id = %s"
+SELECT_BANNED_HARDWARE = """
+    SELECT hardware_id, ban_reason, updated_at FROM hardware_ids
+    WHERE status = 'banned'
+"""
+# Both directions, so unbans are seen too
+SELECT_HARDWARE_CHANGES = """
+    SELECT hardware_id, status, ban_reason, updated_at FROM hardware_ids
+    WHERE updated_at >= %s
+"""
+INSERT_HARDWARE_ID = """
+    INSERT INTO hardware_ids (hardware_id)
+    VALUES (%s)
+"""
+# licenses.activation_count is maintained by the activations triggers
+SELECT_ACTIVATION_COUNT = """
+    SELECT activation_count as count FROM licenses
+    WHERE license_key = %s
+"""
+SELECT_ACTIVATION = """
+    SELECT * FROM activations
+    WHERE license_key = %s AND hardware_id = %s
+"""
+UPDATE_LAST_VERIFICATION = """
+    UPDATE activations
+    SET last_verification = %s
+    WHERE license_key = %s AND hardware_id = %s
+"""
+INSERT_ACTIVATION = """
+    INSERT INTO activations
+    (license_key, hardware_id)
+    VALUES (%s, %s)
+"""
+# Login attempts carry their own timestamp, they may be written a while after they happened
+INSERT_LOGIN_ATTEMPTS = """
+    INSERT INTO login_attempts
+    (license_key, hardware_id, success, ip_address, client_info, timestamp)
+    VALUES {}
+"""
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker is open, the call was not attempted."""
+    pass
+
+
+class CircuitBreaker:
+    """Fails fast while a backend is down instead of waiting for a timeout on every call.
+    
+    closed     - calls go through; `failure_threshold` consecutive failures open the circuit
+    open       - calls are refused until the backoff delay has passed
+    half_open  - one probe call is let through; success closes the circuit,
+                 failure opens it again with the delay doubled (up to max_delay)
+    
+    Delays are jittered so that many clients do not all probe at the same moment.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name, failure_threshold=1, base_delay=5.0, max_delay=120.0, jitter=0.3, probe_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.probe_timeout = probe_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.open_count = 0
+        self.retry_at = 0.0
+        self.probe_started = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.rejected = 0
+        self.transitions = []
+        self._lock = threading.Lock()
+    
+    def _set_state(self, state):
+        if state != self.state:
+            logging.warning(f"Circuit '{self.name}': {self.state} -> {state}")
+            self.transitions.append((time.time(), state))
+            del self.transitions[:-20]
+            self.state = state
+    
+    def allow(self):
+        """Whether a call may go ahead now; a caller let through must report record_success/record_failure."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.CLOSED:
+                self.calls += 1
+                return True
+            if self.state == self.OPEN and now >= self.retry_at:
+                self._set_state(self.HALF_OPEN)
+                self.probe_started = now
+                self.calls += 1
+                return True
+            if self.state == self.HALF_OPEN and now - self.probe_started >= self.probe_timeout:
+                # The previous probe never reported back
+                self.probe_started = now
+                self.calls += 1
+                return True
+            self.rejected += 1
+            return False
+    
+    def record_success(self):
+        with self._lock:
+            self.consecutive_failures = 0
+            self.open_count = 0
+            self._set_state(self.CLOSED)
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                delay = min(self.max_delay, self.base_delay * 2 ** self.open_count)
+                delay *= 1 + random.uniform(-self.jitter, self.jitter)
+                self.open_count += 1
+                self.retry_at = time.monotonic() + delay
+                self._set_state(self.OPEN)
+    
+    def call(self, action, *args, **kwargs):
+        """Run action through the breaker; raises CircuitOpenError while open."""
+        if not self.allow():
+            raise CircuitOpenError(f"Circuit '{self.name}' is open")
+        try:
+            result = action(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+    
+    def stats(self):
+        return {
+            "name": self.name,
+            "state": self.state,
+            "retry_in": max(0.0, self.retry_at - time.monotonic()) if self.state != self.CLOSED else 0.0,
+            "consecutive_failures": self.consecutive_failures,
+            "calls": self.calls,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "transitions": [(datetime.datetime.fromtimestamp(t).isoformat(), state) for t, state in self.transitions]
+        }
+
+
+# Breaker names shared by every call site in a process
+DB_CIRCUIT = "license-db"
+SERVICE_CIRCUIT = "license-service"
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def circuit_breaker(name, **kwargs):
+    """The process-wide CircuitBreaker for a backend, created on first use.
+    
+    Settings passed for a breaker that already exists must match the ones it was created with.
+    """
+    with _circuit_breakers_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker(name, **kwargs)
+            return _circuit_breakers[name]
+        breaker = _circuit_breakers[name]
+        conflicts = {key: getattr(breaker, key) for key, value in kwargs.items() if getattr(breaker, key) != value}
+        if conflicts:
+            raise ValueError(f"Circuit '{name}' already exists with {conflicts}, cannot reconfigure it with {kwargs}")
+        return breaker
+
+
+@contextmanager
+def direct_connection():
+    """A new MySQL connection that is closed when the block exits."""
+    conn = mysql.connector.connect(**DB_CONFIG)
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+class PoolTimeout(Exception):
+    """No pooled connection became free in time."""
+    pass
+
+
+class ConnectionPool:
+    """MySQLConnectionPool that waits for a free connection instead of failing when exhausted.
+    
+    The connector's pool pings every connection it hands out and reconnects it
+    if the server dropped it while it sat idle (wait_timeout, restarts).
+    """
+    
+    def __init__(self, size=8, timeout=10.0, name="auto_hekili", **config):
+        self.size = size
+        self.timeout = timeout
+        self.pool = pooling.MySQLConnectionPool(pool_name=name, pool_size=size, **(config or DB_CONFIG))
+        self._slots = threading.BoundedSemaphore(size)
+    
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; it goes back to the pool when the block exits."""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"No database connection free after {self.timeout}s")
+        try:
+            conn = self.pool.get_connection()
+        except Exception:
+            self._slots.release()
+            raise
+        try:
+            yield conn
+        finally:
+            try:
+                # Resets the session, which raises if the server dropped the connection meanwhile
+                conn.close()
+            finally:
+                self._slots.release()
+
+
+def slow_query_threshold():
+    """Slow query threshold in seconds, from AUTO_HEKILI_SLOW_QUERY_MS if set."""
+    try:
+        return float(os.environ.get(SLOW_QUERY_ENV, SLOW_QUERY_MS)) / 1000
+    except ValueError:
+        return SLOW_QUERY_MS / 1000
+
+
+def statement_key(statement):
+    """A statement with whitespace collapsed and multi-row VALUES / IN lists folded,
+    so every call of the same query is counted under one key."""
+    statement = " ".join(statement.split())
+    statement = re.sub(r"%s(?:, ?%s)+", "%s, ...", statement)
+    return re.sub(r"\(%s, \.\.\.\)(?:, ?\(%s, \.\.\.\))+", "(%s, ...), ...", statement)
+
+
+class QueryStats:
+    """Latency and row counts per statement, plus a log of the slowest ones with their plans."""
+    
+    def __init__(self, slow_threshold=None, max_slow=50):
+        self.slow_threshold = slow_threshold if slow_threshold is not None else slow_query_threshold()
+        self.statements = {}
+        self.slow = deque(maxlen=max_slow)
+        self.queries = 0
+        self.total_time = 0.0
+        self.slow_count = 0
+        self.started = time.time()
+        self._lock = threading.Lock()
+    
+    def record(self, statement, seconds, rows):
+        key = statement_key(statement)
+        with self._lock:
+            self.queries += 1
+            self.total_time += seconds
+            entry = self.statements.get(key)
+            if entry is None:
+                entry = self.statements[key] = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0}
+            entry["count"] += 1
+            entry["total_ms"] += seconds * 1000
+            entry["max_ms"] = max(entry["max_ms"], seconds * 1000)
+            entry["rows"] += max(rows, 0)
+    
+    def record_slow(self, statement, params, seconds, rows, plan):
+        with self._lock:
+            self.slow_count += 1
+            self.slow.append({
+                "time": datetime.datetime.now().isoformat(),
+                "statement": " ".join(statement.split()),
+                "params": [str(p) for p in params or ()],
+                "ms": seconds * 1000,
+                "rows": rows,
+                "plan": plan
+            })
+        plan_text = "\n".join(
+            "    " + ", ".join(f"{k}={v}" for k, v in row.items() if v is not None) for row in plan or []
+        )
+        logging.warning(f"Slow query ({seconds * 1000:.1f} ms, {rows} rows): {' '.join(statement.split())}"
+                        + (f"\n{plan_text}" if plan_text else ""))
+    
+    def summary(self):
+        """One line for a status bar or log."""
+        with self._lock:
+            if not self.queries:
+                return "No queries"
+            slowest = max(entry["max_ms"] for entry in self.statements.values())
+            return (f"{self.queries} queries, {self.total_time / self.queries * 1000:.1f} ms avg, "
+                    f"max {slowest:.0f} ms, {self.slow_count} slow (>{self.slow_threshold * 1000:.0f} ms)")
+    
+    def to_dict(self):
+        with self._lock:
+            statements = sorted(self.statements.items(), key=lambda item: item[1]["total_ms"], reverse=True)
+            return {
+                "started": datetime.datetime.fromtimestamp(self.started).isoformat(),
+                "queries": self.queries,
+                "total_ms": self.total_time * 1000,
+                "slow_threshold_ms": self.slow_threshold * 1000,
+                "slow_count": self.slow_count,
+                "statements": [
+                    dict(entry, statement=key, mean_ms=entry["total_ms"] / entry["count"])
+                    for key, entry in statements
+                ],
+                "slow": list(self.slow)
+            }
+    
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=4, default=str)
+    
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.slow.clear()
+            self.queries = 0
+            self.total_time = 0.0
+            self.slow_count = 0
+            self.started = time.time()
+
+
+class TimedCursor:
+    """Cursor wrapper that times every statement into a QueryStats.
+    
+    Wrap a buffered cursor, so the time includes fetching the result and the row
+    count is known for SELECTs too. Statements slower than the threshold are
+    explained on a second cursor of the same connection.
+    """
+    
+    def __init__(self, cursor, stats, connection=None):
+        self._cursor = cursor
+        self._stats = stats
+        self._connection = connection
+    
+    def execute(self, statement, params=()):
+        started = time.perf_counter()
+        result = self._cursor.execute(statement, params)
+        self._record(statement, params, time.perf_counter() - started)
+        return result
+    
+    def executemany(self, statement, seq_params):
+        started = time.perf_counter()
+        result = self._cursor.executemany(statement, seq_params)
+        self._record(statement, None, time.perf_counter() - started)
+        return result
+    
+    def _record(self, statement, params, seconds):
+        rows = self._cursor.rowcount
+        self._stats.record(statement, seconds, rows)
+        if seconds >= self._stats.slow_threshold:
+            self._stats.record_slow(statement, params, seconds, rows, self._explain(statement, params))
+    
+    def _explain(self, statement, params):
+        if self._connection is None or params is None or not statement.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        try:
+            cursor = self._connection.cursor(dictionary=True, buffered=True)
+            try:
+                cursor.execute("EXPLAIN " + statement, params)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        except mysql.connector.Error as e:
+            logging.debug(f"Could not explain slow query: {e}")
+            return None
+    
+    def __iter__(self):
+        return iter(self._cursor)
+    
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+# Outcomes of activate()
+ACTIVATED = "activated"
+HARDWARE_BANNED = "hardware_banned"
+LIMIT_REACHED = "limit_reached"
+
+
+def find_active_license(cursor, license_key):
+    """The license row if the key exists and is active, else None."""
+    cursor.execute(SELECT_ACTIVE_LICENSE, (license_key,))
+    return cursor.fetchone()
+
+
+def find_license(cursor, license_key):
+    cursor.execute(SELECT_LICENSE, (license_key,))
+    return cursor.fetchone()
+
+
+def hardware_ban(cursor, hardware_id):
+    """(is_banned, ban_reason) of a hardware ID."""
+    cursor.execute(SELECT_HARDWARE_STATUS, (hardware_id,))
+    result = cursor.fetchone()
+    if result and result['status'] == 'banned':
+        return True, result['ban_reason'] or "No reason provided"
+    return False, None
+
+
+def has_column(cursor, table, column):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+
+def has_index(cursor, table, index):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+        LIMIT 1
+    """, (table, index))
+    return cursor.fetchone() is not None
+
+
+def existing_triggers(cursor, table):
+    cursor.execute("""
+        SELECT TRIGGER_NAME FROM information_schema.TRIGGERS
+        WHERE TRIGGER_SCHEMA = DATABASE() AND EVENT_OBJECT_TABLE = %s
+    """, (table,))
+    return {row['TRIGGER_NAME'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()}
+
+
+# Keep licenses.activation_count and hardware_ids.activation_count in step with activations.
+# The hardware_ids updates leave updated_at alone, it only tracks ban changes.
+ACTIVATION_COUNT_TRIGGERS = {
+    "activations_count_insert": """
+        CREATE TRIGGER activations_count_insert AFTER INSERT ON activations
+        FOR EACH ROW
+        BEGIN
+            UPDATE licenses SET activation_count = activation_count + 1
+            WHERE license_key = NEW.license_key;
+            UPDATE hardware_ids SET activation_count = activation_count + 1, updated_at = updated_at
+            WHERE hardware_id = NEW.hardware_id;
+        END
+    """,
+    "activations_count_delete": """
+        CREATE TRIGGER activations_count_delete AFTER DELETE ON activations
+        FOR EACH ROW
+        BEGIN
+            UPDATE licenses SET activation_count = GREATEST(activation_count - 1, 0)
+            WHERE license_key = OLD.license_key;
+            UPDATE hardware_ids SET activation_count = GREATEST(activation_count - 1, 0), updated_at = updated_at
+            WHERE hardware_id = OLD.hardware_id;
+        END
+    """,
+    "activations_count_update": """
+        CREATE TRIGGER activations_count_update AFTER UPDATE ON activations
+        FOR EACH ROW
+        BEGIN
+            IF NEW.license_key <> OLD.license_key THEN
+                UPDATE licenses SET activation_count = GREATEST(activation_count - 1, 0)
+                WHERE license_key = OLD.license_key;
+                UPDATE licenses SET activation_count = activation_count + 1
+                WHERE license_key = NEW.license_key;
+            END IF;
+            IF NEW.hardware_id <> OLD.hardware_id THEN
+                UPDATE hardware_ids SET activation_count = GREATEST(activation_count - 1, 0), updated_at = updated_at
+                WHERE hardware_id = OLD.hardware_id;
+                UPDATE hardware_ids SET activation_count = activation_count + 1, updated_at = updated_at
+                WHERE hardware_id = NEW.hardware_id;
+            END IF;
+        END
+    """
+}
+
+
+def reconcile_activation_counts(cursor):
+    """Recount activations and fix drifted counters; returns (licenses fixed, hardware IDs fixed).
+    
+    Drift comes from changes the triggers do not see, such as activations removed
+    by ON DELETE CASCADE, which MySQL does not fire triggers for.
+    """
+    cursor.execute("""
+        UPDATE licenses l
+        LEFT JOIN (SELECT license_key, COUNT(*) AS actual FROM activations GROUP BY license_key) a
+            ON a.license_key = l.license_key
+        SET l.activation_count = COALESCE(a.actual, 0)
+        WHERE l.activation_count <> COALESCE(a.actual, 0)
+    """)
+    licenses_fixed = cursor.rowcount
+    cursor.execute("""
+        UPDATE hardware_ids h
+        LEFT JOIN (SELECT hardware_id, COUNT(*) AS actual FROM activations GROUP BY hardware_id) a
+            ON a.hardware_id = h.hardware_id
+        SET h.activation_count = COALESCE(a.actual, 0), h.updated_at = h.updated_at
+        WHERE h.activation_count <> COALESCE(a.actual, 0)
+    """)
+    return licenses_fixed, cursor.rowcount
+
+
+def register_hardware_id(cursor, hardware_id):
+    """Insert the hardware ID if it is new; returns False if it is banned."""
+    cursor.execute(SELECT_HARDWARE_ID, (hardware_id,))
+    result = cursor.fetchone()
+    if not result:
+        cursor.execute(INSERT_HARDWARE_ID, (hardware_id,))
+        return True
+    return result['status'] != 'banned'
+
+
+def activation_count(cursor, license_key, for_update=False):
+    """Activations of a license, from its maintained counter.
+    
+    With for_update the license row stays locked until the transaction ends,
+    so concurrent activations of one license cannot both pass the limit.
+    """
+    cursor.execute(SELECT_ACTIVATION_COUNT + (" FOR UPDATE" if for_update else ""), (license_key,))
+    result = cursor.fetchone()
+    return result['count'] if result else 0
+
+
+def activate(cursor, license_key, hardware_id, limit=ACTIVATION_LIMIT):
+    """Run the activation sequence and return ACTIVATED, HARDWARE_BANNED or LIMIT_REACHED.
+    
+    An existing activation of the same hardware only has its last verification
+    time refreshed. Like the desktop client always has, the limit is checked
+    before that lookup, so a license at its limit is refused even on a device
+    it is already activated on.
+    """
+    if not register_hardware_id(cursor, hardware_id):
+        return HARDWARE_BANNED
+    if activation_count(cursor, license_key, for_update=True) >= limit:
+        return LIMIT_REACHED
+    
+    cursor.execute(SELECT_ACTIVATION, (license_key, hardware_id))
+    if cursor.fetchone():
+        cursor.execute(UPDATE_LAST_VERIFICATION, (datetime.datetime.now(), license_key, hardware_id))
+    else:
+        cursor.execute(INSERT_ACTIVATION, (license_key, hardware_id))
+    return ACTIVATED
+
+
+def login_attempt_row(license_key, hardware_id, success, ip_address, client_info, when=None):
+    client_info_str = str(client_info) if client_info else None
+    return (license_key, hardware_id, bool(success), ip_address, client_info_str, when or datetime.datetime.now())
+
+
+def insert_login_attempts(cursor, rows):
+    """Insert login_attempt_row() tuples with one multi-row INSERT."""
+    if not rows:
+        return
+    placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))
+    cursor.execute(INSERT_LOGIN_ATTEMPTS.format(placeholders), [value for row in rows for value in row])
+
+
+def record_login_attempt(cursor, license_key, hardware_id, success, ip_address, client_info):
+    insert_login_attempts(cursor, [login_attempt_row(license_key, hardware_id, success, ip_address, client_info)])
+
+
+def touch_activations(cursor, pairs, when=None):
+    """Refresh last_verification of many (license_key, hardware_id) pairs in one statement."""
+    if not pairs:
+        return 0
+    when = when or datetime.datetime.now()
+    placeholders = ", ".join(["(%s, %s)"] * len(pairs))
+    params = [when]
+    for license_key, hardware_id in pairs:
+        params.extend((license_key, hardware_id))
+    cursor.execute(
+        f"UPDATE activations SET last_verification = %s "
+        f"WHERE (license_key, hardware_id) IN ({placeholders})",
+        params
+    )
+    return cursor.rowcount
+
+
+def license_to_json(record):
+    """A licenses row with its dates as ISO strings."""
+    if record is None:
+        return None
+    return {
+        key: value.isoformat() if isinstance(value, (datetime.datetime, datetime.date)) else value
+        for key, value in record.items()
+    }
+
+
+class LoginAttemptQueue:
+    """Bounded write-behind buffer for login_attempts rows.
+    
+    Attempts are recorded without touching the database and written as
+    multi-row INSERTs, either by a background thread (start()) every
+    `interval` seconds or once `batch_size` rows are waiting, or by an explicit
+    flush(). When `max_pending` rows are waiting, new attempts are dropped and
+    counted rather than blocking the caller. Pending rows are flushed at exit.
+    
+    With a CircuitBreaker, flushes that need a new connection are skipped while
+    it is open, so neither the flush thread nor exit waits on a dead server.
+    """
+    
+    def __init__(self, connection_factory=direct_connection, max_pending=10000, batch_size=200, interval=1.0,
+                 circuit=None):
+        self.connection_factory = connection_factory
+        self.circuit = circuit
+        self.max_pending = max_pending
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pending = deque()
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        self.write_errors = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        atexit.register(self.close)
+    
+    def put(self, license_key, hardware_id, success, ip_address, client_info):
+        """Queue one attempt; returns False if it was dropped because the queue is full."""
+        row = login_attempt_row(license_key, hardware_id, success, ip_address, client_info)
+        with self._lock:
+            if len(self.pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self.pending.append(row)
+            self.queued += 1
+            full = len(self.pending) >= self.batch_size
+        if full:
+            if self._thread:
+                self._wake.set()
+            else:
+                self.flush()
+        return True
+    
+    def flush(self, connection=None):
+        """Write all pending attempts, on `connection` if given or else on a new one from the factory."""
+        with self._flush_lock:
+            if not self.pending:
+                return 0
+            if connection is None and self.circuit is not None and not self.circuit.allow():
+                return 0
+            with self._lock:
+                rows = list(self.pending)
+                self.pending.clear()
+            try:
+                if connection is not None:
+                    self._write(connection, rows)
+                else:
+                    with self.connection_factory() as conn:
+                        self._write(conn, rows)
+                    if self.circuit is not None:
+                        self.circuit.record_success()
+                return len(rows)
+            except (mysql.connector.Error, PoolTimeout) as e:
+                self.write_errors += 1
+                logging.error(f"Error writing {len(rows)} login attempts: {e}")
+                if connection is None and self.circuit is not None:
+                    self.circuit.record_failure()
+                self._requeue(rows)
+                return 0
+    
+    def _write(self, connection, rows):
+        cursor = connection.cursor()
+        try:
+            for start in range(0, len(rows), self.batch_size):
+                insert_login_attempts(cursor, rows[start:start + self.batch_size])
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cursor.close()
+        self.batches += (len(rows) + self.batch_size - 1) // self.batch_size
+        self.written += len(rows)
+    
+    def _requeue(self, rows):
+        """Put rows that failed to write back in front, dropping what no longer fits."""
+        with self._lock:
+            room = max(0, self.max_pending - len(self.pending))
+            kept = rows[len(rows) - room:] if room < len(rows) else rows
+            self.dropped += len(rows) - len(kept)
+            self.pending.extendleft(reversed(kept))
+    
+    def start(self):
+        """Flush from a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="login-attempts", daemon=True)
+            self._thread.start()
+        return self
+    
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+    
+    def close(self):
+        """Stop the background thread and write what is left."""
+        if self._stop_event.is_set():
+            return
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+        self._thread = None
+        self.flush()
+        if self.pending:
+            logging.warning(f"{len(self.pending)} login attempts could not be written and are lost")
+    
+    def stats(self):
+        return {
+            "pending": len(self.pending),
+            "queued": self.queued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "write_errors": self.write_errors
+        }
+
+
+_NOT_BANNED = object()
+
+
+class HardwareBanCache:
+    """In-memory set of banned hardware IDs, kept current from hardware_ids.updated_at.
+    
+    check() is a dictionary lookup. refresh() only reads rows changed since the
+    newest updated_at it has seen, minus a small overlap for transactions that
+    committed late, and reloads everything every `full_reload_interval`
+    seconds to pick up deleted rows. With start(), a background thread
+    refreshes every `interval` seconds, so new bans show up within seconds.
+    """
+    
+    # Seconds re-read before the watermark on every delta refresh
+    OVERLAP = 5
+    
+    def __init__(self, connection_factory=direct_connection, interval=2.0, full_reload_interval=600.0):
+        self.connection_factory = connection_factory
+        self.interval = interval
+        self.full_reload_interval = full_reload_interval
+        self.banned = {}
+        self.watermark = None
+        self.last_full_reload = 0.0
+        self.last_refresh = None
+        self.refreshes = 0
+        self.full_reloads = 0
+        self.errors = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    def check(self, hardware_id):
+        """(is_banned, ban_reason) from memory."""
+        # A single lookup, the refresh thread may unban the ID between two
+        reason = self.banned.get(hardware_id, _NOT_BANNED)
+        if reason is _NOT_BANNED:
+            return False, None
+        return True, reason or "No reason provided"
+    
+    def refresh(self):
+        """Bring the set up to date; returns False if the database could not be read."""
+        full = self.watermark is None or time.monotonic() - self.last_full_reload >= self.full_reload_interval
+        try:
+            with self.connection_factory() as conn:
+                cursor = conn.cursor(dictionary=True)
+                if full:
+                    cursor.execute(SELECT_BANNED_HARDWARE)
+                else:
+                    cursor.execute(SELECT_HARDWARE_CHANGES, (self.watermark - datetime.timedelta(seconds=self.OVERLAP),))
+                rows = cursor.fetchall()
+                if full:
+                    # The newest change of any row, banned or not, is the next watermark
+                    cursor.execute("SELECT MAX(updated_at) AS newest FROM hardware_ids")
+                    newest = cursor.fetchone()['newest']
+                cursor.close()
+        except (mysql.connector.Error, PoolTimeout) as e:
+            self.errors += 1
+            logging.error(f"Error refreshing hardware bans: {e}")
+            return False
+        
+        if full:
+            # Replaced in one assignment, so check() never sees a half-built set
+            self.banned = {row['hardware_id']: row['ban_reason'] for row in rows}
+            self.watermark = newest or datetime.datetime(1970, 1, 1)
+            self.last_full_reload = time.monotonic()
+            self.full_reloads += 1
+        else:
+            for row in rows:
+                if row['status'] == 'banned':
+                    self.banned[row['hardware_id']] = row['ban_reason']
+                else:
+                    self.banned.pop(row['hardware_id'], None)
+                self.watermark = max(self.watermark, row['updated_at'])
+        self.refreshes += 1
+        self.last_refresh = time.time()
+        return True
+    
+    def start(self):
+        """Load the set now and keep refreshing it from a background thread."""
+        self.refresh()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="hardware-bans", daemon=True)
+            self._thread.start()
+        return self
+    
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.refresh()
+    
+    def stop(self):
+        self._stop_event.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join()
+        self._thread = None
+    
+    def stats(self):
+        return {
+            "banned": len(self.banned),
+            "watermark": self.watermark.isoformat() if self.watermark else None,
+            "last_refresh": self.last_refresh,
+            "refreshes": self.refreshes,
+            "full_reloads": self.full_reloads,
+            "errors": self.errors
+        }
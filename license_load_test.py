@@ -0,0 +1,315 @@
+"""Load test for the license verification flow.
+
+Simulates many AUTO_Hekili clients starting at once. Each simulated launch runs
+the same query sequence as main.main() does through DatabaseManager:
+    connect, hardware ban check                (startup)
+    connect, validate license, activate        (verify_license, new session)
+    hardware ban check, disconnect             (startup again)
+against a local MySQL, or against license_service.py with --service.
+
+Launches are driven by asyncio with a thread pool, --concurrency at a time.
+The report has throughput, latency percentiles per launch and per step, MySQL
+error counts (1205 lock wait timeout, 1213 deadlock, 1040 too many connections,
+...) and the InnoDB row lock counters over the run. --output saves it as JSON
+for comparing schema or query changes.
+
+Usage:
+    python license_load_test.py --launches 2000 --concurrency 100
+    python license_load_test.py --service http://127.0.0.1:8765 --output service.json
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import random
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import mysql.connector
+
+import license_db
+from license_db import DB_CONFIG
+from license_service import LicenseServiceClient, LicenseServiceError
+
+CLIENT_INFO = "AUTO_Hekili load test"
+# Server status counters compared before and after the run
+SERVER_COUNTERS = (
+    "Innodb_row_lock_waits",
+    "Innodb_row_lock_time",
+    "Innodb_row_lock_time_max",
+    "Threads_created",
+    "Aborted_connects",
+    "Connections",
+    "Com_commit"
+)
+ERROR_NAMES = {
+    1040: "too many connections",
+    1205: "lock wait timeout",
+    1213: "deadlock",
+    2003: "cannot connect",
+    2013: "lost connection"
+}
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def latency_summary(values):
+    """Mean and percentiles of a list of seconds, in milliseconds."""
+    values = sorted(values)
+    return {
+        "count": len(values),
+        "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+        "p50_ms": percentile(values, 0.50) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "p99_ms": percentile(values, 0.99) * 1000,
+        "max_ms": values[-1] * 1000 if values else 0.0
+    }
+
+
+def server_status(connection):
+    cursor = connection.cursor()
+    cursor.execute("SHOW GLOBAL STATUS WHERE Variable_name IN ({})".format(", ".join(["%s"] * len(SERVER_COUNTERS))),
+                   SERVER_COUNTERS)
+    status = {name: int(value) for name, value in cursor.fetchall()}
+    cursor.close()
+    return status
+
+
+def load_license_keys(connection, count):
+    cursor = connection.cursor()
+    cursor.execute("SELECT license_key FROM licenses WHERE status = 'active' LIMIT %s", (count,))
+    keys = [row[0] for row in cursor.fetchall()]
+    cursor.close()
+    return keys
+
+
+class Workload:
+    """Picks the license key and hardware ID of every simulated launch.
+    
+    A fraction of launches come from devices never seen before; the rest
+    re-verify one of a fixed set of known devices per license.
+    """
+    
+    def __init__(self, license_keys, devices_per_key=2, new_device_ratio=0.1, seed=None):
+        self.license_keys = license_keys
+        self.new_device_ratio = new_device_ratio
+        self.random = random.Random(seed)
+        self.devices = {
+            key: [uuid.UUID(int=self.random.getrandbits(128)).hex for _ in range(devices_per_key)]
+            for key in license_keys
+        }
+    
+    def next_launch(self):
+        license_key = self.random.choice(self.license_keys)
+        if self.random.random() < self.new_device_ratio:
+            return license_key, uuid.UUID(int=self.random.getrandbits(128)).hex
+        return license_key, self.random.choice(self.devices[license_key])
+
+
+class LaunchResult:
+    def __init__(self):
+        self.steps = {}
+        self.error = None
+        self.total = 0.0
+
+
+class Step:
+    """Times one step of a launch into result.steps."""
+    
+    def __init__(self, result, name):
+        self.result = result
+        self.name = name
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.result.steps[self.name] = time.perf_counter() - self.started
+
+
+def mysql_launch(license_key, hardware_id):
+    """One client startup against MySQL, with DatabaseManager's statements and commits."""
+    result = LaunchResult()
+    started = time.perf_counter()
+    connections = []
+    try:
+        with Step(result, "connect"):
+            startup = mysql.connector.connect(**DB_CONFIG)
+            connections.append(startup)
+        with Step(result, "ban_check"):
+            cursor = startup.cursor(dictionary=True)
+            license_db.hardware_ban(cursor, hardware_id)
+            cursor.close()
+        
+        # verify_license() opens its own session
+        with Step(result, "verify_connect"):
+            verify = mysql.connector.connect(**DB_CONFIG)
+            connections.append(verify)
+        with Step(result, "validate"):
+            cursor = verify.cursor(dictionary=True)
+            valid = license_db.find_active_license(cursor, license_key) is not None
+        if valid:
+            with Step(result, "activate"):
+                outcome = license_db.activate(cursor, license_key, hardware_id)
+                verify.commit()
+        cursor.close()
+        if valid:
+            # DatabaseManager queues the attempt and a background thread writes it in batches
+            with Step(result, "login_attempt"):
+                cursor = verify.cursor()
+                license_db.insert_login_attempts(cursor, [license_db.login_attempt_row(
+                    license_key, hardware_id, outcome == license_db.ACTIVATED, "127.0.0.1", CLIENT_INFO
+                )])
+                verify.commit()
+                cursor.close()
+        
+        with Step(result, "ban_recheck"):
+            cursor = startup.cursor(dictionary=True)
+            license_db.hardware_ban(cursor, hardware_id)
+            cursor.close()
+    except mysql.connector.Error as e:
+        result.error = str(e.errno or "mysql")
+    except Exception as e:
+        result.error = type(e).__name__
+    finally:
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception:
+                pass
+    result.total = time.perf_counter() - started
+    return result
+
+
+def service_launch(client, license_key, hardware_id):
+    """One client startup against the licensing service."""
+    result = LaunchResult()
+    started = time.perf_counter()
+    try:
+        with Step(result, "ban_check"):
+            client.check_hardware_ban(hardware_id)
+        with Step(result, "validate"):
+            valid = client.validate_license(license_key)
+        if valid:
+            with Step(result, "activate"):
+                client.activate_license(license_key, hardware_id, CLIENT_INFO)
+        with Step(result, "ban_recheck"):
+            client.check_hardware_ban(hardware_id)
+    except LicenseServiceError:
+        result.error = "service"
+    result.total = time.perf_counter() - started
+    return result
+
+
+async def run_launches(launch, workload, launches, concurrency):
+    """Run `launches` launches with at most `concurrency` in flight; returns the results in completion order."""
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+    
+    async def one():
+        async with semaphore:
+            license_key, hardware_id = workload.next_launch()
+            results.append(await loop.run_in_executor(None, launch, license_key, hardware_id))
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        loop.set_default_executor(executor)
+        await asyncio.gather(*(one() for _ in range(launches)))
+    return results
+
+
+def build_report(results, duration, before, after, config):
+    succeeded = [r for r in results if r.error is None]
+    errors = Counter(r.error for r in results if r.error is not None)
+    step_names = []
+    for r in results:
+        for name in r.steps:
+            if name not in step_names:
+                step_names.append(name)
+    return {
+        "config": config,
+        "finished": datetime.datetime.now().isoformat(),
+        "launches": len(results),
+        "succeeded": len(succeeded),
+        "failed": len(results) - len(succeeded),
+        "error_rate": (len(results) - len(succeeded)) / len(results) if results else 0.0,
+        "errors": {
+            code: {"count": count, "name": ERROR_NAMES.get(int(code), "") if code.isdigit() else ""}
+            for code, count in errors.most_common()
+        },
+        "duration_s": duration,
+        "throughput_per_s": len(results) / duration if duration else 0.0,
+        "latency": latency_summary([r.total for r in succeeded]),
+        "steps": {name: latency_summary([r.steps[name] for r in succeeded if name in r.steps]) for name in step_names},
+        "server": {name: after[name] - before.get(name, 0) for name in after} if before and after else {}
+    }
+
+
+def print_report(report):
+    latency = report["latency"]
+    print(f"{report['launches']} launches in {report['duration_s']:.1f}s: "
+          f"{report['throughput_per_s']:.1f}/s, {report['failed']} failed ({report['error_rate']:.1%})")
+    print(f"launch latency: p50 {latency['p50_ms']:.1f} ms, p95 {latency['p95_ms']:.1f} ms, "
+          f"p99 {latency['p99_ms']:.1f} ms, max {latency['max_ms']:.1f} ms")
+    for name, stats in report["steps"].items():
+        print(f"  {name:>14}: p50 {stats['p50_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms")
+    for code, error in report["errors"].items():
+        print(f"error {code} {error['name']}: {error['count']}")
+    for name, delta in report["server"].items():
+        print(f"{name}: +{delta}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the AUTO_Hekili license verification flow")
+    parser.add_argument("--launches", type=int, default=1000, help="Simulated client launches (default: 1000)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Launches in flight at once (default: 50)")
+    parser.add_argument("--keys", type=int, default=1000, help="Active license keys to spread launches over (default: 1000)")
+    parser.add_argument("--devices-per-key", type=int, default=2,
+                        help="Known devices per license that re-verify (default: 2)")
+    parser.add_argument("--new-device-ratio", type=float, default=0.1,
+                        help="Fraction of launches from never seen devices (default: 0.1)")
+    parser.add_argument("--service", help="Load test the licensing service at this URL instead of MySQL")
+    parser.add_argument("--seed", type=int, help="Random seed for a repeatable workload")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    args = parser.parse_args()
+    
+    # The key list and server counters always come straight from MySQL
+    admin = mysql.connector.connect(**DB_CONFIG)
+    license_keys = load_license_keys(admin, args.keys)
+    if not license_keys:
+        parser.error("no active license keys in the database")
+    workload = Workload(license_keys, args.devices_per_key, args.new_device_ratio, args.seed)
+    
+    if args.service:
+        client = LicenseServiceClient(args.service)
+        launch = lambda license_key, hardware_id: service_launch(client, license_key, hardware_id)
+    else:
+        launch = mysql_launch
+    
+    print(f"Running {args.launches} launches, {args.concurrency} at a time, "
+          f"against {args.service or 'MySQL ' + DB_CONFIG['host']} ({len(license_keys)} license keys)")
+    before = server_status(admin)
+    started = time.perf_counter()
+    results = asyncio.run(run_launches(launch, workload, args.launches, args.concurrency))
+    duration = time.perf_counter() - started
+    after = server_status(admin)
+    admin.close()
+    
+    config = {key: value for key, value in vars(args).items() if key != "output"}
+    report = build_report(results, duration, before, after, config)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
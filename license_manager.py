@@ -2,229 +2,318 @@ import mysql.connector
 import os
 import sys
 import time
-import signal
 import traceback
 import logging
+import hashlib
 
-class DatabaseTimeoutError(Exception):
-    """Custom exception for database timeout"""
-    pass
+from license_db import (ACTIVATION_COUNT_TRIGGERS, DB_CONFIG, existing_triggers, has_column, has_index,
+                        reconcile_activation_counts)
 
-def timeout_handler(signum, frame):
-    """Handle timeout signal"""
-    raise DatabaseTimeoutError("Database operation timed out after 15 seconds")
+# Named lock so two processes starting at once do not migrate the same database twice
+SCHEMA_LOCK = "auto_hekili_schema"
+SCHEMA_LOCK_TIMEOUT = 60
+# Rows per transaction when backfilling columns of existing tables
+BACKFILL_CHUNK_SIZE = 5000
+# MySQL refuses ALGORITHM=INPLACE / LOCK=NONE for this change
+ONLINE_DDL_NOT_SUPPORTED = (1845, 1846)
 
-def initialize_database():
-    """Set up the initial database schema with timeout handling"""
-    print("Starting database initialization...")
-    logging.info("Starting database initialization...")
+def online_alter(cursor, table, change):
+    """ALTER TABLE without blocking reads and writes, falling back to a plain ALTER where MySQL can't."""
+    try:
+        cursor.execute(f"ALTER TABLE {table} {change}, ALGORITHM=INPLACE, LOCK=NONE")
+    except mysql.connector.Error as e:
+        if e.errno not in ONLINE_DDL_NOT_SUPPORTED:
+            raise
+        logging.warning(f"Online ALTER of {table} not supported ({e.msg}), running a locking ALTER")
+        cursor.execute(f"ALTER TABLE {table} {change}")
+
+def backfill_in_chunks(conn, cursor, table, assignments, chunk_size=BACKFILL_CHUNK_SIZE):
+    """UPDATE table SET assignments in primary key ranges, committing each range.
     
-    # Set timeout for database operations (15 seconds)
-    signal.signal(signal.SIGALRM, timeout_handler)
-    signal.alarm(15)  
+    Row locks are only held for one chunk at a time, so clients keep working
+    while a large table is backfilled.
+    """
+    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+    max_id = cursor.fetchone()[0]
+    updated = 0
+    for start in range(0, max_id, chunk_size):
+        cursor.execute(
+            f"UPDATE {table} SET {assignments} WHERE id > %s AND id <= %s",
+            (start, start + chunk_size)
+        )
+        updated += cursor.rowcount
+        conn.commit()
+    return updated
+
+def create_tables(conn, cursor):
+    """Create all tables; fresh databases get the current columns straight away."""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS licenses (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        license_key VARCHAR(50) UNIQUE NOT NULL,
+        status ENUM('active', 'expired', 'banned', 'inactive') NOT NULL DEFAULT 'active',
+        creation_date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        expiration_date DATETIME NULL,
+        activation_count INT NOT NULL DEFAULT 0,
+        notes TEXT NULL
+    )
+    """)
     
-    conn = None
-    cursor = None
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS hardware_ids (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        hardware_id VARCHAR(50) UNIQUE NOT NULL,
+        status ENUM('active', 'banned') NOT NULL DEFAULT 'active',
+        first_seen DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        ban_reason TEXT NULL,
+        activation_count INT NOT NULL DEFAULT 0,
+        updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+        INDEX idx_hardware_ids_updated_at (updated_at)
+    )
+    """)
     
-    try:
-        print("Connecting to MySQL server...")
-        logging.info("Connecting to MySQL server...")
-        
-        # Step 1: Connect to MySQL without database
-        conn = mysql.connector.connect(
-            host="127.0.0.1",
-            user="root",
-            password="ascent",
-            port=3306,
-            connection_timeout=10
-        )
-        
-        print("MySQL server connection successful")
-        logging.info("MySQL server connection successful")
-        
-        cursor = conn.cursor()
-        
-        # Step 2: Create database if it doesn't exist
-        print("Creating database if needed...")
-        logging.info("Creating database if needed...")
-        cursor.execute("CREATE DATABASE IF NOT EXISTS auto_hekili_licenses")
-        
-        # Close initial connection
-        cursor.close()
-        conn.close()
-        
-        # Step 3: Reconnect with database specified
-        print("Connecting to auto_hekili_licenses database...")
-        logging.info("Connecting to auto_hekili_licenses database...")
-        conn = mysql.connector.connect(
-            host="127.0.0.1",
-            user="root",
-            password="ascent",
-            port=3306,
-            database="auto_hekili_licenses",
-            connection_timeout=10
-        )
-        cursor = conn.cursor()
-        
-        # Step 4: Create licenses table
-        print("Creating licenses table...")
-        logging.info("Creating licenses table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS licenses (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            license_key VARCHAR(50) UNIQUE NOT NULL,
-            status ENUM('active', 'expired', 'banned', 'inactive') NOT NULL DEFAULT 'active',
-            creation_date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            expiration_date DATETIME NULL,
-            notes TEXT NULL
-        )
-        """)
-        
-        # Step 5: Create hardware_ids table
-        print("Creating hardware_ids table...")
-        logging.info("Creating hardware_ids table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS hardware_ids (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            hardware_id VARCHAR(50) UNIQUE NOT NULL,
-            status ENUM('active', 'banned') NOT NULL DEFAULT 'active',
-            first_seen DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            ban_reason TEXT NULL
-        )
-        """)
-        
-        # Step 6: Create activations table
-        print("Creating activations table...")
-        logging.info("Creating activations table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS activations (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            license_key VARCHAR(50) NOT NULL,
-            hardware_id VARCHAR(50) NOT NULL,
-            activation_date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            last_verification DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            is_legitimate BOOLEAN NOT NULL DEFAULT TRUE,
-            UNIQUE(license_key, hardware_id),
-            FOREIGN KEY (license_key) REFERENCES licenses(license_key) ON DELETE CASCADE,
-            FOREIGN KEY (hardware_id) REFERENCES hardware_ids(hardware_id) ON DELETE CASCADE
-        )
-        """)
-        
-        # Step 7: Create login attempts table
-        print("Creating login_attempts table...")
-        logging.info("Creating login_attempts table...")
-        cursor.execute("""
-        CREATE TABLE IF NOT EXISTS login_attempts (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            license_key VARCHAR(50) NOT NULL,
-            hardware_id VARCHAR(50) NOT NULL,
-            timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
-            success BOOLEAN NOT NULL DEFAULT FALSE,
-            ip_address VARCHAR(45) NULL,
-            client_info TEXT NULL
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS activations (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        license_key VARCHAR(50) NOT NULL,
+        hardware_id VARCHAR(50) NOT NULL,
+        activation_date DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        last_verification DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        is_legitimate BOOLEAN NOT NULL DEFAULT TRUE,
+        UNIQUE(license_key, hardware_id),
+        FOREIGN KEY (license_key) REFERENCES licenses(license_key) ON DELETE CASCADE,
+        FOREIGN KEY (hardware_id) REFERENCES hardware_ids(hardware_id) ON DELETE CASCADE
+    )
+    """)
+    
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS login_attempts (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        license_key VARCHAR(50) NOT NULL,
+        hardware_id VARCHAR(50) NOT NULL,
+        timestamp DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        success BOOLEAN NOT NULL DEFAULT FALSE,
+        ip_address VARCHAR(45) NULL,
+        client_info TEXT NULL
+    )
+    """)
+    
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS admin_users (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        username VARCHAR(50) UNIQUE NOT NULL,
+        password_hash VARCHAR(255) NOT NULL,
+        is_active BOOLEAN NOT NULL DEFAULT TRUE,
+        last_login DATETIME NULL
+    )
+    """)
+
+def add_hardware_updated_at(conn, cursor):
+    """Ban checks sync from hardware_ids.updated_at; add it to databases created before it existed."""
+    if not has_column(cursor, "hardware_ids", "updated_at"):
+        # Existing rows get the time of the ALTER, no backfill needed
+        online_alter(cursor, "hardware_ids",
+                     "ADD COLUMN updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+    if not has_index(cursor, "hardware_ids", "idx_hardware_ids_updated_at"):
+        online_alter(cursor, "hardware_ids", "ADD INDEX idx_hardware_ids_updated_at (updated_at)")
+
+def add_activation_counts(conn, cursor):
+    """Activation counters on licenses and hardware_ids, maintained by triggers on activations."""
+    for table in ("licenses", "hardware_ids"):
+        if not has_column(cursor, table, "activation_count"):
+            online_alter(cursor, table, "ADD COLUMN activation_count INT NOT NULL DEFAULT 0")
+    
+    triggers = existing_triggers(cursor, "activations")
+    for name, statement in ACTIVATION_COUNT_TRIGGERS.items():
+        if name not in triggers:
+            cursor.execute(statement)
+    
+    # Counts of activations made before the triggers existed. Run every time, so a backfill
+    # that failed after the columns and triggers were added is redone on the next attempt
+    backfill_in_chunks(conn, cursor, "licenses",
+                       "activation_count = (SELECT COUNT(*) FROM activations a WHERE a.license_key = licenses.license_key)")
+    backfill_in_chunks(conn, cursor, "hardware_ids",
+                       "activation_count = (SELECT COUNT(*) FROM activations a WHERE a.hardware_id = hardware_ids.hardware_id), "
+                       "updated_at = updated_at")
+
+def create_default_admin(conn, cursor):
+    """Default admin user, the password should be changed immediately."""
+    cursor.execute("SELECT COUNT(*) FROM admin_users")
+    if cursor.fetchone()[0] == 0:
+        print("Creating default admin user...")
+        logging.info("Creating default admin user...")
+        admin_password = "admin123"
+        password_hash = hashlib.sha256(admin_password.encode()).hexdigest()
+        cursor.execute(
+            "INSERT INTO admin_users (username, password_hash) VALUES (%s, %s)",
+            ("admin", password_hash)
         )
-        """)
-        
-        # Step 8: Create admin users table
-        print("Creating admin_users table...")
-        logging.info("Creating admin_users table...")
+
+def add_pregenerated_keys(conn, cursor):
+    """Pre-generated license keys for an empty licenses table."""
+    cursor.execute("SELECT COUNT(*) FROM licenses")
+    if cursor.fetchone()[0] > 0:
+        return
+    print("Adding pre-generated license keys...")
+    logging.info("Adding pre-generated license keys...")
+    
+    # Use license keys from your pre-generated list [[1]](https://poe.com/citation?message_id=381808706688&citation=1)
+    valid_keys = [
+        'ZjZKqrBvcfj2K-7i5FtfYg',
+        'b05EP2seekgZOzGfXda83A',
+        '6D9GV2UYhiV_g9CHr7vRHA',
+        'YkZJ0hUavKVrBR14DVKgxQ',
+        'DiPdbOP2cm3m8M5B3325LQ',
+        'D9HJxb-p19kn7mBSFl4SpA',
+        'ajXkWNWX0GHmnffvX5oMRg',
+        'W6nNfwj4IfK8FqHfhvlv8A',
+        'hAqi54L5geoFR5_Z88g1NQ'
+    ]
+    cursor.executemany(
+        "INSERT IGNORE INTO licenses (license_key) VALUES (%s)",
+        [(key,) for key in valid_keys]
+    )
+
+# (version, description, step) in order; only ever append, applied steps are recorded in schema_version.
+# Steps must be safe to run on databases set up before schema_version existed.
+MIGRATIONS = [
+    (1, "Create license tables", create_tables),
+    (2, "Add hardware_ids.updated_at", add_hardware_updated_at),
+    (3, "Add activation counters", add_activation_counts),
+    (4, "Create default admin user", create_default_admin),
+    (5, "Add pre-generated license keys", add_pregenerated_keys)
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def schema_version(cursor):
+    """Highest applied migration, 0 for a database without a schema_version table."""
+    try:
+        cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    except mysql.connector.Error as e:
+        if e.errno == 1146:  # Table doesn't exist
+            return 0
+        raise
+    return cursor.fetchone()[0]
+
+def run_migrations(conn):
+    """Apply the pending migrations under a named lock; returns the versions applied."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (SCHEMA_LOCK, SCHEMA_LOCK_TIMEOUT))
+    if cursor.fetchone()[0] != 1:
+        raise RuntimeError(f"Another process held the schema lock for {SCHEMA_LOCK_TIMEOUT}s")
+    
+    applied = []
+    try:
         cursor.execute("""
-        CREATE TABLE IF NOT EXISTS admin_users (
-            id INT AUTO_INCREMENT PRIMARY KEY,
-            username VARCHAR(50) UNIQUE NOT NULL,
-            password_hash VARCHAR(255) NOT NULL,
-            is_active BOOLEAN NOT NULL DEFAULT TRUE,
-            last_login DATETIME NULL
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INT PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            duration_ms INT NOT NULL DEFAULT 0
         )
         """)
-        
-        # Step 9: Check for admin user
-        print("Checking for admin user...")
-        logging.info("Checking for admin user...")
-        cursor.execute("SELECT COUNT(*) FROM admin_users")
-        if cursor.fetchone()[0] == 0:
-            print("Creating default admin user...")
-            logging.info("Creating default admin user...")
-            import hashlib
-            admin_password = "admin123"
-            password_hash = hashlib.sha256(admin_password.encode()).hexdigest()
+        # Re-read under the lock, another process may have migrated meanwhile
+        current = schema_version(cursor)
+        for version, description, step in MIGRATIONS:
+            if version <= current:
+                continue
+            print(f"Applying schema version {version}: {description}...")
+            logging.info(f"Applying schema version {version}: {description}...")
+            started = time.perf_counter()
+            step(conn, cursor)
             cursor.execute(
-                "INSERT INTO admin_users (username, password_hash) VALUES (%s, %s)",
-                ("admin", password_hash)
+                "INSERT INTO schema_version (version, description, duration_ms) VALUES (%s, %s, %s)",
+                (version, description, int((time.perf_counter() - started) * 1000))
             )
-        
-        conn.commit()
-        
-        # Step 10: Check for license keys
-        print("Checking for license keys...")
-        logging.info("Checking for license keys...")
-        cursor.execute("SELECT COUNT(*) FROM licenses")
-        license_count = cursor.fetchone()[0]
-        
-        # If no license keys exist, add the pre-generated ones
-        if license_count == 0:
-            print("Adding pre-generated license keys...")
-            logging.info("Adding pre-generated license keys...")
-            
-            # Use license keys from your pre-generated list [[1]](https://poe.com/citation?message_id=381808706688&citation=1)
-            valid_keys = [
-                'ZjZKqrBvcfj2K-7i5FtfYg',
-                'b05EP2seekgZOzGfXda83A',
-                '6D9GV2UYhiV_g9CHr7vRHA',
-                'YkZJ0hUavKVrBR14DVKgxQ',
-                'DiPdbOP2cm3m8M5B3325LQ',
-                'D9HJxb-p19kn7mBSFl4SpA',
-                'ajXkWNWX0GHmnffvX5oMRg',
-                'W6nNfwj4IfK8FqHfhvlv8A',
-                'hAqi54L5geoFR5_Z88g1NQ'
-            ]
-            
-            for key in valid_keys:
-                try:
-                    cursor.execute(
-                        "INSERT INTO licenses (license_key) VALUES (%s)",
-                        (key,)
-                    )
-                except mysql.connector.Error as e:
-                    # Just log errors but continue with other keys
-                    print(f"Error adding license key {key}: {e}")
-                    logging.warning(f"Error adding license key {key}: {e}")
-            
             conn.commit()
+            applied.append(version)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (SCHEMA_LOCK,))
+        cursor.fetchone()
+        cursor.close()
+    return applied
+
+def initialize_database(config=DB_CONFIG):
+    """Bring the database schema of config['database'] up to date, creating the database if needed.
+    
+    When it already is, this is one connection and one version query.
+    Otherwise only the pending MIGRATIONS run.
+    """
+    print("Starting database initialization...")
+    logging.info("Starting database initialization...")
+    
+    conn = None
+    cursor = None
+    
+    try:
+        database = config['database']
+        print(f"Connecting to {database} database...")
+        logging.info(f"Connecting to {database} database...")
+        try:
+            conn = mysql.connector.connect(**config)
+        except mysql.connector.Error as e:
+            if e.errno != 1049:  # Unknown database
+                raise
+            print("Creating database...")
+            logging.info("Creating database...")
+            conn = mysql.connector.connect(**{key: value for key, value in config.items() if key != 'database'})
+            cursor = conn.cursor()
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {database}")
+            cursor.execute(f"USE {database}")
+            cursor.close()
+        cursor = conn.cursor()
         
-        print("Database initialization completed successfully!")
-        logging.info("Database initialization completed successfully!")
+        version = schema_version(cursor)
+        if version >= SCHEMA_VERSION:
+            print(f"Database schema is current (version {version})")
+            logging.info(f"Database schema is current (version {version})")
+            return version
         
-    except DatabaseTimeoutError as timeout_err:
-        print(f"Database operation timed out: {timeout_err}")
-        logging.error(f"Database operation timed out: {timeout_err}")
-        if conn:
-            conn.rollback()
-        raise
+        print(f"Upgrading database schema from version {version} to {SCHEMA_VERSION}...")
+        logging.info(f"Upgrading database schema from version {version} to {SCHEMA_VERSION}...")
+        applied = run_migrations(conn)
+        
+        print(f"Database initialization completed successfully! Applied versions: {applied}")
+        logging.info(f"Database initialization completed successfully! Applied versions: {applied}")
+        return SCHEMA_VERSION
+    
     except mysql.connector.Error as db_err:
         print(f"MySQL error: {db_err}")
         logging.error(f"MySQL error: {db_err}")
         logging.error(traceback.format_exc())
-        if conn:
-            conn.rollback()
         raise
     except Exception as e:
         print(f"Unexpected error: {e}")
         logging.error(f"Unexpected error: {e}")
         logging.error(traceback.format_exc())
-        if conn:
-            conn.rollback()
         raise
     finally:
-        # Cancel the timeout alarm
-        signal.alarm(0)
-        
         # Close database connections
         if cursor:
             cursor.close()
         if conn:
             conn.close()
 
+def reconcile_counts(config=DB_CONFIG):
+    """Recount activations and fix drifted activation_count columns.
+    
+    Meant to run on a schedule, e.g. nightly: python license_manager.py --reconcile
+    """
+    conn = mysql.connector.connect(**dict(config, connection_timeout=10))
+    try:
+        cursor = conn.cursor()
+        licenses_fixed, hardware_fixed = reconcile_activation_counts(cursor)
+        conn.commit()
+        cursor.close()
+    finally:
+        conn.close()
+    print(f"Fixed activation counts of {licenses_fixed} licenses and {hardware_fixed} hardware IDs")
+    logging.info(f"Fixed activation counts of {licenses_fixed} licenses and {hardware_fixed} hardware IDs")
+    return licenses_fixed, hardware_fixed
+
 if __name__ == "__main__":
     # Configure logging when run directly
     import logging
@@ -234,7 +323,10 @@ if __name__ == "__main__":
     )
     
     try:
-        initialize_database()
+        if "--reconcile" in sys.argv:
+            reconcile_counts()
+        else:
+            initialize_database()
     except Exception as e:
         print(f"Error initializing database: {e}")
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,462 @@
+"""Licensing service that fronts the license database for all AUTO_Hekili clients.
+
+Instead of every desktop client opening its own MySQL session, clients send
+small JSON requests over HTTP and the service answers them from a shared
+connection pool:
+    POST /validate      {"license_key"}                                 -> {"valid"}
+    POST /activate      {"license_key", "hardware_id", "client_info"}   -> {"activated", "reason"}
+    POST /heartbeat     {"license_key", "hardware_id"}                  -> {"valid", "banned"}
+    POST /hardware_ban  {"hardware_id"}                                 -> {"banned", "reason"}
+    POST /license       {"license_key"}                                 -> {"license"}
+    GET  /health, GET /stats
+
+License lookups are cached for a few seconds, and concurrent lookups of the
+same key share one query. Hardware bans are answered from an in-memory set of
+banned IDs that is refreshed every couple of seconds from
+hardware_ids.updated_at. Heartbeats only refresh last_verification, so they
+are collected and written as one UPDATE per flush interval. Login attempts are
+queued the same way and written as multi-row INSERTs.
+
+Usage:
+    python license_service.py                        # listen on 127.0.0.1:8765
+    python license_service.py --port 9000 --pool-size 16
+
+Clients use the service when AUTO_HEKILI_LICENSE_SERVICE is set, e.g.
+    set AUTO_HEKILI_LICENSE_SERVICE=http://127.0.0.1:8765
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import mysql.connector
+
+import license_db
+from license_db import DB_CONFIG, CircuitOpenError, ConnectionPool, PoolTimeout
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+SERVICE_URL_ENV = "AUTO_HEKILI_LICENSE_SERVICE"
+POOL_SIZE = 8
+# Seconds a license lookup is served from memory
+LICENSE_TTL = 30.0
+# Seconds between refreshes of the banned hardware set
+BAN_REFRESH_INTERVAL = 2.0
+# Heartbeats are written at least this often, or as soon as this many are waiting
+HEARTBEAT_FLUSH_INTERVAL = 1.0
+HEARTBEAT_BATCH_SIZE = 500
+# Login attempts waiting to be written; more are dropped (and counted) instead of queued
+MAX_PENDING_ATTEMPTS = 10000
+MAX_CACHE_ENTRIES = 100000
+# Consecutive database failures before requests are answered with 503 without touching MySQL
+CIRCUIT_FAILURE_THRESHOLD = 5
+
+
+def license_service_url():
+    """URL of the licensing service clients should use, or None to talk to MySQL directly."""
+    return os.environ.get(SERVICE_URL_ENV) or None
+
+
+class TTLCache:
+    """Thread-safe cache whose entries expire after `ttl` seconds.
+    
+    Concurrent misses on the same key wait for the first caller's load
+    instead of all querying the database. None results are not cached, so a
+    key created after a failed lookup is found on the next request.
+    """
+    
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._loading = {}
+        self._lock = threading.Lock()
+    
+    def get_or_load(self, key, loader):
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry[1] > time.monotonic():
+                    self.hits += 1
+                    return entry[0]
+                event = self._loading.get(key)
+                if event is None:
+                    event = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    break
+            # Another thread is loading this key; use its result, or retry if it failed
+            event.wait()
+        
+        try:
+            value = loader()
+            if value is not None:
+                with self._lock:
+                    if len(self._entries) >= MAX_CACHE_ENTRIES:
+                        self._prune()
+                    self._entries[key] = (value, time.monotonic() + self.ttl)
+            return value
+        finally:
+            with self._lock:
+                del self._loading[key]
+            event.set()
+    
+    def _prune(self):
+        now = time.monotonic()
+        for key in [key for key, (_, expires) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+        if len(self._entries) >= MAX_CACHE_ENTRIES:
+            self._entries.clear()
+    
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class HeartbeatBatcher(threading.Thread):
+    """Collects heartbeats and refreshes last_verification for all of them in one UPDATE."""
+    
+    def __init__(self, pool, interval=HEARTBEAT_FLUSH_INTERVAL, batch_size=HEARTBEAT_BATCH_SIZE):
+        super().__init__(name="heartbeat-batcher", daemon=True)
+        self.pool = pool
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pending = set()
+        self.batches = 0
+        self.written = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+    
+    def add(self, license_key, hardware_id):
+        with self._lock:
+            self.pending.add((license_key, hardware_id))
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self._wake.set()
+    
+    def run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+        self.flush()
+    
+    def flush(self):
+        """Write every pending heartbeat; repeated heartbeats of one device are written once."""
+        with self._lock:
+            pairs = list(self.pending)
+            self.pending.clear()
+        for start in range(0, len(pairs), self.batch_size):
+            batch = pairs[start:start + self.batch_size]
+            try:
+                with self.pool.connection() as conn:
+                    cursor = conn.cursor()
+                    license_db.touch_activations(cursor, batch)
+                    conn.commit()
+                    cursor.close()
+                self.batches += 1
+                self.written += len(batch)
+            except (mysql.connector.Error, PoolTimeout) as e:
+                # Heartbeats are best effort, the client sends the next one anyway
+                self.errors += 1
+                logging.error(f"Error writing {len(batch)} heartbeats: {e}")
+    
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+        if self.is_alive():
+            self.join()
+    
+    def stats(self):
+        return {"pending": len(self.pending), "batches": self.batches, "written": self.written, "errors": self.errors}
+
+
+class LicenseService:
+    """License validation, activation and heartbeats over a shared connection pool."""
+    
+    def __init__(self, pool, license_ttl=LICENSE_TTL, ban_refresh_interval=BAN_REFRESH_INTERVAL,
+                 flush_interval=HEARTBEAT_FLUSH_INTERVAL, batch_size=HEARTBEAT_BATCH_SIZE):
+        self.pool = pool
+        self.licenses = TTLCache(license_ttl)
+        self.bans = license_db.HardwareBanCache(pool.connection, ban_refresh_interval)
+        self.heartbeats = HeartbeatBatcher(pool, flush_interval, batch_size)
+        self.attempts = license_db.LoginAttemptQueue(pool.connection, MAX_PENDING_ATTEMPTS, batch_size, flush_interval)
+        self.circuit = license_db.circuit_breaker(license_db.DB_CIRCUIT, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                                                  base_delay=1.0, max_delay=30.0)
+        self.requests = Counter()
+        self.errors = Counter()
+        self.started = time.time()
+        self.heartbeats.start()
+        self.attempts.start()
+        self.bans.start()
+    
+    def _run(self, work, *args, commit=False):
+        """Run work(cursor, *args) on a pooled connection, refused while the database circuit is open."""
+        if not self.circuit.allow():
+            raise CircuitOpenError(f"Circuit '{self.circuit.name}' is open")
+        try:
+            with self.pool.connection() as conn:
+                cursor = conn.cursor(dictionary=True)
+                try:
+                    result = work(cursor, *args)
+                    if commit:
+                        conn.commit()
+                except Exception:
+                    if commit:
+                        conn.rollback()
+                    raise
+                finally:
+                    cursor.close()
+        except Exception:
+            # Any failure, not just a database error, has to resolve a half-open probe
+            self.circuit.record_failure()
+            raise
+        self.circuit.record_success()
+        return result
+    
+    def _active_license(self, license_key):
+        return self.licenses.get_or_load(
+            license_key,
+            lambda: license_db.license_to_json(self._run(license_db.find_active_license, license_key))
+        )
+    
+    def validate(self, license_key):
+        return {"valid": self._active_license(license_key) is not None}
+    
+    def hardware_ban(self, hardware_id):
+        banned, reason = self.bans.check(hardware_id)
+        return {"banned": banned, "reason": reason}
+    
+    def license(self, license_key):
+        return {"license": license_db.license_to_json(self._run(license_db.find_license, license_key))}
+    
+    def activate(self, license_key, hardware_id, client_info=None, ip_address=None):
+        """Activate a license; the attempt is queued for the login_attempts write-behind."""
+        if self._active_license(license_key) is None:
+            return {"activated": False, "reason": "invalid_license"}
+        
+        try:
+            outcome = self._run(license_db.activate, license_key, hardware_id, commit=True)
+        except Exception:
+            self.attempts.put(license_key, hardware_id, False, ip_address, client_info)
+            raise
+        self.attempts.put(license_key, hardware_id, outcome == license_db.ACTIVATED, ip_address, client_info)
+        return {"activated": outcome == license_db.ACTIVATED, "reason": outcome}
+    
+    def heartbeat(self, license_key, hardware_id):
+        """Check a running client's license and queue its last_verification update."""
+        valid = self._active_license(license_key) is not None
+        banned, _ = self.bans.check(hardware_id)
+        if valid and not banned:
+            self.heartbeats.add(license_key, hardware_id)
+        return {"valid": valid and not banned, "banned": banned}
+    
+    def stats(self):
+        return {
+            "uptime": time.time() - self.started,
+            "pool_size": self.pool.size,
+            "requests": dict(self.requests),
+            "errors": dict(self.errors),
+            "circuit": self.circuit.stats(),
+            "license_cache": self.licenses.stats(),
+            "hardware_bans": self.bans.stats(),
+            "heartbeats": self.heartbeats.stats(),
+            "login_attempts": self.attempts.stats()
+        }
+    
+    def close(self):
+        self.bans.stop()
+        self.heartbeats.stop()
+        self.attempts.close()
+
+
+# Endpoint -> (LicenseService method name, required fields, optional fields)
+ROUTES = {
+    "/validate": ("validate", ("license_key",), ()),
+    "/activate": ("activate", ("license_key", "hardware_id"), ("client_info", "ip_address")),
+    "/heartbeat": ("heartbeat", ("license_key", "hardware_id"), ()),
+    "/hardware_ban": ("hardware_ban", ("hardware_id",), ()),
+    "/license": ("license", ("license_key",), ())
+}
+
+
+class LicenseRequestHandler(BaseHTTPRequestHandler):
+    """JSON request handler; the LicenseService is taken from the server."""
+    server_version = "AUTO_Hekili-License/1.0"
+    # Keep-alive, so clients that send several requests reuse one connection
+    protocol_version = "HTTP/1.1"
+    
+    def do_GET(self):
+        if self.path == "/health":
+            self._send_json(200, {"status": "ok"})
+        elif self.path == "/stats":
+            self._send_json(200, self.server.service.stats())
+        else:
+            self._send_json(404, {"error": "not found"})
+    
+    def do_POST(self):
+        service = self.server.service
+        route = ROUTES.get(self.path)
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        if not isinstance(payload, dict):
+            self._send_json(400, {"error": "expected a JSON object"})
+            return
+        if route is None:
+            self._send_json(404, {"error": "not found"})
+            return
+        
+        method, required, optional = route
+        missing = [field for field in required if not payload.get(field)]
+        if missing:
+            self._send_json(400, {"error": f"missing {', '.join(missing)}"})
+            return
+        kwargs = {field: payload[field] for field in required}
+        kwargs.update({field: payload.get(field) for field in optional})
+        if method == "activate" and not kwargs.get("ip_address"):
+            kwargs["ip_address"] = self.client_address[0]
+        
+        service.requests[method] += 1
+        try:
+            self._send_json(200, getattr(service, method)(**kwargs))
+        except (mysql.connector.Error, PoolTimeout, CircuitOpenError) as e:
+            service.errors[method] += 1
+            logging.error(f"{method} failed: {e}")
+            self._send_json(503, {"error": "database unavailable"})
+    
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        logging.debug("%s - %s", self.address_string(), format % args)
+
+
+class LicenseHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default listen backlog of 5 refuses connections during a launch spike
+    request_queue_size = 256
+
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """HTTP server for a LicenseService; port 0 picks a free port (see server.url)."""
+    server = LicenseHTTPServer((host, port), LicenseRequestHandler)
+    server.service = service
+    server.url = f"http://{host}:{server.server_address[1]}"
+    return server
+
+
+def serve_in_background(service, host=DEFAULT_HOST, port=0):
+    """Start a server on a daemon thread, e.g. for local testing; returns the server."""
+    server = create_server(service, host, port)
+    threading.Thread(target=server.serve_forever, name="license-service", daemon=True).start()
+    return server
+
+
+class LicenseServiceError(Exception):
+    """The licensing service could not be reached or could not answer."""
+    pass
+
+
+class LicenseServiceClient:
+    """Client side of the licensing service, used by main.DatabaseManager."""
+    
+    def __init__(self, url, timeout=5.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+    
+    def _request(self, path, payload=None):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise LicenseServiceError(f"{path} returned HTTP {e.code}") from e
+        except (urllib.error.URLError, OSError, ValueError) as e:
+            raise LicenseServiceError(f"{path} failed: {e}") from e
+    
+    def health(self):
+        try:
+            return self._request("/health").get("status") == "ok"
+        except LicenseServiceError:
+            return False
+    
+    def validate_license(self, license_key):
+        return self._request("/validate", {"license_key": license_key})["valid"]
+    
+    def check_hardware_ban(self, hardware_id):
+        result = self._request("/hardware_ban", {"hardware_id": hardware_id})
+        return result["banned"], result["reason"]
+    
+    def activate_license(self, license_key, hardware_id, client_info=None, ip_address=None):
+        result = self._request("/activate", {
+            "license_key": license_key,
+            "hardware_id": hardware_id,
+            "client_info": str(client_info) if client_info else None,
+            "ip_address": ip_address
+        })
+        return result["activated"]
+    
+    def heartbeat(self, license_key, hardware_id):
+        return self._request("/heartbeat", {"license_key": license_key, "hardware_id": hardware_id})["valid"]
+    
+    def license_info(self, license_key):
+        """The license row with ISO date strings, or None if the key does not exist."""
+        return self._request("/license", {"license_key": license_key})["license"]
+    
+    def stats(self):
+        return self._request("/stats")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the AUTO_Hekili licensing service")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"Address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"Port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument("--pool-size", type=int, default=POOL_SIZE,
+                        help=f"MySQL connections shared by all requests (default: {POOL_SIZE})")
+    parser.add_argument("--license-ttl", type=float, default=LICENSE_TTL,
+                        help=f"Seconds a license lookup is cached (default: {LICENSE_TTL})")
+    parser.add_argument("--ban-refresh", type=float, default=BAN_REFRESH_INTERVAL,
+                        help=f"Seconds between hardware ban refreshes (default: {BAN_REFRESH_INTERVAL})")
+    parser.add_argument("--flush-interval", type=float, default=HEARTBEAT_FLUSH_INTERVAL,
+                        help=f"Seconds between heartbeat writes (default: {HEARTBEAT_FLUSH_INTERVAL})")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    
+    pool = ConnectionPool(args.pool_size, name="license_service", **DB_CONFIG)
+    service = LicenseService(pool, args.license_ttl, args.ban_refresh, args.flush_interval)
+    server = create_server(service, args.host, args.port)
+    logging.info(f"Licensing service listening on {server.url} with {args.pool_size} pooled connections")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        # Pending heartbeats and login attempts are written before exiting
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -14,6 +14,10 @@ import webbrowser
 import tempfile
 import socket
 
+import license_db
+from license_db import DB_CONFIG
+from license_service import LicenseServiceClient, LicenseServiceError, license_service_url
+
 # Set up debug file logging with timestamp in filename
 log_dir = "debug_logs"
 os.makedirs(log_dir, exist_ok=True)
@@ -42,20 +46,19 @@ def handle_exception(exc_type, exc_value, exc_traceback):
 
 sys.excepthook = handle_exception
 
-# Database connection settings - match the ones from license_manager.py
-DB_CONFIG = {
-    'host': '127.0.0.1',
-    'database': 'auto_hekili_licenses',
-    'user': 'root',
-    'password': 'ascent',
-    'port': 3306
-}
-
 # Constants
 CONFIG_PATH = "config\\config.json"
 LICENSE_FILE = "config/license.json"
 DEBUG_DIR = "debug_captures"
 
+# Login attempts are buffered and written by a background thread every LOGIN_ATTEMPT_INTERVAL seconds;
+# what is left is written on exit unless the license database is known to be down
+LOGIN_ATTEMPT_INTERVAL = 2.0
+LOGIN_ATTEMPTS = license_db.LoginAttemptQueue(interval=LOGIN_ATTEMPT_INTERVAL,
+                                              circuit=license_db.circuit_breaker(license_db.DB_CIRCUIT))
+# Latency and row counts of every license query; slow ones are logged with their EXPLAIN plan
+QUERY_STATS = license_db.QueryStats()
+
 # Fallback pre-generated keys from license_manager.py for offline mode
 VALID_LICENSE_KEYS = [
     'ZjZKqrBvcfj2K-7i5FtfYg',
@@ -182,53 +185,104 @@ class HardwareBanDialog(QDialog):
         layout.addLayout(button_layout)
 
 class DatabaseManager:
-    """Manages database connections and license validation using the schema from license_manager.py"""
+    """Manages database connections and license validation using the schema from license_manager.py
+    
+    When a licensing service URL is configured (AUTO_HEKILI_LICENSE_SERVICE), requests go
+    to license_service.py instead of opening a MySQL session from this client.
     
-    def __init__(self):
+    All instances share one circuit breaker per backend. While it is open every method
+    returns its offline result straight away instead of waiting for a connect timeout;
+    after a jittered backoff one call is let through to probe the backend again.
+    """
+    
+    def __init__(self, service_url=None):
         self.connection = None
-        self.offline_mode = False
+        service_url = service_url or license_service_url()
+        self.service = LicenseServiceClient(service_url) if service_url else None
+        self.circuit = license_db.circuit_breaker(license_db.SERVICE_CIRCUIT if self.service else license_db.DB_CIRCUIT)
+        if not self.service:
+            LOGIN_ATTEMPTS.start()
     
     def connect(self):
         """Try to connect to the MySQL database"""
+        if not self.circuit.allow():
+            logging.info(f"Circuit '{self.circuit.name}' is open, staying offline")
+            return False
+        return self.open_connection()
+    
+    def open_connection(self):
+        """Connect without asking the circuit breaker, for calls it has already let through"""
+        if self.service:
+            if self.service.health():
+                logging.info(f"Connected to licensing service at {self.service.url}")
+                self.circuit.record_success()
+                return True
+            logging.error(f"Licensing service at {self.service.url} is not reachable")
+            self.circuit.record_failure()
+            return False
+        
         try:
             self.connection = mysql.connector.connect(**DB_CONFIG)
             if self.connection.is_connected():
                 logging.info("Connected to MySQL database")
+                self.circuit.record_success()
                 return True
         except Error as e:
             logging.error(f"Error connecting to MySQL database: {e}")
-            self.offline_mode = True
-            return False
+        self.circuit.record_failure()
+        return False
+    
+    def ensure_connected(self):
+        if self.connection and self.connection.is_connected():
+            return True
+        return self.open_connection()
+    
+    def cursor(self):
+        """Buffered dictionary cursor whose statements are timed into QUERY_STATS"""
+        return license_db.TimedCursor(self.connection.cursor(dictionary=True, buffered=True), QUERY_STATS, self.connection)
     
     def disconnect(self):
         """Close the database connection"""
         if self.connection and self.connection.is_connected():
+            # Queued login attempts go out on this session before it closes
+            LOGIN_ATTEMPTS.flush(self.connection)
             self.connection.close()
             logging.info("MySQL connection closed")
+            logging.info(f"License queries: {QUERY_STATS.summary()}")
+    
+    def call_service(self, action, fallback):
+        """Run a licensing service request, returning `fallback` if it fails."""
+        try:
+            result = action()
+        except LicenseServiceError as e:
+            logging.error(f"Licensing service error: {e}")
+            self.circuit.record_failure()
+            return fallback
+        self.circuit.record_success()
+        return result
     
     def validate_license(self, license_key):
         """Check if license key is valid in the database"""
-        if self.offline_mode:
+        if not self.circuit.allow():
             # Fallback to offline validation with hardcoded keys
             return license_key in VALID_LICENSE_KEYS
         
-        if not self.connection or not self.connection.is_connected():
-            if not self.connect():
-                # If connection fails, fall back to offline mode
-                return license_key in VALID_LICENSE_KEYS
+        if self.service:
+            return self.call_service(lambda: self.service.validate_license(license_key),
+                                     license_key in VALID_LICENSE_KEYS)
+        
+        if not self.ensure_connected():
+            # If connection fails, fall back to offline validation
+            return license_key in VALID_LICENSE_KEYS
         
         try:
-            cursor = self.connection.cursor(dictionary=True)
+            cursor = self.cursor()
             
             # Check if license exists in the licenses table and is active
-            query = """
-                SELECT * FROM licenses 
-                WHERE license_key = %s AND status = 'active'
-            """
-            cursor.execute(query, (license_key,))
-            license_record = cursor.fetchone()
+            license_record = license_db.find_active_license(cursor, license_key)
             
             cursor.close()
+            self.circuit.record_success()
             
             if not license_record:
                 logging.info(f"License key {license_key} not found or not active")
@@ -239,105 +293,82 @@ class DatabaseManager:
             
         except Error as e:
             logging.error(f"Error validating license: {e}")
-            # Fall back to offline mode
-            self.offline_mode = True
+            # Fall back to offline validation
+            self.circuit.record_failure()
             return license_key in VALID_LICENSE_KEYS
     
     def check_hardware_ban(self, hardware_id):
         """Check if hardware ID is banned and return (is_banned, ban_reason)."""
-        if self.offline_mode:
+        if not self.circuit.allow():
             return False, None
+        
+        if self.service:
+            return self.call_service(lambda: self.service.check_hardware_ban(hardware_id), (False, None))
             
-        if not self.connection or not self.connection.is_connected():
-            if not self.connect():
-                return False, None
+        if not self.ensure_connected():
+            return False, None
         
         try:
-            cursor = self.connection.cursor(dictionary=True)
+            cursor = self.cursor()
             
             # Check hardware ban status
-            query = """
-                SELECT status, ban_reason FROM hardware_ids 
-                WHERE hardware_id = %s
-            """
-            cursor.execute(query, (hardware_id,))
-            result = cursor.fetchone()
+            is_banned, ban_reason = license_db.hardware_ban(cursor, hardware_id)
             
             cursor.close()
+            self.circuit.record_success()
             
-            if result and result['status'] == 'banned':
-                logging.warning(f"Hardware ID {hardware_id} is banned. Reason: {result['ban_reason']}")
-                return True, result['ban_reason'] or "No reason provided"
+            if is_banned:
+                logging.warning(f"Hardware ID {hardware_id} is banned. Reason: {ban_reason}")
                 
-            return False, None
+            return is_banned, ban_reason
                 
         except Error as e:
             logging.error(f"Error checking hardware ban: {e}")
+            self.circuit.record_failure()
             return False, None  # Continue in case of error
     
     def register_hardware_id(self, hardware_id):
         """Register the hardware ID in the hardware_ids table if not exists"""
-        if self.offline_mode:
+        if self.service or not self.circuit.allow():
+            # The licensing service registers hardware IDs as part of activation
             return True
             
-        if not self.connection or not self.connection.is_connected():
-            if not self.connect():
-                return True
+        if not self.ensure_connected():
+            return True
         
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            
-            # Check if hardware ID exists
-            query = "SELECT * FROM hardware_ids WHERE hardware_id = %s"
-            cursor.execute(query, (hardware_id,))
-            result = cursor.fetchone()
+            cursor = self.cursor()
+            registered = license_db.register_hardware_id(cursor, hardware_id)
+            self.connection.commit()
+            cursor.close()
+            self.circuit.record_success()
             
-            if not result:
-                # Insert new hardware ID
-                insert_query = """
-                    INSERT INTO hardware_ids (hardware_id) 
-                    VALUES (%s)
-                """
-                cursor.execute(insert_query, (hardware_id,))
-                self.connection.commit()
-                logging.info(f"Registered new hardware ID: {hardware_id}")
-            elif result['status'] == 'banned':
+            if not registered:
                 # Hardware is banned
                 logging.warning(f"Hardware ID {hardware_id} is banned")
-                cursor.close()
-                return False
-                
-            cursor.close()
-            return True
+            return registered
                 
         except Error as e:
             logging.error(f"Error registering hardware ID: {e}")
+            self.circuit.record_failure()
             return True  # Continue in case of error
     
     def check_activation_limit(self, license_key):
         """Check if license has reached activation limit"""
-        if self.offline_mode:
+        if self.service or not self.circuit.allow():
+            # The licensing service checks the limit as part of activation
             return True
             
-        if not self.connection or not self.connection.is_connected():
-            if not self.connect():
-                return True
+        if not self.ensure_connected():
+            return True
         
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            
-            # Count activations for this license
-            query = """
-                SELECT COUNT(*) as count FROM activations 
-                WHERE license_key = %s
-            """
-            cursor.execute(query, (license_key,))
-            result = cursor.fetchone()
-            
+            cursor = self.cursor()
+            count = license_db.activation_count(cursor, license_key)
             cursor.close()
+            self.circuit.record_success()
             
-            # Assuming limit of 2 activations per license
-            if result and result['count'] >= 2:
+            if count >= license_db.ACTIVATION_LIMIT:
                 logging.warning(f"License {license_key} has reached activation limit")
                 return False
                 
@@ -345,96 +376,87 @@ class DatabaseManager:
                 
         except Error as e:
             logging.error(f"Error checking activation limit: {e}")
+            self.circuit.record_failure()
             return True  # Continue in case of error
     
     def activate_license(self, license_key, hardware_id, client_info=None):
         """Activate license for this hardware ID"""
-        if self.offline_mode:
+        if not self.circuit.allow():
             return True
+        
+        if self.service:
+            return self.call_service(
+                lambda: self.service.activate_license(license_key, hardware_id, client_info, self.get_local_ip()),
+                True
+            )
             
-        if not self.connection or not self.connection.is_connected():
-            if not self.connect():
-                return True
+        if not self.ensure_connected():
+            return True
         
-        success = False
         ip_address = self.get_local_ip()
+        cursor = None
         
         try:
-            cursor = self.connection.cursor(dictionary=True)
-            
-            # First register hardware ID if needed
-            if not self.register_hardware_id(hardware_id):
-                # Hardware ID is banned
-                self.record_login_attempt(cursor, license_key, hardware_id, False, ip_address, client_info)
-                return False
-            
-            # Check activation limit
-            if not self.check_activation_limit(license_key):
-                # Too many activations
-                self.record_login_attempt(cursor, license_key, hardware_id, False, ip_address, client_info)
-                return False
-            
-            # Check if already activated for this hardware
-            query = """
-                SELECT * FROM activations 
-                WHERE license_key = %s AND hardware_id = %s
-            """
-            cursor.execute(query, (license_key, hardware_id))
-            existing = cursor.fetchone()
+            cursor = self.cursor()
             
-            if existing:
-                # Update last verification
-                update_query = """
-                    UPDATE activations 
-                    SET last_verification = %s 
-                    WHERE license_key = %s AND hardware_id = %s
-                """
-                cursor.execute(update_query, (datetime.datetime.now(), license_key, hardware_id))
-            else:
-                # New activation
-                insert_query = """
-                    INSERT INTO activations 
-                    (license_key, hardware_id) 
-                    VALUES (%s, %s)
-                """
-                cursor.execute(insert_query, (license_key, hardware_id))
+            # Register the hardware ID, check the activation limit and activate
+            outcome = license_db.activate(cursor, license_key, hardware_id)
+            if outcome == license_db.HARDWARE_BANNED:
+                logging.warning(f"Hardware ID {hardware_id} is banned")
+            elif outcome == license_db.LIMIT_REACHED:
+                logging.warning(f"License {license_key} has reached activation limit")
             
             self.connection.commit()
-            success = True
-            logging.info(f"License {license_key} activated for hardware {hardware_id}")
+            self.circuit.record_success()
+            success = outcome == license_db.ACTIVATED
+            if success:
+                logging.info(f"License {license_key} activated for hardware {hardware_id}")
             
-            # Record successful login attempt
-            self.record_login_attempt(cursor, license_key, hardware_id, True, ip_address, client_info)
+            # Record the login attempt
+            self.record_login_attempt(license_key, hardware_id, success, ip_address, client_info)
             
             cursor.close()
-            return True
+            return success
                 
         except Error as e:
             logging.error(f"Error activating license: {e}")
+            self.circuit.record_failure()
             
-            # Try to record failed login
-            try:
-                if cursor:
-                    self.record_login_attempt(cursor, license_key, hardware_id, False, ip_address, client_info)
-            except:
-                pass
+            # Record the failed login
+            self.record_login_attempt(license_key, hardware_id, False, ip_address, client_info)
                 
             return False
     
-    def record_login_attempt(self, cursor, license_key, hardware_id, success, ip_address, client_info):
-        """Record login attempt in login_attempts table"""
-        try:
-            query = """
-                INSERT INTO login_attempts 
-                (license_key, hardware_id, success, ip_address, client_info) 
-                VALUES (%s, %s, %s, %s, %s)
-            """
-            client_info_str = str(client_info) if client_info else None
-            cursor.execute(query, (license_key, hardware_id, success, ip_address, client_info_str))
-            self.connection.commit()
+    def record_login_attempt(self, license_key, hardware_id, success, ip_address, client_info):
+        """Queue a login attempt for the login_attempts table; the background flush writes it"""
+        if LOGIN_ATTEMPTS.put(license_key, hardware_id, success, ip_address, client_info):
             logging.info(f"Recorded {'successful' if success else 'failed'} login attempt")
+        else:
+            logging.warning(f"Login attempt queue is full, dropped attempt ({LOGIN_ATTEMPTS.dropped} dropped)")
+    
+    def get_expiration_date(self, license_key):
+        """Expiration date of a license as an ISO string, or None."""
+        if not self.circuit.allow():
+            return None
+        
+        if self.service:
+            record = self.call_service(lambda: self.service.license_info(license_key), None)
+            return record.get("expiration_date") if record else None
+        
+        if not self.ensure_connected():
+            return None
+        
+        try:
+            cursor = self.cursor()
+            record = license_db.find_license(cursor, license_key)
+            cursor.close()
+            self.circuit.record_success()
+            if record and record['expiration_date']:
+                return record['expiration_date'].isoformat()
         except Error as e:
-            logging.error(f"Error recording login attempt: {e}")
+            logging.error(f"Error retrieving expiration date: {e}")
+            self.circuit.record_failure()
+        return None
     
     def get_local_ip(self):
         """Get local IP address for logging"""
@@ -714,21 +736,8 @@ class LicenseWindow(QDialog):
     
     def save_license(self, license_key, hardware_id):
         """Save license data for offline use."""
-        # Retrieve expiration date from database
-        expiration_date = None
-        try:
-            if self.db_manager.connection and self.db_manager.connection.is_connected():
-                cursor = self.db_manager.connection.cursor(dictionary=True)
-                cursor.execute(
-                    "SELECT expiration_date FROM licenses WHERE license_key = %s",
-                    (license_key,)
-                )
-                result = cursor.fetchone()
-                if result and result['expiration_date']:
-                    expiration_date = result['expiration_date'].isoformat()
-                cursor.close()
-        except Exception as e:
-            logging.error(f"Error retrieving expiration date: {e}")
+        # Retrieve expiration date from the database or licensing service
+        expiration_date = self.db_manager.get_expiration_date(license_key)
         
         # Create license data
         license_data = {
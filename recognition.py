@@ -0,0 +1,381 @@
+"""Spell icon recognition for AUTO_Hekili.
+
+Every frame is converted once into a canonical grayscale, downsampled array and
+a row of packed 64-bit hashes (perceptual, difference, wavelet and colour).
+Reference icons are stored in the same form when they are loaded, so matching is
+a weighted Hamming distance over packed integers for every icon at once.
+
+Each spell gets its own matching strategy, chosen from how far its icon is from
+the nearest other icon of the spec:
+    hash      - the combined hash distance alone separates it
+    template  - hashes are ambiguous, candidates are confirmed by template matching
+"""
+import os
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Side length of the canonical grayscale square every icon and frame is reduced to
+CANONICAL_SIZE = 64
+# Template scales tried during template matching
+TEMPLATE_SCALES = (1.0, 0.95, 0.9, 0.85)
+# Size of the image the DCT is taken over for the perceptual hash
+PHASH_SIZE = 32
+HASH_BITS = 64
+
+# Columns of the packed hash matrix and their default weight in the combined distance
+HASH_KINDS = ("phash", "dhash", "whash", "colorhash")
+HASH_WEIGHTS = (1.0, 1.0, 1.0, 1.0)
+
+STRATEGY_HASH = "hash"
+STRATEGY_TEMPLATE = "template"
+# Nearest-neighbour margin, as a multiple of the threshold, a hash needs to be trusted on its own
+SEPARATION_FACTOR = 1.5
+# Template matching only runs for candidates within this multiple of the hash threshold
+TEMPLATE_GATE_FACTOR = 2
+
+# Number of set bits in every byte value, for Hamming distances on packed hashes
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+# 2-bit Gray code of the four hue quadrants, so neighbouring hues differ by one bit (and red wraps)
+_HUE_GRAY_CODE = np.array([[0, 0], [0, 1], [1, 1], [1, 0]], dtype=bool)
+
+
+def _to_rgb_array(image):
+    if isinstance(image, Image.Image):
+        image = np.asarray(image.convert("RGB"))
+    return image
+
+
+def to_canonical(image):
+    """Convert an RGB array or PIL image into the canonical float32 grayscale square."""
+    image = _to_rgb_array(image)
+    if image.ndim == 3:
+        image = cv2.cvtColor(np.ascontiguousarray(image[:, :, :3]), cv2.COLOR_RGB2GRAY)
+    canonical = cv2.resize(image, (CANONICAL_SIZE, CANONICAL_SIZE), interpolation=cv2.INTER_AREA)
+    return canonical.astype(np.float32)
+
+
+def _pack(bits):
+    return np.packbits(bits.ravel()).view(">u8")[0].astype(np.uint64)
+
+
+def phash(canonical):
+    """64-bit perceptual hash of a canonical array, packed into a uint64."""
+    small = cv2.resize(canonical, (PHASH_SIZE, PHASH_SIZE), interpolation=cv2.INTER_AREA)
+    low_freq = cv2.dct(small)[:8, :8]
+    return _pack(low_freq > np.median(low_freq))
+
+
+def dhash(canonical):
+    """64-bit difference hash (horizontal gradient signs) of a canonical array."""
+    small = cv2.resize(canonical, (9, 8), interpolation=cv2.INTER_AREA)
+    return _pack(small[:, 1:] > small[:, :-1])
+
+
+def whash(canonical):
+    """64-bit wavelet hash of a canonical array.
+    
+    Area downsampling of a power-of-two square to 8x8 is the Haar approximation
+    band, so this is the Haar wavelet hash without going through pywt.
+    """
+    small = cv2.resize(canonical, (8, 8), interpolation=cv2.INTER_AREA)
+    return _pack(small > np.median(small))
+
+
+def colorhash(image):
+    """64-bit colour layout hash of an RGB array.
+    
+    The image is reduced to 4x4 cells and every cell contributes its hue quadrant
+    (2 bits, Gray coded) and whether its saturation and brightness are above the
+    image's median (1 bit each). Grayscale hashes miss icons that differ mainly in colour.
+    """
+    image = _to_rgb_array(image)
+    if image.ndim == 2:
+        image = cv2.cvtColor(image, cv2.COLOR_GRAY2RGB)
+    small = cv2.resize(np.ascontiguousarray(image[:, :, :3]), (4, 4), interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_RGB2HSV).reshape(16, 3).astype(np.int32)
+    hue_bits = _HUE_GRAY_CODE[np.minimum(hsv[:, 0] * 4 // 180, 3)]
+    saturation_bits = hsv[:, 1:2] > np.median(hsv[:, 1])
+    value_bits = hsv[:, 2:3] > np.median(hsv[:, 2])
+    return _pack(np.hstack([hue_bits, saturation_bits, value_bits]))
+
+
+def compute_hashes(canonical, image):
+    """Packed hash row (one uint64 per HASH_KINDS entry) of a frame or icon."""
+    return np.array([phash(canonical), dhash(canonical), whash(canonical), colorhash(image)], dtype=np.uint64)
+
+
+def hash_distance_tensor(values, hashes):
+    """Per-kind Hamming distances between hash rows (M, K) and reference rows (N, K), shape (M, N, K)."""
+    values = np.asarray(values, dtype=np.uint64)
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    xor = np.bitwise_xor(values[:, None, :], hashes[None, :, :])
+    return _POPCOUNT[xor.view(np.uint8)].reshape(xor.shape + (8,)).sum(axis=3)
+
+
+def combined_distances(values, hashes, weights=HASH_WEIGHTS):
+    """Weighted mean Hamming distance over all hash kinds, shape (M, N), on the 0..64 bit scale."""
+    weights = np.asarray(weights, dtype=np.float64)
+    return hash_distance_tensor(values, hashes) @ (weights / weights.sum())
+
+
+class FrameFeatures:
+    """Everything the matchers need from one frame, computed in a single pass."""
+    
+    def __init__(self, canonical, hashes):
+        self.canonical = canonical
+        self.hashes = hashes
+
+
+def preprocess(image):
+    """Reduce a captured frame (RGB array or PIL image) to its canonical features."""
+    image = _to_rgb_array(image)
+    canonical = to_canonical(image)
+    return FrameFeatures(canonical, compute_hashes(canonical, image))
+
+
+def load_icon(icon_path):
+    """Load a reference icon as canonical features."""
+    with Image.open(icon_path) as img:
+        return preprocess(img)
+
+
+class IconIndex:
+    """Reference icons of one class/spec, in the canonical domain.
+    
+    hashes is an (N, K) matrix of packed uint64 hashes, one column per HASH_KINDS entry.
+    The index is never modified after it is built, so a recognizer can swap in a
+    new one while another thread is matching against the old one.
+    """
+    
+    def __init__(self, names, canonicals, hashes):
+        self.names = list(names)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        self.canonicals = np.array(canonicals, dtype=np.float32).reshape(-1, CANONICAL_SIZE, CANONICAL_SIZE)
+        self.hashes = np.array(hashes, dtype=np.uint64).reshape(-1, len(HASH_KINDS))
+        self.templates = {
+            name: {scale: cv2.resize(canonical, (0, 0), fx=scale, fy=scale) for scale in TEMPLATE_SCALES}
+            for name, canonical in zip(self.names, self.canonicals)
+        }
+    
+    def __len__(self):
+        return len(self.names)
+
+
+def build_icon_index(icon_paths, on_error=None):
+    """Build an IconIndex from a dict of spell name -> icon path.
+    
+    Icons that cannot be loaded are skipped and reported through on_error(spell_name, error).
+    """
+    names = []
+    canonicals = []
+    hashes = []
+    for spell_name, icon_path in icon_paths.items():
+        if not os.path.exists(icon_path):
+            continue
+        try:
+            features = load_icon(icon_path)
+        except Exception as e:
+            if on_error:
+                on_error(spell_name, e)
+            continue
+        names.append(spell_name)
+        canonicals.append(features.canonical)
+        hashes.append(features.hashes)
+    return IconIndex(names, canonicals, hashes)
+
+
+def separation_margins(index, weights=HASH_WEIGHTS):
+    """Combined hash distance from every icon to its nearest other icon."""
+    distances = combined_distances(index.hashes, index.hashes, weights)
+    np.fill_diagonal(distances, np.inf)
+    return distances.min(axis=1, initial=np.inf)
+
+
+def choose_strategies(index, threshold_for, weights=HASH_WEIGHTS):
+    """Pick the cheapest strategy that reliably separates each spell from the rest of its spec.
+
+    If the nearest other icon is m bits away, a frame d bits from its own icon is at
+    least m - d from that neighbour. With m >= 1.5t, a frame within t/2 of its icon
+    (clean captures usually are) can never match the wrong spell.
+    """
+    strategies = {}
+    for name, margin in zip(index.names, separation_margins(index, weights)):
+        if margin >= SEPARATION_FACTOR * threshold_for(name):
+            strategies[name] = STRATEGY_HASH
+        else:
+            strategies[name] = STRATEGY_TEMPLATE
+    return strategies
+
+
+class Candidate:
+    """One ranked recognition result.
+    
+    distance is the combined hash distance to the reference icon, confidence maps it
+    onto 0..1 (1 is identical, 0 is as far as an unrelated icon) and matched tells
+    whether it is under the spell's threshold. Once a candidate has been confirmed
+    by SpellRecognizer.match, method is the strategy that confirmed it and score
+    the template score if template matching was used.
+    """
+    
+    def __init__(self, spell_name, distance, confidence, threshold):
+        self.spell_name = spell_name
+        self.distance = distance
+        self.confidence = confidence
+        self.threshold = threshold
+        self.matched = distance < threshold
+        self.method = STRATEGY_HASH
+        self.score = None
+    
+    def __repr__(self):
+        return f"Candidate({self.spell_name}, distance={self.distance:.1f}, confidence={self.confidence:.2f})"
+
+
+class SpellRecognizer:
+    """Matches canonical frames against an IconIndex.
+    
+    threshold is the default combined hash distance a spell must be under to match;
+    thresholds overrides it per spell, e.g. with values from a calibration run.
+    template_threshold and template_thresholds do the same for template scores.
+    weights sets how much each of HASH_KINDS counts in the combined distance.
+    """
+    
+    def __init__(self, index, threshold=15, thresholds=None, template_threshold=0.7, template_thresholds=None,
+                 weights=HASH_WEIGHTS):
+        self.threshold = threshold
+        self.thresholds = dict(thresholds or {})
+        self.template_threshold = template_threshold
+        self.template_thresholds = dict(template_thresholds or {})
+        self.weights = tuple(weights)
+        self.index = index
+    
+    @classmethod
+    def from_spell_info(cls, spell_info, on_error=None, threshold=15, thresholds=None, **kwargs):
+        """Build a recognizer from the GUI's spell_info dict."""
+        icon_paths = {name: info["icon_path"] for name, info in spell_info.items()}
+        return cls(build_icon_index(icon_paths, on_error), threshold, thresholds, **kwargs)
+    
+    @property
+    def index(self):
+        return self._state[0]
+    
+    @index.setter
+    def index(self, index):
+        # The index and its strategies are replaced together in one assignment
+        self._state = (index, choose_strategies(index, self.threshold_for, self.weights))
+    
+    @property
+    def strategies(self):
+        """Spell name -> matching strategy for the current index."""
+        return self._state[1]
+    
+    def threshold_for(self, spell_name):
+        """Combined hash distance a spell must be under to count as a match."""
+        return self.thresholds.get(spell_name, self.threshold)
+    
+    def template_threshold_for(self, spell_name):
+        """Template score a spell must reach to count as a match."""
+        return self.template_thresholds.get(spell_name, self.template_threshold)
+    
+    def _candidate(self, spell_name, distance):
+        return Candidate(
+            spell_name,
+            float(distance),
+            float(np.clip(1.0 - distance / (HASH_BITS / 2), 0.0, 1.0)),
+            self.threshold_for(spell_name)
+        )
+    
+    def rank_many(self, features_list, k=3):
+        """Top-k candidates for several frames at once, nearest first.
+        
+        The combined distances from every frame to every reference icon are
+        computed in one vectorised pass over the packed hash matrices.
+        """
+        index = self.index
+        if not len(index) or not features_list:
+            return [[] for _ in features_list]
+        
+        k = min(k, len(index))
+        distances = combined_distances([f.hashes for f in features_list], index.hashes, self.weights)
+        top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+        
+        results = []
+        for row, columns in enumerate(top):
+            columns = columns[np.argsort(distances[row, columns], kind="stable")]
+            results.append([self._candidate(index.names[col], distances[row, col]) for col in columns])
+        return results
+    
+    def rank(self, features, k=3):
+        """Top-k candidates for one frame, nearest first."""
+        return self.rank_many([features], k)[0]
+    
+    def match(self, features, candidates):
+        """The first candidate confirmed by its spell's strategy, or None.
+        
+        Template matching only runs for the candidates that need it.
+        """
+        index, strategies = self._state
+        return self._match(features, candidates, index, strategies)
+    
+    def _match(self, features, candidates, index, strategies):
+        for candidate in candidates:
+            spell_name = candidate.spell_name
+            if spell_name not in index.positions:
+                continue
+            if strategies[spell_name] == STRATEGY_HASH:
+                if candidate.matched:
+                    return candidate
+            elif candidate.distance < TEMPLATE_GATE_FACTOR * candidate.threshold:
+                score = self.template_score(features, spell_name, index=index)
+                if score >= self.template_threshold_for(spell_name):
+                    candidate.method, candidate.score = STRATEGY_TEMPLATE, score
+                    return candidate
+        return None
+    
+    def best_match(self, features, k=3):
+        """The nearest candidate confirmed by its spell's strategy, or None."""
+        return self.match(features, self.rank(features, k))
+    
+    def match_spell(self, features, spell_name):
+        """Check the frame against one spell only; returns its Candidate if confirmed, else None."""
+        # One read of the state, an IconWatcher swap must not mix two indexes in a frame
+        index, strategies = self._state
+        if spell_name not in index.positions:
+            return None
+        candidate = self._candidate(spell_name, self.hash_distance(features, spell_name, index))
+        return self._match(features, [candidate], index, strategies)
+    
+    def hash_distances(self, features):
+        """Combined hash distance from the frame to every reference icon, in index order."""
+        return combined_distances([features.hashes], self.index.hashes, self.weights)[0]
+    
+    def hash_distance(self, features, spell_name, index=None):
+        """Combined hash distance from the frame to one reference icon."""
+        if index is None:
+            index = self.index
+        position = index.positions[spell_name]
+        return float(combined_distances([features.hashes], index.hashes[position:position + 1], self.weights)[0, 0])
+    
+    def hash_kind_distances(self, features, spell_name, index=None):
+        """Hamming distance from the frame to one reference icon for each of HASH_KINDS."""
+        if index is None:
+            index = self.index
+        position = index.positions[spell_name]
+        distances = hash_distance_tensor([features.hashes], index.hashes[position:position + 1])[0, 0]
+        return {kind: int(d) for kind, d in zip(HASH_KINDS, distances)}
+    
+    def template_scores(self, features, spell_name, scales=TEMPLATE_SCALES, index=None):
+        """Normalised cross-correlation of the frame with a reference icon at each scale."""
+        if index is None:
+            index = self.index
+        templates = index.templates[spell_name]
+        scores = {}
+        for scale in scales:
+            result = cv2.matchTemplate(features.canonical, templates[scale], cv2.TM_CCOEFF_NORMED)
+            scores[scale] = float(result.max())
+        return scores
+    
+    def template_score(self, features, spell_name, scales=TEMPLATE_SCALES[:3], index=None):
+        """Best template matching score of a reference icon over the given scales."""
+        return max(self.template_scores(features, spell_name, scales, index).values())
@@ -0,0 +1,128 @@
+"""Low-overhead sampling profiler for one AUTO_Hekili thread.
+
+A background thread looks at the target thread's Python stack every few
+milliseconds through sys._current_frames(), without tracing every call, so the
+profiled thread runs at practically full speed. Frames carry their line
+numbers, so time spent in time.sleep() shows up on the line that sleeps.
+
+Results can be written as collapsed stacks (for flamegraph.pl / speedscope /
+inferno) or as a speedscope JSON profile (https://www.speedscope.app).
+"""
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return code.co_name, os.path.basename(code.co_filename), frame.f_lineno
+
+
+class SamplingProfiler:
+    """Samples the Python stack of one thread at a fixed interval."""
+    
+    def __init__(self, thread_ident, interval=0.005):
+        self.thread_ident = thread_ident
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = []
+        self.started = None
+        self.elapsed = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+    
+    def sample(self):
+        """Record the target thread's current stack, root first; returns False once the thread is gone."""
+        frame = sys._current_frames().get(self.thread_ident)
+        if frame is None:
+            return False
+        stack = []
+        while frame is not None:
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        stack = tuple(reversed(stack))
+        self.stacks[stack] += 1
+        self.samples.append((time.perf_counter(), stack))
+        return True
+    
+    def run(self, duration):
+        """Sample for `duration` seconds (or until stop() or the thread exits), blocking the caller."""
+        self.started = time.perf_counter()
+        deadline = self.started + duration if duration else None
+        while not self._stop_event.is_set():
+            if not self.sample():
+                break
+            if deadline and time.perf_counter() >= deadline:
+                break
+            self._stop_event.wait(self.interval)
+        self.elapsed = time.perf_counter() - self.started
+        return self
+    
+    def start(self, duration=None):
+        """Sample from a background thread."""
+        self._thread = threading.Thread(target=self.run, args=(duration,), daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+    
+    def sample_count(self):
+        return len(self.samples)
+    
+    def hotspots(self, top=10):
+        """The innermost lines that were on top of the stack most often, as (label, fraction)."""
+        total = sum(self.stacks.values())
+        if not total:
+            return []
+        leaves = Counter()
+        for stack, count in self.stacks.items():
+            name, file, line = stack[-1]
+            leaves[f"{name} ({file}:{line})"] += count
+        return [(label, count / total) for label, count in leaves.most_common(top)]
+    
+    def write_collapsed(self, path):
+        """Write 'root;caller;leaf count' lines, one per distinct stack."""
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(";".join(f"{name} ({file}:{line})" for name, file, line in stack) + f" {count}\n")
+    
+    def write_speedscope(self, path, name="AUTO_Hekili capture thread"):
+        """Write a speedscope sampled profile, weighting each sample by the time until the next one."""
+        frame_ids = {}
+        frames = []
+        samples = []
+        weights = []
+        for i, (timestamp, stack) in enumerate(self.samples):
+            indices = []
+            for label in stack:
+                if label not in frame_ids:
+                    frame_ids[label] = len(frames)
+                    frames.append({"name": label[0], "file": label[1], "line": label[2]})
+                indices.append(frame_ids[label])
+            samples.append(indices)
+            next_timestamp = self.samples[i + 1][0] if i + 1 < len(self.samples) else timestamp + self.interval
+            weights.append(next_timestamp - timestamp)
+        
+        profile = {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights
+            }],
+            "name": name,
+            "exporter": "AUTO_Hekili sampling_profiler"
+        }
+        with open(path, "w") as f:
+            json.dump(profile, f)
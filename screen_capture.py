@@ -0,0 +1,148 @@
+"""Screen capture backends for AUTO_Hekili.
+
+Every backend grabs a (left, top, right, bottom) box of the screen and returns it
+as an RGB NumPy array of shape (height, width, 3).
+
+Run directly to benchmark the available backends:
+    python screen_capture.py --bbox 100 100 150 150 --frames 500
+"""
+import argparse
+import logging
+import time
+from abc import ABC, abstractmethod
+
+import numpy as np
+
+
+class CaptureBackend(ABC):
+    """Base class for screen capture backends."""
+    name = "base"
+    
+    @abstractmethod
+    def grab(self, bbox):
+        """Grab the (left, top, right, bottom) box and return an RGB array."""
+    
+    def close(self):
+        """Release any handles held by the backend."""
+        pass
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class ImageGrabBackend(CaptureBackend):
+    """PIL ImageGrab - sets up and tears down the capture context on every call."""
+    name = "imagegrab"
+    
+    def __init__(self):
+        from PIL import ImageGrab
+        self._grab = ImageGrab.grab
+    
+    def grab(self, bbox):
+        return np.asarray(self._grab(bbox=bbox))
+
+
+class MSSBackend(CaptureBackend):
+    """Capture through a persistent mss handle.
+    
+    mss keeps its device context (GDI on Windows, XShm on Linux) open between
+    calls. The returned array is a buffer owned by the backend that is reused
+    on the next grab of the same size, so copy it if it has to outlive that.
+    """
+    name = "mss"
+    
+    def __init__(self):
+        import mss
+        self._sct = mss.mss()
+        self._buffer = None
+    
+    def grab(self, bbox):
+        left, top, right, bottom = bbox
+        shot = self._sct.grab({
+            "left": left,
+            "top": top,
+            "width": right - left,
+            "height": bottom - top
+        })
+        bgra = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+        
+        if self._buffer is None or self._buffer.shape[:2] != bgra.shape[:2]:
+            self._buffer = np.empty((shot.height, shot.width, 3), dtype=np.uint8)
+        # BGRA -> RGB straight into the reused buffer
+        np.copyto(self._buffer, bgra[:, :, 2::-1])
+        return self._buffer
+    
+    def close(self):
+        self._sct.close()
+
+
+CAPTURE_BACKENDS = {
+    MSSBackend.name: MSSBackend,
+    ImageGrabBackend.name: ImageGrabBackend
+}
+
+
+def create_capture_backend(name="auto"):
+    """Create a capture backend by name.
+    
+    'auto' picks the fastest backend that is installed and falls back to ImageGrab.
+    Backends keep per-thread handles, so create them in the thread that grabs.
+    """
+    if name != "auto":
+        if name not in CAPTURE_BACKENDS:
+            raise ValueError(f"Unknown capture backend: {name}")
+        return CAPTURE_BACKENDS[name]()
+    
+    try:
+        return MSSBackend()
+    except Exception as e:
+        logging.warning(f"mss capture unavailable ({e}), falling back to ImageGrab")
+        return ImageGrabBackend()
+
+
+def benchmark_backend(backend, bbox, frames=200):
+    """Time repeated grabs of bbox and return a summary dict in milliseconds."""
+    backend.grab(bbox)  # Warm up
+    timings = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        backend.grab(bbox)
+        timings.append((time.perf_counter() - start) * 1000)
+    
+    timings = np.array(timings)
+    return {
+        "backend": backend.name,
+        "frames": frames,
+        "mean_ms": float(timings.mean()),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "fps": float(1000 / timings.mean())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AUTO_Hekili screen capture backends")
+    parser.add_argument("--bbox", type=int, nargs=4, default=[100, 100, 150, 150],
+                        metavar=("LEFT", "TOP", "RIGHT", "BOTTOM"), help="Screen box to grab")
+    parser.add_argument("--frames", type=int, default=200, help="Number of grabs per backend")
+    parser.add_argument("--backend", action="append", choices=sorted(CAPTURE_BACKENDS),
+                        help="Backend to benchmark (default: all available)")
+    args = parser.parse_args()
+    
+    for name in args.backend or sorted(CAPTURE_BACKENDS):
+        try:
+            backend = create_capture_backend(name)
+        except Exception as e:
+            print(f"{name:>10}: unavailable ({e})")
+            continue
+        with backend:
+            result = benchmark_backend(backend, tuple(args.bbox), args.frames)
+        print(f"{name:>10}: mean {result['mean_ms']:.2f} ms, p50 {result['p50_ms']:.2f} ms, "
+              f"p95 {result['p95_ms']:.2f} ms ({result['fps']:.0f} fps)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Find the Hekili spellbox on a full-screen grab.
+
+The screen is searched once, downscaled, for every icon of the class/spec at a
+range of icon sizes. All icons share the canonical size, so at each icon size
+their score maps have the same shape and are reduced with a single max over the
+stack. The best coarse hit is then refined at full resolution around the
+proposed rectangle, so the returned box is pixel accurate.
+
+Usage:
+    python spellbox_locator.py --spec img/Warrior_Fury                      # grab the screen now
+    python spellbox_locator.py --spec img/Warrior_Fury --screenshot shot.png
+"""
+import argparse
+import os
+
+import cv2
+import numpy as np
+from PIL import Image, ImageGrab
+
+from recognition import CANONICAL_SIZE, build_icon_index
+
+# On-screen icon sizes (full-resolution pixels) that are searched for
+MIN_ICON_SIZE = 32
+MAX_ICON_SIZE = 128
+ICON_SIZE_STEP = 1.15
+# The screen is downscaled to about this width for the coarse search...
+WORK_WIDTH = 640
+# ...but never so far that the smallest template gets below this many pixels
+MIN_TEMPLATE_SIZE = 8
+# Fraction trimmed from every icon edge, Hekili zooms icons and draws its own border
+ICON_TRIM = 0.1
+# Normalised correlation a hit needs to be proposed
+MIN_SCORE = 0.6
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+
+class SpellboxMatch:
+    """Proposed spellbox rectangle and the icon that was found there."""
+    
+    def __init__(self, box, spell_name, score):
+        self.box = box
+        self.spell_name = spell_name
+        self.score = score
+    
+    def __repr__(self):
+        return f"SpellboxMatch(box={self.box}, spell_name={self.spell_name!r}, score={self.score:.2f})"
+
+
+def icon_sizes(min_size=MIN_ICON_SIZE, max_size=MAX_ICON_SIZE, step=ICON_SIZE_STEP):
+    """Geometric range of full-resolution icon sizes to search."""
+    sizes = []
+    size = float(min_size)
+    while size <= max_size:
+        sizes.append(int(round(size)))
+        size *= step
+    return sizes
+
+
+def _trimmed(canonical, size):
+    """The inner part of a canonical icon, scaled to an icon of `size` pixels."""
+    trim = int(round(CANONICAL_SIZE * ICON_TRIM))
+    inner = canonical[trim:CANONICAL_SIZE - trim, trim:CANONICAL_SIZE - trim]
+    inner_size = max(1, int(round(size * (1 - 2 * ICON_TRIM))))
+    return cv2.resize(inner, (inner_size, inner_size), interpolation=cv2.INTER_AREA)
+
+
+def _to_gray(screen):
+    if isinstance(screen, Image.Image):
+        screen = np.asarray(screen.convert("RGB"))
+    if screen.ndim == 3:
+        screen = cv2.cvtColor(np.ascontiguousarray(screen[:, :, :3]), cv2.COLOR_RGB2GRAY)
+    return screen.astype(np.float32)
+
+
+def _best_over_icons(gray, templates):
+    """Match same-sized templates against gray; returns (score, icon, x, y) of the best hit."""
+    maps = np.stack([cv2.matchTemplate(gray, template, cv2.TM_CCOEFF_NORMED) for template in templates])
+    # Flat templates give NaN/inf scores
+    np.nan_to_num(maps, copy=False, nan=-1.0, posinf=-1.0, neginf=-1.0)
+    icon, y, x = np.unravel_index(np.argmax(maps), maps.shape)
+    return float(maps[icon, y, x]), int(icon), int(x), int(y)
+
+
+def locate_spellbox(screen, index, sizes=None, min_score=MIN_SCORE):
+    """Find the best matching icon of an IconIndex on a full-screen RGB grab.
+    
+    Returns a SpellboxMatch with the (left, top, width, height) icon rectangle in
+    screen pixels, or None if no icon scores at least min_score.
+    """
+    if not len(index):
+        return None
+    gray = _to_gray(screen)
+    height, width = gray.shape
+    sizes = sizes or icon_sizes()
+    
+    # Coarse pass on the downscaled screen
+    factor = min(1.0, max(WORK_WIDTH / width, MIN_TEMPLATE_SIZE / (min(sizes) * (1 - 2 * ICON_TRIM))))
+    small = cv2.resize(gray, (0, 0), fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+    best = None
+    for size in sizes:
+        templates = [_trimmed(canonical, size * factor) for canonical in index.canonicals]
+        if templates[0].shape[0] > min(small.shape):
+            break
+        score, icon, x, y = _best_over_icons(small, templates)
+        if best is None or score > best[0]:
+            best = (score, icon, size, x / factor, y / factor)
+    if best is None:
+        return None
+    
+    # Refine the winning icon at full resolution around the coarse hit
+    _, icon, size, x, y = best
+    margin = max(4, size // 4)
+    left = max(0, int(x) - margin)
+    top = max(0, int(y) - margin)
+    inner = int(round(size * (1 - 2 * ICON_TRIM)))
+    region = gray[top:top + inner + 2 * margin, left:left + inner + 2 * margin]
+    refined = None
+    for fine_size in range(max(MIN_TEMPLATE_SIZE, int(size / ICON_SIZE_STEP)), int(size * ICON_SIZE_STEP) + 1):
+        template = _trimmed(index.canonicals[icon], fine_size)
+        if template.shape[0] > min(region.shape):
+            break
+        score, _, rx, ry = _best_over_icons(region, [template])
+        if refined is None or score > refined[0]:
+            refined = (score, fine_size, left + rx, top + ry)
+    if refined is None:
+        return None
+    
+    score, fine_size, inner_x, inner_y = refined
+    if score < min_score:
+        return None
+    trim = int(round(fine_size * ICON_TRIM))
+    box = (max(0, inner_x - trim), max(0, inner_y - trim), fine_size, fine_size)
+    return SpellboxMatch(box, index.names[icon], score)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Locate the Hekili spellbox on the screen")
+    parser.add_argument("--spec", required=True, help="Class/spec icon folder, e.g. img/Warrior_Fury")
+    parser.add_argument("--screenshot", help="Search a saved screenshot instead of grabbing the screen")
+    parser.add_argument("--min-score", type=float, default=MIN_SCORE,
+                        help=f"Minimum normalised correlation (default: {MIN_SCORE})")
+    args = parser.parse_args()
+    
+    icon_paths = {
+        os.path.splitext(file)[0]: os.path.join(args.spec, file)
+        for file in sorted(os.listdir(args.spec)) if file.lower().endswith(IMAGE_EXTENSIONS)
+    }
+    index = build_icon_index(icon_paths, lambda spell_name, e: print(f"Error loading {spell_name}: {e}"))
+    
+    if args.screenshot:
+        screen = Image.open(args.screenshot)
+    else:
+        screen = ImageGrab.grab()
+    
+    match = locate_spellbox(screen, index, min_score=args.min_score)
+    if match is None:
+        print("Spellbox not found")
+        return
+    left, top, width, height = match.box
+    print(f"Spellbox at {left}, {top}, {width}x{height} showing {match.spell_name} (score {match.score:.2f})")
+
+
+if __name__ == "__main__":
+    main()